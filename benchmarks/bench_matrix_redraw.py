@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark: matrix repaint cost per frame, full-grid repaint vs MatrixHighlighter.
+
+With Kivy installed, a third path times MatrixWidget.update(), which sets the
+rgba of canvas Color instructions instead of button properties.
+
+The full repaint is what visualize_active_position did before the diff: reset
+all 16 cells, then paint the row, the column and the intersection.  Each
+background_color assignment is a Kivy property dispatch plus a canvas update,
+so the script reports assignments per frame as well as time per frame.  With
+Kivy installed the cells are real ToggleButtons; without it they are plain
+objects, which only shows the Python side of the cost.
+
+    python benchmarks/bench_matrix_redraw.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matrix_highlight import MatrixHighlighter, HIGHLIGHT_COLORS
+from sequencer_engine import SequencerEngine
+
+FRAMES = 2000
+
+
+class Cell:
+    """Widget stand-in that counts background_color assignments"""
+
+    assignments = 0
+
+    def __init__(self):
+        self._color = None
+
+    @property
+    def background_color(self):
+        return self._color
+
+    @background_color.setter
+    def background_color(self, value):
+        Cell.assignments += 1
+        self._color = value
+
+
+def make_cells():
+    try:
+        os.environ.setdefault('KIVY_NO_ARGS', '1')
+        from kivy.uix.togglebutton import ToggleButton
+    except ImportError:
+        return [Cell() for _ in range(16)], 'stand-in cells (Kivy not installed)'
+
+    class CountingButton(ToggleButton):
+        def on_background_color(self, instance, value):
+            Cell.assignments += 1
+
+    return [CountingButton(background_normal='') for _ in range(16)], 'Kivy ToggleButtons'
+
+
+def full_repaint(cells, step_states, current_x, current_y):
+    for i, cell in enumerate(cells):
+        cell.background_color = HIGHLIGHT_COLORS[1] if step_states[i] else HIGHLIGHT_COLORS[0]
+    active_idx = current_y * 4 + current_x
+    cells[active_idx].background_color = HIGHLIGHT_COLORS[4]
+    for x in range(4):
+        idx = current_y * 4 + x
+        if idx != active_idx:
+            cells[idx].background_color = HIGHLIGHT_COLORS[3] if step_states[idx] else HIGHLIGHT_COLORS[2]
+    for y in range(4):
+        idx = y * 4 + current_x
+        if idx != active_idx:
+            color = HIGHLIGHT_COLORS[3] if step_states[idx] else HIGHLIGHT_COLORS[2]
+            if cells[idx].background_color != color:
+                cells[idx].background_color = color
+    cells[active_idx].background_color = HIGHLIGHT_COLORS[4]
+
+
+def diffed_repaint(highlighter, cells, step_states, current_x, current_y):
+    codes = highlighter.codes
+    for idx in highlighter.update(step_states, current_x, current_y):
+        cells[idx].background_color = HIGHLIGHT_COLORS[codes[idx]]
+
+
+def make_widget():
+    try:
+        from matrix_widget import MatrixWidget
+    except ImportError:
+        return None
+    return MatrixWidget(size=(400, 400))
+
+
+def positions(x_mode, y_mode, count=FRAMES):
+    engine = SequencerEngine()
+    engine.set_x_mode(x_mode)
+    engine.set_y_mode(y_mode)
+    result = []
+    for _ in range(count):
+        engine.tick()
+        result.append((engine.current_x, engine.current_y))
+    return result
+
+
+def measure(repaint, frames):
+    Cell.assignments = 0
+    start = time.perf_counter_ns()
+    for x, y in frames:
+        repaint(x, y)
+    elapsed = time.perf_counter_ns() - start
+    return {'assignments': Cell.assignments / len(frames), 'us': elapsed / len(frames) / 1000}
+
+
+def run():
+    """Return ({mode pair: {'full': ..., 'diffed': ...}}, cell kind)"""
+    random.seed(1)
+    step_states = [random.random() < 0.5 for _ in range(16)]
+    cells, kind = make_cells()
+    widget = make_widget()
+    results = {}
+    for x_mode, y_mode in [('Forward', 'Forward'), ('Forward', 'Euclidean'), ('Random', 'Random')]:
+        frames = positions(x_mode, y_mode)
+        highlighter = MatrixHighlighter()
+        results[f'{x_mode}/{y_mode}'] = {
+            'full': measure(lambda x, y: full_repaint(cells, step_states, x, y), frames),
+            'diffed': measure(lambda x, y: diffed_repaint(highlighter, cells, step_states, x, y), frames),
+        }
+        if widget is not None:
+            widget.highlighter.forget()
+            results[f'{x_mode}/{y_mode}']['widget'] = measure(
+                lambda x, y: widget.update(step_states, x, y), frames)
+    return results, kind
+
+
+def main():
+    results, kind = run()
+    print(f"Matrix redraw: {FRAMES} frames per case, {kind}")
+    print(f"{'drivers':<20}{'path':<8}{'sets/frame':>12}{'us/frame':>10}")
+    for name, paths in results.items():
+        for path, result in paths.items():
+            print(f"{name:<20}{path:<8}{result['assignments']:>12.2f}{result['us']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
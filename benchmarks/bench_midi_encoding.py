@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: allocations and time per MIDI message, legacy path vs MidiEncoder.
+
+The legacy path is what MidiDriver.send_* did before the encoder: build a list,
+wrap it in a new bytearray and hand that to the port.  The port here is a stub
+that records how many memory blocks are alive beyond the baseline at the
+moment of the send, which is what each message leaves for the allocator.
+
+    python benchmarks/bench_midi_encoding.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from midi_buffer import MidiEncoder, NOTE_ON_STATUS, CONTROL_CHANGE_STATUS, PITCH_BEND_STATUS
+
+MESSAGES = 20000
+
+
+class CountingPort:
+    """Port stub that counts memory blocks allocated since the last mark"""
+
+    def __init__(self):
+        self.baseline = 0
+        self.blocks = 0
+        self.sends = 0
+
+    def mark(self):
+        self.baseline = sys.getallocatedblocks()
+
+    def send(self, data, offset, length):
+        self.blocks += sys.getallocatedblocks() - self.baseline
+        self.sends += 1
+
+
+class NullPort:
+    def send(self, data, offset, length):
+        pass
+
+
+def legacy_note_on(port, note, velocity, channel=0):
+    status_byte = 0x90 | (channel & 0x0F)
+    data = [status_byte, note, velocity]
+    port.send(bytearray(data), 0, len(data))
+
+
+def legacy_cc(port, controller, value, channel=0):
+    status_byte = 0xB0 | (channel & 0x0F)
+    data = [status_byte, controller, value]
+    port.send(bytearray(data), 0, len(data))
+
+
+def legacy_pitch_bend(port, value, channel=0):
+    status_byte = 0xE0 | (channel & 0x0F)
+    data = [status_byte, value & 0x7F, (value >> 7) & 0x7F]
+    port.send(bytearray(data), 0, len(data))
+
+
+def encoder_send(encoder, port, status, data1, data2):
+    encoder.write(status, data1, data2)
+    encoder.send_to(port)
+
+
+def legacy_cases(port):
+    return {
+        'note_on': lambda i: legacy_note_on(port, i & 0x7F, 100),
+        'control_change': lambda i: legacy_cc(port, 23, i & 0x7F),
+        'pitch_bend': lambda i: legacy_pitch_bend(port, i & 0x3FFF),
+    }
+
+
+def encoder_cases(encoder, port):
+    note_on = NOTE_ON_STATUS[0]
+    cc = CONTROL_CHANGE_STATUS[0]
+    bend = PITCH_BEND_STATUS[0]
+    return {
+        'note_on': lambda i: encoder_send(encoder, port, note_on, i & 0x7F, 100),
+        'control_change': lambda i: encoder_send(encoder, port, cc, 23, i & 0x7F),
+        'pitch_bend': lambda i: encoder_send(encoder, port, bend, i & 0x7F, (i >> 7) & 0x7F),
+    }
+
+
+def blocks_per_message(case, port, count=MESSAGES):
+    port.blocks = 0
+    port.sends = 0
+    for i in range(count):
+        port.mark()
+        case(i)
+    return port.blocks / port.sends
+
+
+def ns_per_message(case, count=MESSAGES):
+    start = time.perf_counter_ns()
+    for i in range(count):
+        case(i)
+    return (time.perf_counter_ns() - start) / count
+
+
+def run():
+    """Return {message type: {path: {'blocks': ..., 'ns': ...}}}"""
+    results = {}
+    counting = CountingPort()
+    null = NullPort()
+    paths = {
+        'legacy': (legacy_cases(counting), legacy_cases(null)),
+        'encoder': (encoder_cases(MidiEncoder(), counting), encoder_cases(MidiEncoder(), null)),
+    }
+    for path, (counted, timed) in paths.items():
+        for name in counted:
+            results.setdefault(name, {})[path] = {
+                'blocks': blocks_per_message(counted[name], counting),
+                'ns': ns_per_message(timed[name]),
+            }
+    return results
+
+
+def main():
+    print(f"MIDI encoding: {MESSAGES} messages per case")
+    print(f"{'message':<16}{'path':<10}{'blocks/msg':>12}{'ns/msg':>10}")
+    for name, paths in run().items():
+        for path, result in paths.items():
+            print(f"{name:<16}{path:<10}{result['blocks']:>12.2f}{result['ns']:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: Euclidean generation, engine tick throughput, MIDI encoding
+and matrix redraw cost, saved as JSON so runs can be compared across commits.
+
+    python benchmarks/run_benchmarks.py                       # print, save to benchmarks/results/<commit>.json
+    python benchmarks/run_benchmarks.py --compare old.json    # also flag regressions against an earlier run
+
+Results are a flat {metric: value} map.  Metrics ending in 'per_s' are
+better when higher, everything else (times) when lower.  Benchmarks that
+need Kivy (MidiDriver and the real redraw) run against Kivy's mock GL
+backend without opening a window, and are skipped where Kivy is missing.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from sequencer_engine import SequencerEngine, euclidean_rhythm, euclidean_mask, X_DRIVER_MODES, Y_DRIVER_MODES
+
+import bench_matrix_redraw
+import bench_midi_encoding
+
+TICKS = 20000
+REGRESSION_THRESHOLD = 0.10
+
+
+def timed(function, count):
+    """Mean nanoseconds per call"""
+    start = time.perf_counter_ns()
+    for _ in range(count):
+        function()
+    return (time.perf_counter_ns() - start) / count
+
+
+def bench_euclidean():
+    results = {}
+    for steps, pulses in [(4, 2), (8, 3), (16, 5), (16, 11)]:
+        ns = timed(lambda: euclidean_rhythm(steps, pulses), 20000)
+        results[f'euclidean.E({pulses},{steps}).us'] = ns / 1000
+        euclidean_mask(steps, pulses, 1)
+        ns = timed(lambda: euclidean_mask(steps, pulses, 1), 20000)
+        results[f'euclidean.E({pulses},{steps}).cached_mask.us'] = ns / 1000
+    return results
+
+
+def bench_ticks():
+    """Ticks per second for every X/Y driver combination, all steps enabled"""
+    results = {}
+    for x_mode in X_DRIVER_MODES:
+        for y_mode in Y_DRIVER_MODES:
+            engine = SequencerEngine(seed=1)
+            engine.set_x_mode(x_mode)
+            engine.set_y_mode(y_mode)
+            engine.set_x_cc('Cutoff (23)')
+            for step in range(engine.step_count):
+                engine.step_states[step] = True
+            engine.step_cc_values[5] = {9: 64}
+            engine.tick()  # Builds the path table where there is one
+            ns = timed(engine.tick, TICKS)
+            results[f'tick.{x_mode}/{y_mode}.ticks_per_s'] = 1e9 / ns
+    return results
+
+
+def bench_encoding():
+    results = {}
+    for name, paths in bench_midi_encoding.run().items():
+        for path, result in paths.items():
+            results[f'encode.{name}.{path}.ns'] = result['ns']
+            results[f'encode.{name}.{path}.blocks'] = result['blocks']
+    return results
+
+
+def use_headless_kivy():
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+
+def bench_midi_driver():
+    """MidiDriver.send_* cost per message type, port writes included (port is a no-op)"""
+    use_headless_kivy()
+    try:
+        from midi_manager import MidiDriver
+    except ImportError as e:
+        return {}, f"MidiDriver skipped ({e})"
+
+    class NullPort:
+        def send(self, data, offset, length, timestamp=None):
+            pass
+
+    midi = MidiDriver(suppress_redundant_cc=False)
+    midi.is_mock_mode = False
+    midi.ports.add('null', NullPort())
+    counter = iter(range(1 << 30))
+    cases = {
+        'note_on': lambda: midi.send_note_on(next(counter) & 0x7F, 100),
+        'note_off': lambda: midi.send_note_off(next(counter) & 0x7F),
+        'control_change': lambda: midi.send_cc(23, next(counter) & 0x7F),
+        'program_change': lambda: midi.send_program_change(next(counter) & 0x7F),
+        'pitch_bend': lambda: midi.send_pitch_bend(next(counter) & 0x3FFF),
+    }
+    return {f'driver.{name}.ns': timed(case, 20000) for name, case in cases.items()}, None
+
+
+def bench_redraw():
+    """visualize_active_position() against a real (headless) MatrixWidget, plus the highlighter diff"""
+    use_headless_kivy()
+    results = {}
+    highlight, _ = bench_matrix_redraw.run()
+    for drivers, paths in highlight.items():
+        for path, result in paths.items():
+            results[f'redraw.{drivers}.{path}.us'] = result['us']
+
+    try:
+        from main import SequencerApp
+        from matrix_widget import MatrixWidget
+    except ImportError as e:
+        return results, f"visualize_active_position skipped ({e})"
+
+    for columns, rows in [(4, 4), (16, 16)]:
+        engine = SequencerEngine(columns, rows, seed=1)
+        engine.set_x_mode('Random')
+        for step in range(0, engine.step_count, 3):
+            engine.step_states[step] = True
+        host = types.SimpleNamespace(engine=engine, matrix=MatrixWidget(columns, rows, size=(400, 400)))
+
+        def frame():
+            engine.tick()
+            SequencerApp.visualize_active_position(host)
+
+        tick_ns = timed(engine.tick, 2000)
+        results[f'redraw.visualize.{columns}x{rows}.us'] = (timed(frame, 2000) - tick_ns) / 1000
+    return results, None
+
+
+def run():
+    results = {}
+    notes = []
+    results.update(bench_euclidean())
+    results.update(bench_ticks())
+    results.update(bench_encoding())
+    for bench in (bench_midi_driver, bench_redraw):
+        bench_results, note = bench()
+        results.update(bench_results)
+        if note:
+            notes.append(note)
+    return results, notes
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Return [(metric, old, new, change)] for metrics that got worse by more than threshold"""
+    regressions = []
+    for metric, new in sorted(results.items()):
+        old = baseline.get(metric)
+        if not old or not new:
+            continue
+        # Positive change means worse, whichever direction is better for the metric
+        change = (old - new) / old if metric.endswith('per_s') else (new - old) / old
+        if change > threshold:
+            regressions.append((metric, old, new, change))
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Isogrid benchmark suite')
+    parser.add_argument('--output', help="JSON file to write (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="earlier JSON run to compare against")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="relative slowdown reported as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    results, notes = run()
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'notes': notes,
+        'results': results,
+    }
+
+    for metric, value in sorted(results.items()):
+        print(f"{metric:<60}{value:>14.2f}")
+    for note in notes:
+        print(f"NOTE: {note}")
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', f"{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Saved {len(results)} metrics to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        print(f"Compared with {args.compare} ({baseline.get('commit')}): {len(regressions)} regression(s)")
+        for metric, old, new, change in regressions:
+            print(f"  REGRESSION {metric}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
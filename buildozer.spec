@@ -22,7 +22,7 @@ source.include_exts = py,png,jpg,kv,atlas
 #source.exclude_exts = spec
 
 # (list) List of directory to exclude (let empty to not exclude anything)
-#source.exclude_dirs = tests, bin
+source.exclude_dirs = benchmarks, bin
 
 # (list) List of exclusions using pattern matching
 # Do not prefix with './'
@@ -98,6 +98,9 @@ android.copy_libs = 1
 # (str) Android java source (if empty, no java code is compiled)
 #android.java_dir = 
 
+# (list) Java source folders compiled into the APK (MIDI clock receiver)
+android.add_src = java
+
 # (str) Android package name to use
 #android.package = org.example.isogridsequencer
 
@@ -0,0 +1,137 @@
+"""
+External MIDI clock sync.
+
+A master (DAW, drum machine) sends 24 clock messages (0xF8) per quarter note
+plus Start (0xFA), Continue (0xFB) and Stop (0xFC).  The receive timestamps
+jitter by a millisecond or more over USB, so they are not used directly:
+TempoTracker is a second-order phase-locked loop that keeps a filtered
+estimate of the pulse period and of where the pulse grid lies, nudging both
+by a fraction of each pulse's timing error.  Jitter averages out while real
+tempo changes are followed within a few beats.
+
+ExternalClockSync maps the filtered grid onto the look-ahead scheduler: clock
+pulse n is master pulse n * 4 (96 PPQN), and every pulse re-anchors the
+scheduler's next step on the predicted time of that pulse, shifted by the
+look-ahead.  Steps are therefore phase-locked to the master and cannot drift
+away from it, and the output trails the master by the look-ahead (set the
+master's clock offset to compensate).
+"""
+from event_log import log
+from event_scheduler import MASTER_PULSES_PER_CLOCK
+from midi_buffer import CLOCK, START, CONTINUE, STOP, CLOCK_PPQN
+
+# Loop gains: fraction of a pulse's timing error applied to the phase and to
+# the period.  Critically damped-ish for steady clocks with ~1 ms jitter.
+PHASE_GAIN = 0.1
+PERIOD_GAIN = 0.005
+
+# Pulses before the estimate is trusted, and the error (as a fraction of the
+# period) beyond which a pulse is treated as a discontinuity and the loop resyncs
+LOCK_PULSES = 24
+RESYNC_ERROR = 0.5
+
+
+class TempoTracker:
+    """Phase-locked estimate of a 24 PPQN clock's period and pulse grid"""
+
+    def __init__(self, phase_gain=PHASE_GAIN, period_gain=PERIOD_GAIN):
+        self.phase_gain = phase_gain
+        self.period_gain = period_gain
+        self.reset()
+
+    def reset(self):
+        self.pulses = 0  # Pulses received since reset
+        self.period_ns = 0.0  # Filtered pulse period (0 until two pulses arrived)
+        self.phase_ns = 0.0  # Filtered time of the last pulse
+        self.last_error_ns = 0.0
+
+    @property
+    def tempo(self):
+        """Estimated tempo in BPM (0 until two pulses arrived)"""
+        return 60_000_000_000 / (self.period_ns * CLOCK_PPQN) if self.period_ns else 0.0
+
+    @property
+    def locked(self):
+        return self.pulses >= LOCK_PULSES and abs(self.last_error_ns) < self.period_ns * RESYNC_ERROR
+
+    def pulse(self, timestamp_ns):
+        """Feed the receive time of one clock message"""
+        if self.pulses == 0:
+            self.phase_ns = timestamp_ns
+        elif self.pulses == 1 or not self.period_ns:
+            self.period_ns = float(max(1, timestamp_ns - self.phase_ns))
+            self.phase_ns = timestamp_ns
+        else:
+            predicted = self.phase_ns + self.period_ns
+            error = timestamp_ns - predicted
+            self.last_error_ns = error
+            if abs(error) > self.period_ns * RESYNC_ERROR:
+                # Dropped pulses or a stall: take the new time as is and keep the period
+                log.warning('SYNC', "Clock pulse off by %.1f ms, resyncing", error / 1e6)
+                self.phase_ns = timestamp_ns
+            else:
+                self.phase_ns = predicted + self.phase_gain * error
+                self.period_ns += self.period_gain * error
+        self.pulses += 1
+
+    def time_of(self, pulse):
+        """Filtered time of clock pulse number `pulse` (0 = the first since reset)"""
+        return self.phase_ns + (pulse - (self.pulses - 1)) * self.period_ns
+
+
+class ExternalClockSync:
+    """Slaves a LookaheadScheduler to incoming MIDI clock and transport messages"""
+
+    def __init__(self, scheduler, tracker=None, on_transport=None):
+        self.scheduler = scheduler
+        self.tracker = tracker or TempoTracker()
+        self.on_transport = on_transport  # Called with True/False when the master starts/stops
+        self._armed = False  # Start received, waiting for the first clock
+        self._downbeat = 0  # Tracker pulse count at the downbeat
+
+    def play(self):
+        """Local PLAY while slaved: resume on the master's next clock, counted as a new downbeat
+
+        Starting the scheduler directly would restart its pulse count while the
+        downbeat still points into the old run, so sync() would see the song far
+        ahead of the master.
+        """
+        self._armed = True
+
+    def pause(self):
+        """Local PAUSE while slaved: stop now and ignore the clock until play() or Start"""
+        self._armed = False
+        self.scheduler.stop()
+
+    def on_realtime(self, status, timestamp_ns):
+        """Handle one system real-time byte (called from the MIDI receive thread)"""
+        if status == CLOCK:
+            self._clock(timestamp_ns)
+        elif status == START or status == CONTINUE:
+            # The first clock after Start/Continue is the downbeat; the tracker
+            # keeps its lock, masters usually send clock while stopped too
+            self._armed = True
+        elif status == STOP:
+            self._armed = False
+            self.scheduler.stop()
+            if self.on_transport is not None:
+                self.on_transport(False)
+
+    def _clock(self, timestamp_ns):
+        tracker = self.tracker
+        tracker.pulse(timestamp_ns)
+        scheduler = self.scheduler
+        lookahead_ns = scheduler.lookahead_ns
+        if self._armed:
+            self._armed = False
+            self._downbeat = tracker.pulses - 1
+            scheduler.start(first_step_ns=int(tracker.phase_ns) + lookahead_ns)
+            if self.on_transport is not None:
+                self.on_transport(True)
+        elif tracker.period_ns and scheduler.running:
+            pulse = tracker.pulses - 1
+            scheduler.sync((pulse - self._downbeat) * MASTER_PULSES_PER_CLOCK,
+                           int(tracker.time_of(pulse)) + lookahead_ns, tracker.tempo)
+        # Render from here too, so a step never waits for the clock thread's
+        # next wake-up (which was planned before the correction)
+        scheduler.advance(timestamp_ns)
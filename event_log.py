@@ -0,0 +1,133 @@
+"""
+Quiet, ring-buffered event log.
+
+Logging calls on the sequencing path only compare a level and append a tuple
+to a bounded in-memory ring; formatting and stdout/file I/O happen on a
+background writer thread.  Records below the current level (or everything,
+when the log is OFF) are dropped before anything is formatted.
+
+The level defaults to INFO and can be set with the ISOGRID_LOG_LEVEL
+environment variable (DEBUG, INFO, WARNING, ERROR or OFF).  Per-message MIDI
+output in mock mode is logged at DEBUG.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+LEVELS = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR, 'OFF': OFF}
+
+DEFAULT_CAPACITY = 4096
+DEFAULT_FLUSH_INTERVAL = 0.1
+
+
+def level_from_env(default=INFO):
+    """Log level named by ISOGRID_LOG_LEVEL, or the default"""
+    return LEVELS.get(os.environ.get('ISOGRID_LOG_LEVEL', '').upper(), default)
+
+
+class EventLog:
+    """Level-gated log that buffers records and writes them off-thread"""
+
+    def __init__(self, level=INFO, capacity=DEFAULT_CAPACITY, stream=None,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, autostart=True):
+        self.level = level
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self.autostart = autostart
+        self.dropped = 0  # Records overwritten before the writer got to them
+        self._records = collections.deque(maxlen=capacity)
+        self._history = collections.deque(maxlen=64)  # Last formatted lines, for display
+        self._thread = None
+        self._running = False
+        self._write_lock = threading.Lock()
+
+    def enabled_for(self, level):
+        return level >= self.level
+
+    def log(self, level, tag, message, *args):
+        """Queue a record; message is %-formatted with args on the writer thread"""
+        if level < self.level:
+            return
+        records = self._records
+        if len(records) == records.maxlen:
+            self.dropped += 1
+        records.append((time.perf_counter_ns(), level, tag, message, args))
+        if self._thread is None and self.autostart:
+            self.start()
+
+    def debug(self, tag, message, *args):
+        if DEBUG >= self.level:
+            self.log(DEBUG, tag, message, *args)
+
+    def info(self, tag, message, *args):
+        self.log(INFO, tag, message, *args)
+
+    def warning(self, tag, message, *args):
+        self.log(WARNING, tag, message, *args)
+
+    def error(self, tag, message, *args):
+        self.log(ERROR, tag, message, *args)
+
+    def start(self):
+        """Start the background writer"""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='EventLogWriter', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer and write out whatever is still buffered"""
+        self._running = False
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
+        self.drain()
+
+    def drain(self):
+        """Format and write every buffered record; returns how many were written"""
+        records = self._records
+        written = 0
+        with self._write_lock:
+            stream = self.stream or sys.stdout
+            while records:
+                try:
+                    _, level, tag, message, args = records.popleft()
+                except IndexError:
+                    break
+                try:
+                    text = message % args if args else message
+                except (TypeError, ValueError):
+                    text = f"{message} {args}"
+                line = f"[{tag}] {text}"
+                self._history.append(line)
+                stream.write(line + '\n')
+                written += 1
+            if written:
+                stream.flush()
+        return written
+
+    def recent(self, count=10):
+        """The last formatted lines, newest last"""
+        return list(self._history)[-count:]
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.flush_interval)
+            try:
+                self.drain()
+            except Exception:
+                pass  # Never let a broken stream kill the writer
+
+
+# Shared log for the app, the engine and the MIDI driver
+log = EventLog(level=level_from_env())
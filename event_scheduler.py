@@ -0,0 +1,274 @@
+"""
+Look-ahead event scheduler.
+
+Instead of sending notes at the moment the clock callback happens to run, the
+scheduler renders the engine's steps a fixed look-ahead window ahead of time
+and hands every note-on, note-off and CC to the MIDI driver with the exact
+timestamp it should sound at.  Output latency is then constant (the look-ahead)
+and a late wake-up only eats into the window instead of delaying a note.
+
+Step times come from the engine: after every tick it reports how many
+master-clock pulses away the next one is, which depends on the X/Y axis
+speeds.  Times are computed from an origin and a pulse count, so uneven
+gaps never accumulate rounding drift, and advance() returns when the clock
+should wake up next, so nothing runs between steps.  sync() re-anchors the
+pulse grid on an external clock (see clock_sync.py).
+
+With send_clock the scheduler is also a clock master: MIDI clock messages
+(24 per quarter note) are rendered on the same pulse grid as the steps and
+sent with timestamps like the notes, Start ahead of the first one and Stop
+after the last one sent, also when clock output is switched mid-song.
+"""
+import heapq
+import threading
+import time
+
+from midi_buffer import CLOCK, START, STOP, CLOCK_PPQN
+from midi_ports import RoutingTable
+from sequencer_engine import NOTE_ON, NOTE_OFF, CONTROL_CHANGE, MASTER_PPQN, BAR_PULSES
+from tick_profiler import profiler, RENDER, MIDI_FLUSH
+
+DEFAULT_LOOKAHEAD_MS = 20
+DEFAULT_GATE_MS = 100
+
+MASTER_PULSES_PER_CLOCK = MASTER_PPQN // CLOCK_PPQN
+
+
+class LookaheadScheduler:
+    """Renders engine steps ahead of time into a timestamp-ordered event queue"""
+
+    def __init__(self, engine, midi, tempo=120, lookahead_ms=DEFAULT_LOOKAHEAD_MS,
+                 gate_ms=DEFAULT_GATE_MS, send_clock=False):
+        self.engine = engine
+        self.midi = midi
+        self.tempo = max(1, tempo)
+        self.lookahead_ns = int(lookahead_ms * 1_000_000)
+        self.gate_ns = int(gate_ms * 1_000_000)
+        self.running = False
+        self.send_clock = send_clock  # Emit MIDI clock (24 PPQN) and Start/Stop
+        self.next_step_ns = None  # Time of the next step to render
+        self.song_pulse = 0  # Master pulse of the next step, counted from start()
+        # Master pulse `_origin_pulse` falls at `_origin_ns`; later pulses follow at the current tempo
+        self._origin_ns = 0
+        self._origin_pulse = 0
+        self._rendered_ns = None  # Time of the last rendered step
+        self._clock_pulse = 0  # Master pulse of the next clock message
+        self._clock_ns = None  # Time of the last clock message
+        self._start_pulse = None  # Master pulse of the clock a pending Start goes out with
+        self._clock_started = False  # Start queued, Stop not yet
+        self._sent_realtime_ns = None  # Time of the last clock or transport message handed to the port
+        self.routing = RoutingTable()  # Destination port per X/Y CC and step
+        self._queue = []  # Heap of (timestamp_ns, sequence, type, data1, data2, destination)
+        self._sequence = 0
+        self.lock = threading.Lock()  # Held while rendering; hold it to reconfigure the engine
+
+    def set_tempo(self, tempo):
+        """Change the tempo from the next unrendered step on"""
+        with self.lock:
+            if self.next_step_ns is not None:
+                self._origin_ns = self.next_step_ns
+                self._origin_pulse = self.song_pulse
+            self.tempo = max(1, tempo)
+
+    def set_send_clock(self, enabled):
+        """Turn clock output on or off, queueing Start and Stop with the clocks
+
+        Turned on while playing, clocks continue the song's grid and Start goes
+        out with the clock on the next bar line; turned off, Stop follows the
+        last clock already rendered.
+        """
+        with self.lock:
+            if enabled == self.send_clock:
+                return
+            self.send_clock = enabled
+            if not self.running or self.next_step_ns is None:
+                return  # Nothing rendered yet: _begin() sends Start if needed
+            if enabled:
+                # Next clock on the 24 PPQN grid counted from start(), not before the next step
+                self._clock_pulse = -(-self.song_pulse // MASTER_PULSES_PER_CLOCK) * MASTER_PULSES_PER_CLOCK
+                self._start_pulse = -(-self.song_pulse // BAR_PULSES) * BAR_PULSES
+                self._clock_ns = max(self._clock_ns or 0, self._rendered_ns)
+            else:
+                self._start_pulse = None
+                if self._clock_started:
+                    self._clock_started = False
+                    self._sequence += 1
+                    heapq.heappush(self._queue, (self._clock_ns + 1, self._sequence, STOP, 0, 0, None))
+
+    def start(self, first_step_ns=None):
+        """Start rendering; by default the first step sounds one look-ahead after the next advance"""
+        with self.lock:
+            self.song_pulse = self._origin_pulse = 0
+            self._rendered_ns = None
+            self._clock_pulse = 0
+            self._clock_ns = None
+            self._start_pulse = None
+            self._clock_started = False
+            self._sent_realtime_ns = None
+            self.next_step_ns = None
+            self.running = True
+            self.engine.align_bar()  # Queued patterns switch on bar lines counted from here
+            if first_step_ns is not None:
+                self._begin(first_step_ns)
+
+    def sync(self, pulse, pulse_ns, tempo):
+        """Phase-lock to an external clock: master pulse `pulse` (from start()) falls at pulse_ns
+
+        The next unrendered step is moved onto that grid at the given tempo.
+        Steps already rendered keep their times, so a correction never sends
+        a step earlier than the one before it.
+        """
+        with self.lock:
+            if not self.running or self.next_step_ns is None or tempo <= 0:
+                return
+            self.tempo = tempo
+            self._origin_ns = pulse_ns
+            self._origin_pulse = pulse
+            next_step_ns = self._time_of(self.song_pulse)
+            if self._rendered_ns is not None and next_step_ns <= self._rendered_ns:
+                next_step_ns = self._origin_ns = self._rendered_ns + 1
+                self._origin_pulse = self.song_pulse
+            self.next_step_ns = next_step_ns
+
+    def advance(self, now_ns):
+        """Render every step due within the look-ahead window and dispatch what is due
+
+        Called from the clock thread.  Queued events are dispatched if they
+        fall before the next step (or clock message), so note-offs keep their
+        exact timestamps as well.  Returns the time the next step or clock
+        message enters the look-ahead window, i.e. when the clock should call
+        again (None when stopped).
+        """
+        with self.lock:
+            if not self.running:
+                return None
+            horizon = now_ns + self.lookahead_ns
+            if self.next_step_ns is None:
+                self._begin(horizon)
+
+            profiling = profiler.enabled
+            engine = self.engine
+            while self.next_step_ns <= horizon:
+                if profiling:
+                    start = time.perf_counter_ns()
+                self._render_step(self.next_step_ns)
+                if profiling:
+                    profiler.record(RENDER, time.perf_counter_ns() - start)
+                self._rendered_ns = self.next_step_ns
+                self.song_pulse += engine.pulses_to_next_tick
+                self.next_step_ns = self._time_of(self.song_pulse)
+
+            wake_ns = self.next_step_ns
+            if self.send_clock:
+                clock_ns = self._render_clock(horizon)
+                if clock_ns < wake_ns:
+                    wake_ns = clock_ns
+
+            if profiling:
+                start = time.perf_counter_ns()
+            self._dispatch_until(wake_ns - 1)
+            if profiling:
+                profiler.record(MIDI_FLUSH, time.perf_counter_ns() - start)
+            return wake_ns - self.lookahead_ns
+
+    def stop(self):
+        """Stop rendering; pending note-offs and Stops are flushed, everything else is dropped
+
+        Note-offs keep their timestamps so they still land after note-ons that
+        were already handed to the port ahead of time; Stop likewise follows
+        the clocks already sent.
+        """
+        with self.lock:
+            flushed = sorted(event for event in self._queue if event[2] in (NOTE_OFF, STOP))
+            self._queue = []
+            self.running = False
+            for timestamp, _, event_type, data1, data2, destination in flushed:
+                self._dispatch(event_type, data1, data2, timestamp, destination)
+            if self._clock_started:
+                self._clock_started = False
+                if self._sent_realtime_ns is not None:
+                    self.midi.send_realtime(STOP, timestamp=self._sent_realtime_ns + 1)
+
+    def pending(self):
+        """Number of events waiting in the queue"""
+        return len(self._queue)
+
+    def _time_of(self, pulse):
+        return self._origin_ns + int((pulse - self._origin_pulse) * 60_000_000_000 // (self.tempo * MASTER_PPQN))
+
+    def _begin(self, first_step_ns):
+        """Place the first step; with clock output, Start goes out just before its first clock"""
+        self.next_step_ns = self._origin_ns = first_step_ns
+        if self.send_clock:
+            self._sequence += 1
+            heapq.heappush(self._queue, (first_step_ns, self._sequence, START, 0, 0, None))
+            self._clock_started = True
+
+    def _render_clock(self, horizon_ns):
+        """Queue the clock messages up to the horizon; returns the time of the next one"""
+        push = heapq.heappush
+        queue = self._queue
+        while True:
+            clock_ns = self._time_of(self._clock_pulse)
+            if self._clock_ns is not None and clock_ns <= self._clock_ns:
+                clock_ns = self._clock_ns + 1  # A sync correction never reorders clocks
+            if clock_ns > horizon_ns:
+                return clock_ns
+            if self._clock_pulse == self._start_pulse:
+                self._sequence += 1
+                push(queue, (clock_ns, self._sequence, START, 0, 0, None))
+                self._start_pulse = None
+                self._clock_started = True
+            self._sequence += 1
+            push(queue, (clock_ns, self._sequence, CLOCK, 0, 0, None))
+            self._clock_ns = clock_ns
+            self._clock_pulse += MASTER_PULSES_PER_CLOCK
+
+    def _render_step(self, step_ns):
+        push = heapq.heappush
+        queue = self._queue
+        engine = self.engine
+        events = engine.tick()
+        # tick() returns the X position CC, the Y position CC, then the step's events
+        x_destination, y_destination, step_destination = self.routing.resolve(engine.active_step)
+        has_x_cc = engine.x_cc_number is not None
+        first_step_event = has_x_cc + (engine.y_cc_number is not None)
+        for index, (event_type, data1, data2) in enumerate(events):
+            if index >= first_step_event:
+                destination = step_destination
+            else:
+                destination = x_destination if index == 0 and has_x_cc else y_destination
+            self._sequence += 1
+            push(queue, (step_ns, self._sequence, event_type, data1, data2, destination))
+            if event_type == NOTE_ON:
+                self._sequence += 1
+                push(queue, (step_ns + self.gate_ns, self._sequence, NOTE_OFF, data1, 0, destination))
+
+    def _dispatch_until(self, limit_ns):
+        """Send due events, one MIDI batch (a single port write) per timestamp"""
+        queue = self._queue
+        pop = heapq.heappop
+        midi = self.midi
+        batch_timestamp = None
+        while queue and queue[0][0] <= limit_ns:
+            timestamp, _, event_type, data1, data2, destination = pop(queue)
+            if timestamp != batch_timestamp:
+                if batch_timestamp is not None:
+                    midi.end_batch()
+                midi.begin_batch(timestamp)
+                batch_timestamp = timestamp
+            self._dispatch(event_type, data1, data2, timestamp, destination)
+        if batch_timestamp is not None:
+            midi.end_batch()
+
+    def _dispatch(self, event_type, data1, data2, timestamp, destination=None):
+        if event_type == NOTE_ON:
+            self.midi.send_note_on(data1, data2, timestamp=timestamp, destination=destination)
+        elif event_type == NOTE_OFF:
+            self.midi.send_note_off(data1, timestamp=timestamp, destination=destination)
+        elif event_type == CONTROL_CHANGE:
+            self.midi.send_cc(data1, data2, timestamp=timestamp, destination=destination)
+        else:
+            # Clock and transport go to every port
+            self.midi.send_realtime(event_type, timestamp=timestamp)
+            self._sent_realtime_ns = timestamp
@@ -0,0 +1,37 @@
+package org.isogrid.midi;
+
+import android.media.midi.MidiReceiver;
+
+/**
+ * MidiReceiver that forwards MIDI clock and transport bytes to Python.
+ *
+ * MidiReceiver is an abstract class, which pyjnius cannot subclass, so this
+ * shim does it and calls a Listener interface implemented in Python.  System
+ * real-time messages are single bytes that may appear anywhere in the
+ * stream; everything else is skipped here, so Python sees one call per
+ * clock/transport byte and no array conversion.
+ */
+public class ClockReceiver extends MidiReceiver {
+    public interface Listener {
+        void onRealtime(int status, long timestamp);
+    }
+
+    private final Listener listener;
+
+    public ClockReceiver(Listener listener) {
+        this.listener = listener;
+    }
+
+    @Override
+    public void onSend(byte[] msg, int offset, int count, long timestamp) {
+        if (timestamp == 0) {
+            timestamp = System.nanoTime();
+        }
+        for (int i = offset; i < offset + count; i++) {
+            int status = msg[i] & 0xFF;
+            if (status == 0xF8 || status == 0xFA || status == 0xFB || status == 0xFC) {
+                listener.onRealtime(status, timestamp);
+            }
+        }
+    }
+}
@@ -0,0 +1,34 @@
+package org.isogrid.midi;
+
+import android.media.midi.MidiDeviceInfo;
+import android.media.midi.MidiManager;
+
+/**
+ * MidiManager.DeviceCallback that forwards hot-plug events to Python.
+ *
+ * DeviceCallback is a class rather than an interface, so pyjnius cannot
+ * implement it directly; this shim extends it and calls a Listener
+ * interface implemented in Python.
+ */
+public class DeviceCallbackBridge extends MidiManager.DeviceCallback {
+    public interface Listener {
+        void onDeviceAdded(MidiDeviceInfo info);
+        void onDeviceRemoved(MidiDeviceInfo info);
+    }
+
+    private final Listener listener;
+
+    public DeviceCallbackBridge(Listener listener) {
+        this.listener = listener;
+    }
+
+    @Override
+    public void onDeviceAdded(MidiDeviceInfo info) {
+        listener.onDeviceAdded(info);
+    }
+
+    @Override
+    public void onDeviceRemoved(MidiDeviceInfo info) {
+        listener.onDeviceRemoved(info);
+    }
+}
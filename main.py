@@ -1,47 +1,219 @@
+import time
+
+# Cold start is timed from here: imports, build() and MIDI setup, to the first frame
+_startup_ns = time.perf_counter_ns()
+
 from kivy.app import App
-from kivy.uix.gridlayout import GridLayout
-from kivy.uix.togglebutton import ToggleButton
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
-from kivy.uix.popup import Popup
 from kivy.uix.slider import Slider
 from kivy.uix.spinner import Spinner
-from kivy.uix.gridlayout import GridLayout
 from kivy.clock import Clock
-from kivy.graphics import Color, Line
-import time
-import random
+from kivy.graphics import Color, Rectangle
+import os
 from midi_manager import MidiDriver
+from event_log import log
+from sequencer_clock import SequencerClock
+from sequencer_engine import (SequencerEngine, X_DRIVER_MODES, Y_DRIVER_MODES, CC_LABELS, GRID_SIZES,
+                              MAX_EUCLIDEAN_STEPS, AXIS_SPEEDS)
+from event_scheduler import LookaheadScheduler
+from matrix_widget import MatrixWidget
+from pattern_bank import PatternBank, PatternSlots
+from tick_profiler import (profiler, SCHEDULING, TICK, STARTUP_IMPORTS, STARTUP_BUILD, STARTUP_MIDI_SETUP,
+                           STARTUP_FIRST_FRAME)
 
-def euclidean_rhythm(steps, pulses):
-    """Generate an Euclidean rhythm pattern with improved algorithm"""
-    if steps <= 0:
-        return []
-    if pulses >= steps:
-        return [True] * steps
-    if pulses <= 0:
-        return [False] * steps
-
-    # Bresenham algorithm approach for Euclidean rhythms
-    pattern = []
-    error = 0
-
-    for i in range(steps):
-        error += pulses
-        if error >= steps:
-            pattern.append(True)
-            error -= steps
-        else:
-            pattern.append(False)
+profiler.mark_startup(STARTUP_IMPORTS, time.perf_counter_ns() - _startup_ns)
+
+DEFAULT_PORT_LABEL = 'Default'
+CHAIN_BARS = 4  # Bars each pattern plays for in CHAIN (song) mode
+
+class StepConfigPopup:
+    """Step configuration popup, built once and re-bound to the selected step on every open"""
+
+    def __init__(self, app):
+        # Only needed once a step is long-pressed, so not imported at startup
+        from kivy.uix.gridlayout import GridLayout
+        from kivy.uix.popup import Popup
+
+        self.app = app
+        self.step_idx = None
+
+        # Create a base layout with dark background
+        base_layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        with base_layout.canvas.before:
+            Color(0.067, 0.067, 0.067, 1)  # Dark background
+            base_rect = Rectangle(size=base_layout.size, pos=base_layout.pos)
+            base_layout.bind(size=lambda *args: setattr(base_rect, 'size', base_layout.size),
+                           pos=lambda *args: setattr(base_rect, 'pos', base_layout.pos))
+
+        # Inner grid layout for controls
+        layout = GridLayout(cols=2, padding=10, spacing=10)
+
+        # Note selection
+        layout.add_widget(Label(text='Note:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
+        self.note_spinner = Spinner(
+            values=[str(i) for i in range(12, 120)],  # MIDI note range
+            background_normal='',
+            background_color=(0.2, 0.6, 0.8, 1),  # Cyan blue
+            color=(0, 0, 0, 1),  # Black text for contrast
+            size_hint_y=None,
+            height=40
+        )
+        layout.add_widget(self.note_spinner)
+
+        # Velocity slider
+        layout.add_widget(Label(text='Velocity:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
+        self.velocity_slider = Slider(min=1, max=127, size_hint_y=None, height=40)
+        layout.add_widget(self.velocity_slider)
+
+        # Probability slider
+        layout.add_widget(Label(text='Probability:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
+        self.prob_slider = Slider(min=0, max=1, step=0.01, size_hint_y=None, height=40)
+        layout.add_widget(self.prob_slider)
+
+        # CC Lock controls
+        layout.add_widget(Label(text='CC Lock:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
+        cc_lock_layout = BoxLayout(orientation='vertical', size_hint_y=None, height=80)
+
+        # CC number input
+        self.cc_num_spinner = Spinner(
+            values=["None"] + [str(i) for i in range(128)],  # MIDI CC range
+            background_normal='',
+            background_color=(0.2, 0.8, 0.8, 1),  # Cyan
+            color=(0, 0, 0, 1),  # Black text for contrast
+            size_hint_y=None,
+            height=40
+        )
+        cc_lock_layout.add_widget(self.cc_num_spinner)
+
+        # CC value slider
+        self.cc_val_slider = Slider(min=0, max=127, size_hint_y=None, height=40)
+        cc_lock_layout.add_widget(self.cc_val_slider)
+
+        layout.add_widget(cc_lock_layout)
+
+        # Teleport target (for wormhole mode); the choices follow the grid size
+        layout.add_widget(Label(text='Teleport to:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
+        self.teleport_spinner = Spinner(
+            background_normal='',
+            background_color=(0.2, 0.8, 0.8, 1),  # Cyan
+            color=(0, 0, 0, 1),  # Black text for contrast
+            size_hint_y=None,
+            height=40
+        )
+        layout.add_widget(self.teleport_spinner)
+
+        # Output port for the step's notes and parameter locks
+        layout.add_widget(Label(text='Output:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
+        self.output_spinner = app._port_spinner(None, None, size_hint_y=None, height=40)
+        layout.add_widget(self.output_spinner)
+
+        # Button layout
+        button_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=50, spacing=10)
+
+        # Save button
+        save_btn = Button(text='Save', background_normal='', background_color=(0.2, 0.8, 0.2, 1), color=(0, 0, 0, 1), size_hint_x=0.5)
+        save_btn.bind(on_press=self.save_and_close)
+
+        # Cancel button
+        cancel_btn = Button(text='Cancel', background_normal='', background_color=(0.8, 0.2, 0.2, 1), color=(0, 0, 0, 1), size_hint_x=0.5)
+        cancel_btn.bind(on_press=lambda x: self.popup.dismiss())
+
+        button_layout.add_widget(save_btn)
+        button_layout.add_widget(cancel_btn)
+
+        # Add the grid layout and button layout to the base layout
+        base_layout.add_widget(layout)
+        base_layout.add_widget(button_layout)
+
+        self.popup = Popup(content=base_layout,
+                           size_hint=(0.8, 0.8),
+                           background_color=(0.067, 0.067, 0.067, 1))
+
+    def open(self, step_idx):
+        """Load step_idx's settings into the controls and show the popup"""
+        engine = self.app.engine
+        self.step_idx = step_idx
+        self.popup.title = f'STEP {step_idx} CONFIGURATION'
+        self.note_spinner.text = str(engine.step_notes[step_idx])
+        self.velocity_slider.value = engine.step_velocities[step_idx]
+        self.prob_slider.value = engine.step_probabilities[step_idx]
+        cc_values = engine.step_cc_values[step_idx]
+        self.cc_num_spinner.text = str(next(iter(cc_values))) if cc_values else "None"
+        self.cc_val_slider.value = next(iter(cc_values.values())) if cc_values else 64
+        self.teleport_spinner.values = ["-1 (None)"] + [str(i) for i in range(engine.step_count)]
+        target = engine.step_teleport_targets[step_idx]
+        self.teleport_spinner.text = str(target) if target != -1 else "None"
+        self.output_spinner.text = self.app.scheduler.routing.steps.get(step_idx) or DEFAULT_PORT_LABEL
+        self.popup.open()
+
+    def save_and_close(self, instance):
+        app = self.app
+        engine = app.engine
+        step_idx = self.step_idx
+        try:
+            # Bounds checking before updating (the grid may have shrunk since the popup opened)
+            if 0 <= step_idx < len(engine.step_notes):
+                engine.step_notes[step_idx] = int(self.note_spinner.text)
+            if 0 <= step_idx < len(engine.step_velocities):
+                engine.step_velocities[step_idx] = int(self.velocity_slider.value)
+            if 0 <= step_idx < len(engine.step_probabilities):
+                engine.step_probabilities[step_idx] = self.prob_slider.value
+
+            # Handle CC lock values
+            if self.cc_num_spinner.text != "None":
+                cc_num = int(self.cc_num_spinner.text)
+                cc_val = int(self.cc_val_slider.value)
+                if 0 <= step_idx < len(engine.step_cc_values):
+                    engine.step_cc_values[step_idx] = {cc_num: cc_val}
+            else:
+                if 0 <= step_idx < len(engine.step_cc_values):
+                    engine.step_cc_values[step_idx] = {}
+
+            # Handle teleport target
+            teleport_text = self.teleport_spinner.text
+            if teleport_text == "None" or teleport_text == "-1 (None)":
+                if 0 <= step_idx < len(engine.step_teleport_targets):
+                    engine.step_teleport_targets[step_idx] = -1
+            else:
+                teleport_target = int(teleport_text)
+                # Validate teleport target is within valid range
+                if 0 <= teleport_target < engine.step_count and 0 <= step_idx < len(engine.step_teleport_targets):
+                    engine.step_teleport_targets[step_idx] = teleport_target
+                elif 0 <= step_idx < len(engine.step_teleport_targets):
+                    engine.step_teleport_targets[step_idx] = -1  # Default to no teleport if invalid
+
+            output = self.output_spinner.text
+            app.scheduler.routing.set_step(step_idx, None if output == DEFAULT_PORT_LABEL else output)
+
+            # Wormholes and velocities (Logic Advance) shape the precomputed path
+            engine.invalidate_path()
+
+            # Update the cell label to show note value
+            if 0 <= step_idx < app.matrix.cell_count:
+                app.matrix.set_label(step_idx, engine.step_notes[step_idx])
+            self.popup.dismiss()
+        except ValueError as e:
+            log.error('ERROR', "Invalid value in step configuration: %s", e)
+            # Could show an error popup here
+        except Exception as e:
+            log.error('ERROR', "Unexpected error saving step configuration: %s", e)
 
-    return pattern
 
 class SequencerApp(App):
     def build(self):
-        self.midi = MidiDriver()
+        build_start = time.perf_counter_ns()
+        # Devices open in the background; while one reconnects its latest CCs are kept for it
+        self.midi = MidiDriver(reconnect_buffer=64)
         self.midi.setup()
+        profiler.mark_startup(STARTUP_MIDI_SETUP, time.perf_counter_ns() - build_start)
+        self.engine = SequencerEngine()
+        self.open_pattern_bank()
+        self._following_engine = False  # Set while the controls are updated from the engine
+        self._pattern_changes = self.engine.pattern_changes
+        self.chain_enabled = False
 
         # Main layout with dark background
         main_layout = BoxLayout(orientation='horizontal')
@@ -57,15 +229,15 @@ class SequencerApp(App):
                                   canvas_color=(0.15, 0.15, 0.15, 1)))
 
         self.y_driver_spinner = Spinner(
-            text='Forward',
-            values=['Forward', 'Backward', 'Pendulum', 'Random', 'Euclidean', 'Logic Advance'],
+            text=self.engine.y_mode,
+            values=Y_DRIVER_MODES,
             background_normal='',
             background_color=(0.2, 0.6, 0.8, 1),  # Cyan blue
             color=(0, 0, 0, 1)  # Black text for contrast
         )
         self.y_speed_spinner = Spinner(
-            text='1/16',
-            values=['1/32', '1/16', '1/8', '1/4'],
+            text=self.engine.y_speed,
+            values=list(AXIS_SPEEDS),
             background_normal='',
             background_color=(0.2, 0.6, 0.8, 1),  # Cyan blue
             color=(0, 0, 0, 1)  # Black text for contrast
@@ -75,48 +247,39 @@ class SequencerApp(App):
         left_panel.add_widget(self.y_driver_spinner)
         left_panel.add_widget(Label(text='Speed:', color=(0.5, 0.8, 0.8, 1)))
         left_panel.add_widget(self.y_speed_spinner)
-
-        # Center panel - 4x4 Matrix (The "Matrix" module)
-        center_panel = FloatLayout(size_hint_x=0.6)
-        matrix_layout = GridLayout(
-            cols=4,
-            size_hint=(None, None),
-            width=min(center_panel.size[0]*0.8, 400),
-            height=min(center_panel.size[1]*0.7, 400),
-            pos_hint={'center_x': 0.5, 'center_y': 0.6}
+        left_panel.add_widget(Label(text='Euclid steps/pulses/rot:', color=(0.5, 0.8, 0.8, 1)))
+        self.y_euclid_spinners = []
+        left_panel.add_widget(self._euclidean_controls(self.engine.euclidean_y, self.engine.set_y_euclidean,
+                                                       (0.2, 0.6, 0.8, 1), self.y_euclid_spinners))  # Cyan blue
+
+        # Grid size (columns x rows)
+        self.grid_spinner = Spinner(
+            text=f'{self.engine.columns}x{self.engine.rows}',
+            values=list(GRID_SIZES),
+            background_normal='',
+            background_color=(0.2, 0.6, 0.8, 1),  # Cyan blue
+            color=(0, 0, 0, 1)  # Black text for contrast
         )
-        self.matrix_steps = []
-
-        for i in range(16):  # 4x4
-            btn = ToggleButton(
-                text=str(self.step_notes[i]),  # Show note value (starting from C2)
-                background_normal='',
-                background_color=(0.1, 0.1, 0.1, 1),  # Darker gray for inactive
-                color=(0.5, 0.8, 0.8, 1),  # Cyan text highlight
-                font_size=16,
-                border=(2, 2, 2, 2)  # Add border for Eurorack style
-            )
-            # Store the step index in the button for later use
-            btn.step_idx = i
-            # Bind press events to track timing for long press
-            btn.bind(
-                on_press=self.on_step_press_with_timing,
-                on_release=self.on_step_release_with_timing
-            )
-            matrix_layout.add_widget(btn)
-            self.matrix_steps.append(btn)
-
-        center_panel.add_widget(matrix_layout)
-
-        # Horizontal line for X-axis visualization
-        with center_panel.canvas:
-            Color(0.8, 0.6, 0.2, 1)  # Amber for X-axis
-            self.h_line = Line(points=[], width=3)
+        self.grid_spinner.bind(text=self.on_grid_size_change)
+        left_panel.add_widget(Label(text='Grid:', color=(0.5, 0.8, 0.8, 1)))
+        left_panel.add_widget(self.grid_spinner)
+
+        # Pattern slot; switching saves the current grid to its slot first
+        self.pattern_spinner = Spinner(
+            text=str(self.engine.pattern_tag + 1),
+            values=[str(slot + 1) for slot in range(self.bank.slots if self.bank else 1)],
+            background_normal='',
+            background_color=(0.2, 0.6, 0.8, 1),  # Cyan blue
+            color=(0, 0, 0, 1)  # Black text for contrast
+        )
+        self._bind_control(self.pattern_spinner, lambda text: self.select_pattern(int(text) - 1))
+        left_panel.add_widget(Label(text='Pattern:', color=(0.5, 0.8, 0.8, 1)))
+        left_panel.add_widget(self.pattern_spinner)
 
-        # Vertical line for Y-axis visualization
-        with center_panel.canvas:
-            Color(0.2, 0.8, 0.8, 1)  # Cyan for Y-axis
-            self.v_line = Line(points=[], width=3)
+        # Center panel - the Matrix module (4x4 by default)
+        self.center_panel = FloatLayout(size_hint_x=0.6)
+        self.matrix = None
+        self._build_matrix()
 
         # Right panel - X Driver controls and MicroFreak control center
         right_panel = BoxLayout(orientation='vertical', size_hint_x=0.2, padding=10, spacing=5)
@@ -124,15 +287,15 @@ class SequencerApp(App):
         # X Driver controls
         right_panel.add_widget(Label(text='X-DRIVER', color=(0.8, 0.6, 0.2, 1), font_size=18, bold=True))
         self.x_driver_spinner = Spinner(
-            text='Forward',
-            values=['Forward', 'Backward', 'Pendulum', 'Random', 'Euclidean'],
+            text=self.engine.x_mode,
+            values=X_DRIVER_MODES,
             background_normal='',
             background_color=(0.8, 0.6, 0.2, 1),  # Amber
             color=(0, 0, 0, 1)  # Black text for contrast
         )
         self.x_speed_spinner = Spinner(
-            text='1/16',
-            values=['1/32', '1/16', '1/8', '1/4'],
+            text=self.engine.x_speed,
+            values=list(AXIS_SPEEDS),
             background_normal='',
             background_color=(0.8, 0.6, 0.2, 1),  # Amber
             color=(0, 0, 0, 1)  # Black text for contrast
@@ -142,30 +305,43 @@ class SequencerApp(App):
         right_panel.add_widget(self.x_driver_spinner)
         right_panel.add_widget(Label(text='Speed:', color=(0.8, 0.6, 0.2, 1)))
         right_panel.add_widget(self.x_speed_spinner)
+        right_panel.add_widget(Label(text='Euclid steps/pulses/rot:', color=(0.8, 0.6, 0.2, 1)))
+        self.x_euclid_spinners = []
+        right_panel.add_widget(self._euclidean_controls(self.engine.euclidean_x, self.engine.set_x_euclidean,
+                                                        (0.8, 0.6, 0.2, 1), self.x_euclid_spinners))  # Amber
 
         # MicroFreak Control Center
         right_panel.add_widget(Label(text='MICROFREAK CTRL', color=(0.5, 0.8, 0.8, 1), font_size=18, bold=True))
 
         # CC mapping controls
         self.x_cc_spinner = Spinner(
-            text='None',
-            values=['None', 'Cutoff (23)', 'Resonance (83)', 'Osc Type (9)', 'Wave (10)', 'Timbre (12)', 'Shape (13)', 'Glide (5)'],
+            text=self.engine.x_cc,
+            values=list(CC_LABELS),
             background_normal='',
             background_color=(0.2, 0.8, 0.8, 1),  # Cyan
             color=(0, 0, 0, 1)  # Black text for contrast
         )
         self.y_cc_spinner = Spinner(
-            text='None',
-            values=['None', 'Cutoff (23)', 'Resonance (83)', 'Osc Type (9)', 'Wave (10)', 'Timbre (12)', 'Shape (13)', 'Glide (5)'],
+            text=self.engine.y_cc,
+            values=list(CC_LABELS),
             background_normal='',
             background_color=(0.2, 0.8, 0.8, 1),  # Cyan
             color=(0, 0, 0, 1)  # Black text for contrast
         )
 
+        self._bind_control(self.x_driver_spinner, self.engine.set_x_mode)
+        self._bind_control(self.y_driver_spinner, self.engine.set_y_mode)
+        self._bind_control(self.x_speed_spinner, self.engine.set_x_speed)
+        self._bind_control(self.y_speed_spinner, self.engine.set_y_speed)
+        self._bind_control(self.x_cc_spinner, self.engine.set_x_cc)
+        self._bind_control(self.y_cc_spinner, self.engine.set_y_cc)
+
         right_panel.add_widget(Label(text='X to CC:', color=(0.5, 0.8, 0.8, 1)))
         right_panel.add_widget(self.x_cc_spinner)
+        right_panel.add_widget(self._port_spinner(None, lambda name: setattr(self.scheduler.routing, 'x_axis', name)))
         right_panel.add_widget(Label(text='Y to CC:', color=(0.5, 0.8, 0.8, 1)))
         right_panel.add_widget(self.y_cc_spinner)
+        right_panel.add_widget(self._port_spinner(None, lambda name: setattr(self.scheduler.routing, 'y_axis', name)))
 
         # Performance controls
         self.tempo_label = Label(text='Tempo: 120 BPM', color=(0.5, 0.8, 0.8, 1))
@@ -177,407 +353,373 @@ class SequencerApp(App):
         self.play_button.bind(on_press=self.toggle_play_state)
         self.is_playing = True  # Start playing by default
 
+        # Clock source: internal (tempo slider) or external MIDI clock from the device
+        self.sync_button = Button(text='SYNC: INT', background_normal='', background_color=(0.3, 0.3, 0.3, 1), color=(0.5, 0.8, 0.8, 1))
+        self.sync_button.bind(on_press=self.toggle_sync)
+        self._sync_event = None
+        # MIDI clock and Start/Stop out, for gear following this sequencer
+        self.clock_out_button = Button(text='CLOCK OUT: OFF', background_normal='', background_color=(0.3, 0.3, 0.3, 1), color=(0.5, 0.8, 0.8, 1))
+        self.clock_out_button.bind(on_press=self.toggle_clock_out)
+        # Song mode: saved patterns follow each other on bar lines
+        self.chain_button = Button(text='CHAIN: OFF', background_normal='', background_color=(0.3, 0.3, 0.3, 1), color=(0.5, 0.8, 0.8, 1))
+        self.chain_button.bind(on_press=self.toggle_chain)
+
+        # Tick-latency overlay (also enabled at startup with ISOGRID_PROFILE=1)
+        self.stats_button = Button(text='STATS', background_normal='', background_color=(0.3, 0.3, 0.3, 1), color=(0.5, 0.8, 0.8, 1))
+        self.stats_button.bind(on_press=self.toggle_stats)
+        self.stats_label = Label(text='', font_name='RobotoMono-Regular', font_size=11, color=(0.5, 0.8, 0.8, 1),
+                                 size_hint=(1, 0.2), pos_hint={'x': 0, 'y': 0}, opacity=0)
+        self.center_panel.add_widget(self.stats_label)
+        self._stats_event = None
+
         right_panel.add_widget(self.tempo_label)
         right_panel.add_widget(self.tempo_slider)
         right_panel.add_widget(self.play_button)
+        right_panel.add_widget(self.sync_button)
+        right_panel.add_widget(self.clock_out_button)
+        right_panel.add_widget(self.chain_button)
+        right_panel.add_widget(self.stats_button)
 
         # Add panels to main layout
         main_layout.add_widget(left_panel)
-        main_layout.add_widget(center_panel)
+        main_layout.add_widget(self.center_panel)
         main_layout.add_widget(right_panel)
 
-        # Initialize sequencer variables
-        self.current_x = 0
-        self.current_y = 0
-        self.x_direction = 1
-        self.y_direction = 1
-        self.step_states = [False] * 16  # Track which steps are enabled
-        self.step_notes = [i % 12 + 36 for i in range(16)]  # Default note values (C2 to B3)
-        self.step_velocities = [100] * 16  # Default velocities
-        self.step_probabilities = [1.0] * 16  # Default probabilities (100%)
-        self.step_cc_values = [{} for _ in range(16)]  # CC values for each step
-        self.step_teleport_targets = [-1] * 16  # Wormhole mode targets (-1 = no teleport)
-
-        # Start Sequencer Loop at 120 BPM (16th notes = 480 BPM, so interval = 60/480 = 0.125s)
-        interval = 60.0 / 120.0 / 4.0  # 120 BPM, 16th note interval
-        Clock.schedule_interval(self.tick, interval)
-
-        # Add callback to update the rectangle when the layout size changes
-        main_layout.bind(size=self._update_rect, pos=self._update_rect)
+        # Ticks run on a dedicated high-resolution clock thread at 120 BPM (16th notes);
+        # the Kivy thread is only asked to redraw, at most once per frame
+        self._redraw_trigger = Clock.create_trigger(self.redraw)
+        # Steps are rendered a look-ahead window early and sent with timestamps
+        self.scheduler = LookaheadScheduler(self.engine, self.midi, tempo=120)
+        self.patterns = PatternSlots(self.bank, self.engine, self.scheduler) if self.bank is not None else None
+        self.scheduler.start()
+        self.clock_sync = None  # Created when SYNC is first pressed
+        self.clock = SequencerClock(self.tick, tempo=120)
+        self.clock.start()
+
+        if os.environ.get('ISOGRID_PROFILE') == '1':
+            self.toggle_stats(self.stats_button)
+
+        # The step popup is built once the first frame is up, not on the way to it
+        self.step_config = None
+        from kivy.core.window import Window
+        Window.bind(on_flip=self._on_first_frame)
+
+        profiler.mark_startup(STARTUP_BUILD, time.perf_counter_ns() - build_start)
         return main_layout
 
-    def _update_rect(self, *args):
-        """Update the background rectangle when layout changes"""
-        self.rect.pos = self.pos
-        self.rect.size = self.size
-
-    def on_step_press_with_timing(self, button):
-        # Record the time when button was pressed
-        button.press_time = time.time()
-        # Use the button's stored index
-        step_idx = button.step_idx
-        # Temporarily store the button reference to check in release
-        self.current_pressed_button = button
-
-    def on_step_release_with_timing(self, button):
-        # Calculate press duration
-        press_duration = time.time() - button.press_time
-        step_idx = button.step_idx
-
-        # If press duration was long enough, show config popup
-        if press_duration > 0.5:  # 0.5 seconds for long press
-            self.show_step_config(step_idx)
-        else:
-            # Regular press: toggle activation
-            self.step_states[step_idx] = not self.step_states[step_idx]
-            if self.step_states[step_idx]:
-                self.matrix_steps[step_idx].background_color = (0.5, 0.8, 0.5, 1)  # Green for active
-            else:
-                self.matrix_steps[step_idx].background_color = (0.2, 0.2, 0.2, 1)  # Back to dark gray
-
-    def show_step_config(self, step_idx):
-        """Show the step configuration popup"""
-        # Create a base layout with dark background
-        base_layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
-        with base_layout.canvas.before:
-            Color(0.067, 0.067, 0.067, 1)  # Dark background
-            base_rect = Rectangle(size=base_layout.size, pos=base_layout.pos)
-            base_layout.bind(size=lambda *args: setattr(base_rect, 'size', base_layout.size),
-                           pos=lambda *args: setattr(base_rect, 'pos', base_layout.pos))
-
-        # Inner grid layout for controls
-        layout = GridLayout(cols=2, padding=10, spacing=10)
-
-        # Note selection
-        layout.add_widget(Label(text='Note:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
-        note_spinner = Spinner(
-            text=str(self.step_notes[step_idx]),
-            values=[str(i) for i in range(12, 120)],  # MIDI note range
-            background_normal='',
-            background_color=(0.2, 0.6, 0.8, 1),  # Cyan blue
-            color=(0, 0, 0, 1),  # Black text for contrast
-            size_hint_y=None,
-            height=40
-        )
-        layout.add_widget(note_spinner)
-
-        # Velocity slider
-        layout.add_widget(Label(text='Velocity:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
-        velocity_slider = Slider(min=1, max=127, value=self.step_velocities[step_idx], size_hint_y=None, height=40)
-        layout.add_widget(velocity_slider)
-
-        # Probability slider
-        layout.add_widget(Label(text='Probability:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
-        prob_slider = Slider(min=0, max=1, value=self.step_probabilities[step_idx], step=0.01, size_hint_y=None, height=40)
-        layout.add_widget(prob_slider)
-
-        # CC Lock controls
-        layout.add_widget(Label(text='CC Lock:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
-        cc_lock_layout = BoxLayout(orientation='vertical', size_hint_y=None, height=80)
-
-        # CC number input
-        cc_num_spinner = Spinner(
-            text=str(list(self.step_cc_values[step_idx].keys())[0]) if self.step_cc_values[step_idx] else "None",
-            values=["None"] + [str(i) for i in range(128)],  # MIDI CC range
+    def _on_first_frame(self, window):
+        window.unbind(on_flip=self._on_first_frame)
+        profiler.mark_startup(STARTUP_FIRST_FRAME, time.perf_counter_ns() - _startup_ns)
+        log.info('STARTUP', "%s", profiler.startup_summary())
+        Clock.schedule_once(lambda dt: self._get_step_config(), 0.5)
+
+    def _port_spinner(self, destination, on_select, **kwargs):
+        """Spinner choosing an output port by name; None/'Default' is the default port"""
+        spinner = Spinner(
+            text=destination or DEFAULT_PORT_LABEL,
+            values=[DEFAULT_PORT_LABEL],
             background_normal='',
             background_color=(0.2, 0.8, 0.8, 1),  # Cyan
             color=(0, 0, 0, 1),  # Black text for contrast
-            size_hint_y=None,
-            height=40
+            **kwargs
         )
-        cc_lock_layout.add_widget(cc_num_spinner)
-
-        # CC value slider
-        cc_val_slider = Slider(min=0, max=127, value=list(self.step_cc_values[step_idx].values())[0] if self.step_cc_values[step_idx] else 64, size_hint_y=None, height=40)
-        cc_lock_layout.add_widget(cc_val_slider)
-
-        layout.add_widget(cc_lock_layout)
-
-        # Teleport target (for wormhole mode)
-        layout.add_widget(Label(text='Teleport to:', color=(0.5, 0.8, 0.8, 1), size_hint_y=None, height=40))
-        teleport_spinner = Spinner(
-            text=str(self.step_teleport_targets[step_idx]) if self.step_teleport_targets[step_idx] != -1 else "None",
-            values=["-1 (None)"] + [str(i) for i in range(16)],
-            background_normal='',
-            background_color=(0.2, 0.8, 0.8, 1),  # Cyan
-            color=(0, 0, 0, 1),  # Black text for contrast
-            size_hint_y=None,
-            height=40
+        # Devices open asynchronously, so list the ports when the spinner is opened
+        spinner.bind(on_press=lambda instance: setattr(instance, 'values', [DEFAULT_PORT_LABEL] + self.midi.ports.names()))
+        if on_select is not None:
+            spinner.bind(text=lambda instance, text: on_select(None if text == DEFAULT_PORT_LABEL else text))
+        return spinner
+
+    def _bind_control(self, spinner, setter):
+        """Pass a spinner's selections to setter, except while the controls follow the engine"""
+        spinner.bind(text=lambda instance, text: None if self._following_engine else setter(text))
+
+    def _euclidean_controls(self, settings, setter, background_color, spinners):
+        """Steps, pulses and rotation spinners for one axis' Euclidean pattern, added to spinners"""
+        row = BoxLayout(orientation='horizontal', spacing=2)
+        for value in settings:
+            spinner = Spinner(
+                text=str(value),
+                values=[str(i) for i in range(MAX_EUCLIDEAN_STEPS + 1)],
+                background_normal='',
+                background_color=background_color,
+                color=(0, 0, 0, 1)  # Black text for contrast
+            )
+            row.add_widget(spinner)
+            spinners.append(spinner)
+
+        def on_change(*args):
+            if self._following_engine:
+                return
+            steps, pulses, rotation = (int(spinner.text) for spinner in spinners)
+            setter(steps, pulses, rotation)
+
+        for spinner in spinners:
+            spinner.bind(text=on_change)
+        return row
+
+    def _build_matrix(self):
+        """(Re)create the matrix widget for the engine's current grid size"""
+        if self.matrix is not None:
+            self.center_panel.remove_widget(self.matrix)
+        # All cells and the X/Y crosshair are drawn by one canvas widget
+        self.matrix = MatrixWidget(
+            columns=self.engine.columns,
+            rows=self.engine.rows,
+            labels=self.engine.step_notes,  # Show note value (starting from C2)
+            font_size=16 if self.engine.columns <= 8 else 11,
+            size_hint=(0.8, 0.7),
+            pos_hint={'center_x': 0.5, 'center_y': 0.6}
         )
-        layout.add_widget(teleport_spinner)
-
-        # Button layout
-        button_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=50, spacing=10)
-
-        # Save button
-        def save_and_close(instance):
-            try:
-                # Bounds checking before updating
-                if 0 <= step_idx < len(self.step_notes):
-                    self.step_notes[step_idx] = int(note_spinner.text)
-                if 0 <= step_idx < len(self.step_velocities):
-                    self.step_velocities[step_idx] = int(velocity_slider.value)
-                if 0 <= step_idx < len(self.step_probabilities):
-                    self.step_probabilities[step_idx] = prob_slider.value
-
-                # Handle CC lock values
-                if cc_num_spinner.text != "None":
-                    cc_num = int(cc_num_spinner.text)
-                    cc_val = int(cc_val_slider.value)
-                    if 0 <= step_idx < len(self.step_cc_values):
-                        self.step_cc_values[step_idx] = {cc_num: cc_val}
-                else:
-                    if 0 <= step_idx < len(self.step_cc_values):
-                        self.step_cc_values[step_idx] = {}
-
-                # Handle teleport target
-                if teleport_spinner.text == "None" or teleport_spinner.text == "-1 (None)":
-                    if 0 <= step_idx < len(self.step_teleport_targets):
-                        self.step_teleport_targets[step_idx] = -1
-                else:
-                    teleport_target = int(teleport_spinner.text)
-                    # Validate teleport target is within valid range
-                    if 0 <= teleport_target < 16 and 0 <= step_idx < len(self.step_teleport_targets):
-                        self.step_teleport_targets[step_idx] = teleport_target
-                    elif 0 <= step_idx < len(self.step_teleport_targets):
-                        self.step_teleport_targets[step_idx] = -1  # Default to no teleport if invalid
-
-                # Update button text to show note value
-                if 0 <= step_idx < len(self.matrix_steps):
-                    self.matrix_steps[step_idx].text = str(self.step_notes[step_idx])
-                popup.dismiss()
-            except ValueError as e:
-                print(f"[ERROR] Invalid value in step configuration: {str(e)}")
-                # Could show an error popup here
-            except Exception as e:
-                print(f"[ERROR] Unexpected error saving step configuration: {str(e)}")
-
-        save_btn = Button(text='Save', background_normal='', background_color=(0.2, 0.8, 0.2, 1), color=(0, 0, 0, 1), size_hint_x=0.5)
-        save_btn.bind(on_press=save_and_close)
+        self.matrix.bind(on_step_tap=self.on_step_tap, on_step_long_press=self.on_step_long_press)
+        self.center_panel.add_widget(self.matrix)
+
+    def open_pattern_bank(self):
+        """Open (or create) the pattern bank and load its first slot into the engine"""
+        self.engine.pattern_tag = 0
+        try:
+            self.bank = PatternBank(os.path.join(self.user_data_dir, 'patterns.isb'))
+        except (OSError, ValueError) as e:
+            log.error('ERROR', "Pattern bank unavailable, patterns will not be saved: %s", e)
+            self.bank = None
+            return
+        try:
+            pattern = self.bank.load(0)
+            if pattern is not None:
+                pattern.apply(self.engine)
+        except ValueError as e:
+            log.error('ERROR', "Could not load pattern 1, starting from the default grid: %s", e)
+
+    def select_pattern(self, slot):
+        """Save the current grid and switch to slot (see PatternSlots.select)"""
+        if self.patterns is None:
+            return
+        try:
+            switched = self.patterns.select(slot)
+        except ValueError as e:
+            log.error('ERROR', "Could not load pattern %s: %s", slot + 1, e)
+            return
+        if switched:
+            self.show_pattern()
+        if self.chain_enabled and not self.engine.queued_patterns:
+            self.patterns.queue_next(CHAIN_BARS)
+
+    def toggle_chain(self, instance):
+        """Song mode: play the saved patterns in slot order, CHAIN_BARS bars each"""
+        self.chain_enabled = not self.chain_enabled
+        instance.text = 'CHAIN: ON' if self.chain_enabled else 'CHAIN: OFF'
+        instance.background_color = (0.2, 0.6, 0.8, 1) if self.chain_enabled else (0.3, 0.3, 0.3, 1)
+        self.engine.clear_pattern_queue()
+        if self.chain_enabled and self.patterns is not None:
+            self.patterns.save()
+            self.patterns.queue_next(CHAIN_BARS)
+
+    def on_pattern_switched(self):
+        """The clock thread switched to a queued pattern: save the outgoing one and follow"""
+        if self.patterns is not None:
+            self.patterns.save_replaced()
+            if self.chain_enabled:
+                self.patterns.queue_next(CHAIN_BARS)
+        self.show_pattern()
+
+    def show_pattern(self):
+        """Bring the controls and the matrix in line with the engine after a pattern load"""
+        engine = self.engine
+        self._following_engine = True
+        try:
+            self.pattern_spinner.text = str(self.engine.pattern_tag + 1)
+            self.x_driver_spinner.text = engine.x_mode
+            self.y_driver_spinner.text = engine.y_mode
+            self.x_speed_spinner.text = engine.x_speed
+            self.y_speed_spinner.text = engine.y_speed
+            self.x_cc_spinner.text = engine.x_cc
+            self.y_cc_spinner.text = engine.y_cc
+            for spinners, settings in ((self.x_euclid_spinners, engine.euclidean_x),
+                                       (self.y_euclid_spinners, engine.euclidean_y)):
+                for spinner, value in zip(spinners, settings):
+                    spinner.text = str(value)
+            # Rebuilds the matrix when the size changed; otherwise only its labels need updating
+            grid = f'{engine.columns}x{engine.rows}'
+            if self.grid_spinner.text != grid:
+                self.grid_spinner.text = grid
+            else:
+                for step_idx in range(engine.step_count):
+                    self.matrix.set_label(step_idx, engine.step_notes[step_idx])
+                self.visualize_active_position()
+        finally:
+            self._following_engine = False
+
+    def on_grid_size_change(self, spinner, text):
+        """Resize the grid, keeping the steps that still fit"""
+        columns, rows = GRID_SIZES[text]
+        # Already the engine's size when a pattern switch changed it
+        if (columns, rows) != (self.engine.columns, self.engine.rows):
+            # The clock thread must not render a step while the arrays are swapped
+            with self.scheduler.lock:
+                self.engine.resize(columns, rows)
+        self._build_matrix()
+        self.visualize_active_position()
 
-        # Cancel button
-        cancel_btn = Button(text='Cancel', background_normal='', background_color=(0.8, 0.2, 0.2, 1), color=(0, 0, 0, 1), size_hint_x=0.5)
-        cancel_btn.bind(on_press=lambda x: popup.dismiss())
+    def _update_rect(self, instance, value):
+        """Update the background rectangle when layout changes"""
+        self.rect.pos = instance.pos
+        self.rect.size = instance.size
 
-        button_layout.add_widget(save_btn)
-        button_layout.add_widget(cancel_btn)
+    def on_step_tap(self, matrix, step_idx):
+        """Regular press: toggle activation"""
+        if self.engine.toggle_step(step_idx):
+            matrix.paint(step_idx, (0.5, 0.8, 0.5, 1))  # Green for active
+        else:
+            matrix.paint(step_idx, (0.2, 0.2, 0.2, 1))  # Back to dark gray
 
-        # Add the grid layout and button layout to the base layout
-        base_layout.add_widget(layout)
-        base_layout.add_widget(button_layout)
+    def on_step_long_press(self, matrix, step_idx):
+        """Long press (0.5 seconds): show the config popup"""
+        self.show_step_config(step_idx)
 
-        popup = Popup(title=f'STEP {step_idx} CONFIGURATION',
-                     content=base_layout,
-                     size_hint=(0.8, 0.8),
-                     background_color=(0.067, 0.067, 0.067, 1))
-        popup.open()
+    def show_step_config(self, step_idx):
+        """Show the step configuration popup"""
+        self._get_step_config().open(step_idx)
+
+    def _get_step_config(self):
+        """The step configuration popup, built on first use"""
+        if self.step_config is None:
+            self.step_config = StepConfigPopup(self)
+        return self.step_config
+
+    def on_stop(self):
+        self.clock.stop()
+        self.scheduler.stop()
+        self.midi.close()
+        if self.patterns is not None:
+            self.patterns.save()
+            self.bank.close()
+        if profiler.enabled:
+            self.dump_stats()
+        log.stop()
+
+    def tick(self, deadline_ns):
+        """Clock thread callback: render and send the steps inside the look-ahead window
+
+        Returns when the next step needs rendering, so the clock only wakes up
+        for steps; while paused it falls back to polling at the 16th-note grid.
+        """
+        if profiler.enabled:
+            start = time.perf_counter_ns()
+            profiler.record(SCHEDULING, start - deadline_ns)
 
-    def tick(self, dt):
         # Only update if playing
-        if not self.is_playing:
+        if not self.scheduler.running:
             return
 
-        # Update X position based on X driver logic
-        self.update_x_position()
-
-        # Update Y position based on Y driver logic
-        self.update_y_position()
+        next_deadline_ns = self.scheduler.advance(deadline_ns)
 
-        # Calculate the active step index
-        active_step_index = (self.current_y * 4) + self.current_x
+        # Visual feedback for active position, drawn on the Kivy thread
+        self._redraw_trigger()
 
-        # Bounds checking for step index
-        if active_step_index < 0 or active_step_index >= len(self.step_teleport_targets):
-            print(f"[ERROR] Active step index out of bounds: {active_step_index}")
-            return
-
-        # Check for wormhole teleportation
-        if self.step_teleport_targets[active_step_index] != -1:
-            # Teleport to the target step immediately
-            teleport_target = self.step_teleport_targets[active_step_index]
-            if 0 <= teleport_target < 16:  # Validate teleport target
-                active_step_index = teleport_target
-                # Update current X and Y based on new step index
-                self.current_x = active_step_index % 4
-                self.current_y = active_step_index // 4
-            else:
-                print(f"[WARNING] Invalid teleport target: {teleport_target}")
+        if profiler.enabled:
+            profiler.record(TICK, time.perf_counter_ns() - start)
+        return next_deadline_ns
 
-        # Visual feedback for active position
+    def toggle_stats(self, instance):
+        """Show/hide the tick-latency overlay; hiding it writes the histograms to a file"""
+        if not profiler.enabled:
+            profiler.reset()
+            profiler.enabled = True
+            instance.background_color = (0.2, 0.6, 0.8, 1)  # Cyan blue while measuring
+            self.stats_label.opacity = 1
+            self._stats_event = Clock.schedule_interval(self.update_stats, 0.5)
+        else:
+            profiler.enabled = False
+            instance.background_color = (0.3, 0.3, 0.3, 1)
+            self.stats_label.opacity = 0
+            self._stats_event.cancel()
+            self._stats_event = None
+            self.dump_stats()
+
+    def update_stats(self, dt):
+        self.stats_label.text = profiler.summary()
+
+    def dump_stats(self):
+        try:
+            path = profiler.dump(os.path.join(self.user_data_dir, 'tick_profile.json'))
+            log.info('STATS', "Tick latency histograms written to %s", path)
+        except OSError as e:
+            log.error('ERROR', "Could not write tick latency histograms: %s", e)
+
+    def redraw(self, dt):
+        """Redraw trigger: catch up with a pattern switch, then move the crosshair"""
+        if self.engine.pattern_changes != self._pattern_changes:
+            self._pattern_changes = self.engine.pattern_changes
+            self.on_pattern_switched()
         self.visualize_active_position()
 
-        # Send CC messages based on X/Y positions
-        self.send_cc_messages()
-
-        # Bounds checking for step states
-        if active_step_index < len(self.step_states) and self.step_states[active_step_index]:
-            # Check probability - if random value is higher than step probability, skip
-            if active_step_index < len(self.step_probabilities) and random.random() <= self.step_probabilities[active_step_index]:
-                self.play_note_at_intersection(active_step_index)
-
-    def update_x_position(self):
-        # Handle Euclidean rhythm for X axis
-        if self.x_driver_spinner.text == 'Euclidean':
-            # Generate Euclidean rhythm pattern based on current settings
-            self.euclidean_x_steps = getattr(self, 'euclidean_x_steps', euclidean_rhythm(4, 2))  # Default 4 steps, 2 pulses
-            self.euclidean_x_index = getattr(self, 'euclidean_x_index', 0)
-
-            if self.euclidean_x_steps[self.euclidean_x_index]:
-                # Only move if this step is active in the Euclidean pattern
-                self.current_x = (self.current_x + 1) % 4
-            self.euclidean_x_index = (self.euclidean_x_index + 1) % len(self.euclidean_x_steps)
-        elif self.x_driver_spinner.text == 'Random':
-            self.current_x = random.randint(0, 3)
-        elif self.x_driver_spinner.text == 'Forward':
-            self.current_x = (self.current_x + 1) % 4
-        elif self.x_driver_spinner.text == 'Backward':
-            self.current_x = (self.current_x - 1) % 4
-        elif self.x_driver_spinner.text == 'Pendulum':
-            self.current_x += self.x_direction
-            if self.current_x >= 3:
-                self.x_direction = -1
-            elif self.current_x <= 0:
-                self.x_direction = 1
-            if self.current_x < 0:
-                self.current_x = 0
-            elif self.current_x > 3:
-                self.current_x = 3
-
-    def update_y_position(self):
-        # Handle Euclidean rhythm for Y axis
-        if self.y_driver_spinner.text == 'Euclidean':
-            # Generate Euclidean rhythm pattern based on current settings
-            self.euclidean_y_steps = getattr(self, 'euclidean_y_steps', euclidean_rhythm(4, 3))  # Default 4 steps, 3 pulses
-            self.euclidean_y_index = getattr(self, 'euclidean_y_index', 0)
-
-            if self.euclidean_y_steps[self.euclidean_y_index]:
-                # Only move if this step is active in the Euclidean pattern
-                self.current_y = (self.current_y + 1) % 4
-            self.euclidean_y_index = (self.euclidean_y_index + 1) % len(self.euclidean_y_steps)
-        elif self.y_driver_spinner.text == 'Random':
-            self.current_y = random.randint(0, 3)
-        elif self.y_driver_spinner.text == 'Forward':
-            self.current_y = (self.current_y + 1) % 4
-        elif self.y_driver_spinner.text == 'Backward':
-            self.current_y = (self.current_y - 1) % 4
-        elif self.y_driver_spinner.text == 'Pendulum':
-            self.current_y += self.y_direction
-            if self.current_y >= 3:
-                self.y_direction = -1
-            elif self.current_y <= 0:
-                self.y_direction = 1
-            if self.current_y < 0:
-                self.current_y = 0
-            elif self.current_y > 3:
-                self.current_y = 3
-        elif self.y_driver_spinner.text == 'Logic Advance':
-            # Only advance Y if X position is at a high-velocity step (velocity > 100)
-            # Get the current X position step index for the current Y row
-            x_step_index = (self.current_y * 4) + self.current_x
-            # Add bounds checking
-            if 0 <= x_step_index < len(self.step_velocities) and self.step_velocities[x_step_index] > 100:
-                self.current_y = (self.current_y + 1) % 4
-
     def visualize_active_position(self):
-        # Ensure we have the right number of matrix steps
-        if len(self.matrix_steps) != 16 or len(self.step_states) != 16:
-            print("[ERROR] Matrix steps and step states have incorrect lengths")
+        """Move the crosshair, repainting only the cells whose highlight changed"""
+        # Ensure we have the right number of matrix cells
+        if self.matrix.cell_count != self.engine.step_count or len(self.engine.step_states) != self.engine.step_count:
+            log.error('ERROR', "Matrix cells and step states have incorrect lengths")
             return
 
-        # Reset all buttons to inactive state
-        for i, btn in enumerate(self.matrix_steps):
-            if 0 <= i < len(self.step_states):
-                if self.step_states[i]:
-                    btn.background_color = (0.15, 0.15, 0.15, 1)  # Dark gray for inactive steps that are enabled
-                else:
-                    btn.background_color = (0.1, 0.1, 0.1, 1)  # Even darker for inactive steps
-
         # Calculate and validate active position
-        active_idx = (self.current_y * 4) + self.current_x
-        if not (0 <= active_idx < len(self.matrix_steps)):
-            print(f"[ERROR] Active index out of bounds: {active_idx}")
+        current_x = self.engine.current_x
+        current_y = self.engine.current_y
+        active_idx = (current_y * self.engine.columns) + current_x
+        if not (0 <= active_idx < self.matrix.cell_count):
+            log.error('ERROR', "Active index out of bounds: %s", active_idx)
             return
 
-        # Highlight current position with amber
-        self.matrix_steps[active_idx].background_color = (0.8, 0.6, 0.2, 1)  # Amber
-
-        # Highlight current row (Y axis) with cyan
-        for x in range(4):
-            idx = (self.current_y * 4) + x
-            if 0 <= idx < len(self.matrix_steps) and 0 <= idx < len(self.step_states):
-                if self.step_states[idx]:
-                    if idx != active_idx:  # Don't override the active position color
-                        self.matrix_steps[idx].background_color = (0.2, 0.8, 0.8, 0.7)  # Cyan for active row
-                else:
-                    if idx != active_idx:
-                        self.matrix_steps[idx].background_color = (0.1, 0.1, 0.1, 0.5)  # Partially highlighted for row
-
-        # Highlight current column (X axis) with cyan
-        for y in range(4):
-            idx = (y * 4) + self.current_x
-            if 0 <= idx < len(self.matrix_steps) and 0 <= idx < len(self.step_states):
-                if self.step_states[idx]:
-                    if idx != active_idx and self.matrix_steps[idx].background_color != (0.2, 0.8, 0.8, 0.7):  # Don't override row highlight
-                        self.matrix_steps[idx].background_color = (0.2, 0.8, 0.8, 0.7)  # Cyan for active column
-                else:
-                    if idx != active_idx and self.matrix_steps[idx].background_color != (0.1, 0.1, 0.1, 0.5):
-                        self.matrix_steps[idx].background_color = (0.1, 0.1, 0.1, 0.5)  # Partially highlighted for column
-
-        # Ensure intersection is amber
-        if 0 <= active_idx < len(self.matrix_steps):
-            self.matrix_steps[active_idx].background_color = (0.8, 0.6, 0.2, 1)  # Amber
-
-    def send_cc_messages(self):
-        # Map X position to selected CC
-        x_cc_map = {
-            'None': None,
-            'Cutoff (23)': 23,
-            'Resonance (83)': 83,
-            'Osc Type (9)': 9,
-            'Wave (10)': 10,
-            'Timbre (12)': 12,
-            'Shape (13)': 13,
-            'Glide (5)': 5
-        }
-
-        # Add bounds checking for spinner text
-        if hasattr(self, 'x_cc_spinner') and self.x_cc_spinner.text in x_cc_map:
-            x_cc = x_cc_map[self.x_cc_spinner.text]
-            if x_cc is not None:
-                # Ensure current_x is not 0 to avoid division by zero when denominator is 3
-                cc_value = int((self.current_x / 3) * 127) if 3 != 0 else 0  # Scale to 0-127
-                self.midi.send_cc(x_cc, cc_value)
-
-        # Map Y position to selected CC
-        y_cc_map = {
-            'None': None,
-            'Cutoff (23)': 23,
-            'Resonance (83)': 83,
-            'Osc Type (9)': 9,
-            'Wave (10)': 10,
-            'Timbre (12)': 12,
-            'Shape (13)': 13,
-            'Glide (5)': 5
-        }
-
-        # Add bounds checking for spinner text
-        if hasattr(self, 'y_cc_spinner') and self.y_cc_spinner.text in y_cc_map:
-            y_cc = y_cc_map[self.y_cc_spinner.text]
-            if y_cc is not None:
-                # Ensure current_y is not 0 to avoid division by zero when denominator is 3
-                cc_value = int((self.current_y / 3) * 127) if 3 != 0 else 0  # Scale to 0-127
-                self.midi.send_cc(y_cc, cc_value)
+        self.matrix.update(self.engine.step_states, current_x, current_y)
 
     def on_tempo_change(self, slider, value):
         """Handle tempo change"""
         tempo = max(1, int(value))  # Ensure tempo is at least 1 to avoid division by zero
         self.tempo_label.text = f'Tempo: {tempo} BPM'
 
-        # Update the clock interval based on tempo
-        # For 16th notes: interval = 60 / BPM / 4
-        interval = 60.0 / tempo / 4.0
-        Clock.unschedule(self.tick)
-        Clock.schedule_interval(self.tick, interval)
+        # Step times are rebased on the next unrendered step
+        self.clock.set_tempo(tempo)
+        if self.midi.clock_handler is None:  # Otherwise the external clock sets the tempo
+            self.scheduler.set_tempo(tempo)
+
+    def toggle_sync(self, instance):
+        """Switch between the tempo slider and the device's MIDI clock"""
+        if self.midi.clock_handler is None:
+            if self.clock_sync is None:
+                from clock_sync import ExternalClockSync
+                self.clock_sync = ExternalClockSync(self.scheduler, on_transport=self.on_external_transport)
+            # Wait for the master's Start; its clock sets tempo and phase from then on
+            self.scheduler.stop()
+            self.midi.clock_handler = self.clock_sync
+            instance.text = 'SYNC: EXT'
+            instance.background_color = (0.2, 0.6, 0.8, 1)  # Cyan blue
+            self._sync_event = Clock.schedule_interval(self.update_external_tempo, 0.5)
+        else:
+            self.midi.clock_handler = None
+            instance.text = 'SYNC: INT'
+            instance.background_color = (0.3, 0.3, 0.3, 1)
+            self._sync_event.cancel()
+            self._sync_event = None
+            self.on_tempo_change(self.tempo_slider, self.tempo_slider.value)
+            if self.is_playing and not self.scheduler.running:
+                self.scheduler.start()
+
+    def toggle_clock_out(self, instance):
+        """Send MIDI clock at 24 PPQN, timestamped by the scheduler like the notes"""
+        send_clock = not self.scheduler.send_clock
+        self.scheduler.set_send_clock(send_clock)
+        instance.text = 'CLOCK OUT: ON' if send_clock else 'CLOCK OUT: OFF'
+        instance.background_color = (0.2, 0.6, 0.8, 1) if send_clock else (0.3, 0.3, 0.3, 1)
+
+    def update_external_tempo(self, dt):
+        tracker = self.clock_sync.tracker
+        state = 'locked' if tracker.locked else 'no lock'
+        self.tempo_label.text = f'Tempo: {tracker.tempo:.1f} BPM ({state})'
+
+    def on_external_transport(self, playing):
+        """Master Start/Stop (MIDI receive thread): mirror it on the play button"""
+        def update(dt):
+            self.is_playing = playing
+            self.play_button.text = 'PLAY' if playing else 'PAUSE'
+            self.play_button.background_color = (0.2, 0.8, 0.2, 1) if playing else (0.8, 0.2, 0.2, 1)
+        Clock.schedule_once(update)
 
     def toggle_play_state(self, instance):
         """Toggle play/pause state"""
@@ -585,28 +727,18 @@ class SequencerApp(App):
         if self.is_playing:
             instance.text = 'PLAY'
             instance.background_color = (0.2, 0.8, 0.2, 1)  # Green
+            if self.midi.clock_handler is not None:
+                self.clock_sync.play()  # Starts on the master's next clock
+            else:
+                self.scheduler.start()
         else:
             instance.text = 'PAUSE'
             instance.background_color = (0.8, 0.2, 0.2, 1)  # Red
-
-    def play_note_at_intersection(self, step_index):
-        # Bounds checking for step index
-        if step_index < 0 or step_index >= len(self.step_notes):
-            print(f"[ERROR] Step index out of bounds in play_note_at_intersection: {step_index}")
-            return
-
-        # Use the step-specific note value, velocity and CC values
-        note_value = self.step_notes[step_index]
-        velocity = self.step_velocities[step_index]
-
-        # Apply parameter lock if any CC values are set for this step
-        if 0 <= step_index < len(self.step_cc_values) and self.step_cc_values[step_index]:
-            for cc_num, cc_val in self.step_cc_values[step_index].items():
-                self.midi.send_cc(cc_num, cc_val)
-
-        self.midi.send_note_on(note_value, velocity)
-        # Schedule note off after a short duration
-        Clock.schedule_once(lambda dt: self.midi.send_note_off(note_value), 0.1)
+            # Release any notes still held by the look-ahead queue
+            if self.midi.clock_handler is not None:
+                self.clock_sync.pause()
+            else:
+                self.scheduler.stop()
 
 if __name__ == '__main__':
     SequencerApp().run()
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Diffed highlight state for the matrix display.
+
+Every cell of the grid has one highlight code, derived from whether its step
+is enabled and where the playhead crosshair is.  The highlighter keeps the
+codes of the last frame and reports only the cells whose code changed, so the
+UI touches a handful of widgets per tick instead of repainting the whole grid.
+It has no Kivy dependency.
+"""
+from sequencer_engine import GRID_SIZE
+
+# Highlight codes: bit 0 is "step enabled", bit 1 is "on the crosshair"
+CELL_OFF = 0
+CELL_ON = 1
+LINE_OFF = 2
+LINE_ON = 3
+CELL_ACTIVE = 4
+UNKNOWN = 0xFF  # Never painted (or painted by someone else): always differs
+
+# Background colour of each highlight code
+HIGHLIGHT_COLORS = (
+    (0.1, 0.1, 0.1, 1),  # Even darker for inactive steps
+    (0.15, 0.15, 0.15, 1),  # Dark gray for inactive steps that are enabled
+    (0.1, 0.1, 0.1, 0.5),  # Partially highlighted for row/column
+    (0.2, 0.8, 0.8, 0.7),  # Cyan for active row/column
+    (0.8, 0.6, 0.2, 1),  # Amber for the current position
+)
+
+
+class MatrixHighlighter:
+    """Remembers the highlight code painted on each cell and diffs new frames against it"""
+
+    def __init__(self, columns=GRID_SIZE, rows=GRID_SIZE):
+        self.columns = columns
+        self.rows = rows
+        self.cell_count = columns * rows
+        self.codes = bytearray([UNKNOWN]) * self.cell_count
+        self._frame = bytearray(self.cell_count)
+
+    def update(self, step_states, x, y):
+        """Compute the frame for the playhead at (x, y) and return the indices that changed"""
+        columns = self.columns
+        count = self.cell_count
+        frame = self._frame
+        for index in range(count):
+            frame[index] = CELL_ON if step_states[index] else CELL_OFF
+        row = y * columns
+        for index in range(row, row + columns):
+            frame[index] |= LINE_OFF
+        for index in range(x, count, columns):
+            frame[index] |= LINE_OFF
+        frame[row + x] = CELL_ACTIVE
+
+        codes = self.codes
+        if frame == codes:
+            return []
+        changed = [index for index in range(count) if frame[index] != codes[index]]
+        codes[:] = frame
+        return changed
+
+    def forget(self, index=None):
+        """Mark one cell (or all of them) as needing a repaint on the next update"""
+        if index is None:
+            self.codes[:] = bytearray([UNKNOWN]) * self.cell_count
+        else:
+            self.codes[index] = UNKNOWN
@@ -0,0 +1,155 @@
+"""
+Canvas-drawn step matrix.
+
+One widget draws every cell as a coloured rectangle plus a note label texture,
+and the X/Y crosshair as two lines, all as plain canvas instructions created
+once.  A playhead move only changes the rgba of the cells the
+MatrixHighlighter reports and the points of the two lines; there is no
+per-cell widget, property dispatch or layout pass.  Touches are hit-tested
+here and reported as on_step_tap / on_step_long_press events.
+"""
+import time
+
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics import Color, Line, Rectangle
+from kivy.uix.widget import Widget
+
+from matrix_highlight import MatrixHighlighter, HIGHLIGHT_COLORS
+from sequencer_engine import GRID_SIZE
+
+LONG_PRESS_SECONDS = 0.5
+CELL_SPACING = 2
+LABEL_COLOR = (0.5, 0.8, 0.8, 1)  # Cyan text highlight
+X_LINE_COLOR = (0.8, 0.6, 0.2, 1)  # Amber for X-axis
+Y_LINE_COLOR = (0.2, 0.8, 0.8, 1)  # Cyan for Y-axis
+
+
+class MatrixWidget(Widget):
+    """Grid of steps drawn with one Color/Rectangle pair per cell"""
+
+    __events__ = ('on_step_tap', 'on_step_long_press')
+
+    def __init__(self, columns=GRID_SIZE, rows=GRID_SIZE, labels=None, font_size=16, **kwargs):
+        super().__init__(**kwargs)
+        self.columns = columns
+        self.rows = rows
+        self.cell_count = columns * rows
+        self.font_size = font_size
+        self.highlighter = MatrixHighlighter(columns, rows)
+        self.current_x = 0
+        self.current_y = 0
+        self._colors = []
+        self._cells = []
+        self._labels = []
+
+        with self.canvas:
+            for _ in range(self.cell_count):
+                self._colors.append(Color(*HIGHLIGHT_COLORS[0]))
+                self._cells.append(Rectangle())
+            # Crosshair through the current row (X, amber) and column (Y, cyan)
+            Color(*X_LINE_COLOR)
+            self.h_line = Line(points=[], width=3)
+            Color(*Y_LINE_COLOR)
+            self.v_line = Line(points=[], width=3)
+            Color(1, 1, 1, 1)
+            for _ in range(self.cell_count):
+                self._labels.append(Rectangle())
+
+        for index, text in enumerate(labels or []):
+            self.set_label(index, text)
+        self.bind(pos=self._layout, size=self._layout)
+
+    def set_label(self, index, text):
+        """Render the text shown on a cell (e.g. its note number)"""
+        label = CoreLabel(text=str(text), font_size=self.font_size, color=LABEL_COLOR)
+        label.refresh()
+        self._labels[index].texture = label.texture
+        self._labels[index].size = label.texture.size
+        self._place_label(index)
+
+    def paint(self, index, rgba):
+        """Colour one cell directly; the next update() repaints it from the highlight state"""
+        self._colors[index].rgba = rgba
+        self.highlighter.forget(index)
+
+    def update(self, step_states, x, y):
+        """Move the crosshair to (x, y), recolouring only the cells that changed"""
+        codes = self.highlighter.codes
+        colors = self._colors
+        for index in self.highlighter.update(step_states, x, y):
+            colors[index].rgba = HIGHLIGHT_COLORS[codes[index]]
+        if x != self.current_x or y != self.current_y:
+            self.current_x = x
+            self.current_y = y
+            self._place_crosshair()
+
+    def cell_at(self, x, y):
+        """Index of the cell under a window point, or None between/outside cells"""
+        if not self.collide_point(x, y):
+            return None
+        cell_w = self.width / self.columns
+        cell_h = self.height / self.rows
+        column = min(int((x - self.x) / cell_w), self.columns - 1)
+        row_from_top = min(int((self.top - y) / cell_h), self.rows - 1)
+        return row_from_top * self.columns + column
+
+    def on_touch_down(self, touch):
+        index = self.cell_at(*touch.pos)
+        if index is None:
+            return super().on_touch_down(touch)
+        touch.grab(self)
+        touch.ud['matrix_step'] = index
+        touch.ud['matrix_press_time'] = time.time()
+        return True
+
+    def on_touch_up(self, touch):
+        if touch.grab_current is not self:
+            return super().on_touch_up(touch)
+        touch.ungrab(self)
+        index = touch.ud.get('matrix_step')
+        # A press that slid onto another cell is cancelled
+        if index is None or self.cell_at(*touch.pos) != index:
+            return True
+        if time.time() - touch.ud['matrix_press_time'] > LONG_PRESS_SECONDS:
+            self.dispatch('on_step_long_press', index)
+        else:
+            self.dispatch('on_step_tap', index)
+        return True
+
+    def on_step_tap(self, index):
+        pass
+
+    def on_step_long_press(self, index):
+        pass
+
+    def _cell_rect(self, index):
+        # Row 0 is drawn at the top, like the GridLayout it replaces
+        cell_w = self.width / self.columns
+        cell_h = self.height / self.rows
+        column = index % self.columns
+        row = index // self.columns
+        return (self.x + column * cell_w + CELL_SPACING / 2,
+                self.top - (row + 1) * cell_h + CELL_SPACING / 2,
+                max(0, cell_w - CELL_SPACING),
+                max(0, cell_h - CELL_SPACING))
+
+    def _place_label(self, index):
+        x, y, width, height = self._cell_rect(index)
+        label = self._labels[index]
+        label.pos = (x + (width - label.size[0]) / 2, y + (height - label.size[1]) / 2)
+
+    def _place_crosshair(self):
+        cell_w = self.width / self.columns
+        cell_h = self.height / self.rows
+        row_y = self.top - (self.current_y + 0.5) * cell_h
+        column_x = self.x + (self.current_x + 0.5) * cell_w
+        self.h_line.points = [self.x, row_y, self.right, row_y]
+        self.v_line.points = [column_x, self.y, column_x, self.top]
+
+    def _layout(self, *args):
+        for index, cell in enumerate(self._cells):
+            x, y, width, height = self._cell_rect(index)
+            cell.pos = (x, y)
+            cell.size = (width, height)
+            self._place_label(index)
+        self._place_crosshair()
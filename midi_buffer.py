@@ -0,0 +1,216 @@
+"""
+Preallocated MIDI message encoder.
+
+Messages are written in place into one fixed bytearray ring using status bytes
+precomputed per channel, and the port is handed (buffer, offset, length) of the
+encoded region, so no list, bytearray or slice is created per message.
+
+Messages produced within one tick can be batched: the encoder keeps appending
+to the pending region until the outermost batch is closed, and the whole
+region is then written with one send() instead of one JNI round trip per
+message.  Running status (dropping repeated status bytes) can be enabled to
+save bytes on slow USB-MIDI links; every region starts with a full status
+byte, so each send stands on its own.
+
+System real-time messages (clock, Start, Stop) are single status bytes.
+They may sit between the messages of a running-status stream without
+cancelling it, so they do not touch the running status.
+
+ControllerCache remembers the last value transmitted per channel and
+controller so unchanged CCs can be skipped.
+"""
+import time
+
+# 256 bytes keeps every ring offset a cached small int, so CPython allocates
+# nothing at all per encoded message; a tick needs only a few dozen bytes
+MIDI_RING_SIZE = 256
+MAX_REGION_SIZE = 128
+
+# Status bytes precomputed per channel (index with channel & 0x0F)
+NOTE_OFF_STATUS = bytes(0x80 | channel for channel in range(16))
+NOTE_ON_STATUS = bytes(0x90 | channel for channel in range(16))
+CONTROL_CHANGE_STATUS = bytes(0xB0 | channel for channel in range(16))
+PROGRAM_CHANGE_STATUS = bytes(0xC0 | channel for channel in range(16))
+PITCH_BEND_STATUS = bytes(0xE0 | channel for channel in range(16))
+
+# System real-time messages; MIDI clock runs at 24 per quarter note
+CLOCK = 0xF8
+START = 0xFA
+CONTINUE = 0xFB
+STOP = 0xFC
+CLOCK_PPQN = 24
+
+
+class MidiEncoder:
+    """Fixed ring buffer that encodes channel messages in place"""
+
+    def __init__(self, size=MIDI_RING_SIZE, running_status=False, max_region=MAX_REGION_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.size = size
+        self.max_region = min(max_region, size)
+        self.running_status = running_status
+        self.start = 0  # Start of the pending (not yet sent) region
+        self.pos = 0  # Write position
+        # Last write position at which a 3-byte message takes the fast path
+        self.limit = self.max_region - 3
+        self.timestamp = None
+        self.depth = 0
+        self._last_status = 0
+
+    @property
+    def active(self):
+        """True while a batch is open"""
+        return self.depth > 0
+
+    @property
+    def pending(self):
+        """Number of encoded bytes waiting to be sent"""
+        return self.pos - self.start
+
+    def begin(self, timestamp=None):
+        """Open a batch (batches nest; the outermost timestamp wins)"""
+        if self.depth == 0:
+            self.timestamp = timestamp
+        self.depth += 1
+
+    def end(self):
+        """Close a batch and return True once the outermost one is closed"""
+        if self.depth > 0:
+            self.depth -= 1
+        return self.depth == 0
+
+    def write(self, status, data1, data2=None):
+        """Encode a message at the end of the pending region.
+
+        Returns False if the region is full; the caller must take() and send
+        it before writing again.
+        """
+        pos = self.pos
+        if pos > self.limit:
+            if pos - self.start + 3 > self.max_region:
+                return False
+            pos = self._wrap()
+        buffer = self.buffer
+        if not (self.running_status and status == self._last_status):
+            buffer[pos] = status
+            pos += 1
+            self._last_status = status
+        buffer[pos] = data1
+        pos += 1
+        if data2 is not None:
+            buffer[pos] = data2
+            pos += 1
+        self.pos = pos
+        return True
+
+    def realtime(self, status):
+        """Encode a one-byte system real-time message; returns False if the region is full"""
+        pos = self.pos
+        if pos > self.limit:
+            if pos - self.start + 3 > self.max_region:
+                return False
+            pos = self._wrap()
+        self.buffer[pos] = status
+        self.pos = pos + 1
+        return True
+
+    def note_on(self, note, velocity, channel=0):
+        return self.write(NOTE_ON_STATUS[channel & 0x0F], note, velocity)
+
+    def note_off(self, note, velocity=0, channel=0):
+        return self.write(NOTE_OFF_STATUS[channel & 0x0F], note, velocity)
+
+    def control_change(self, controller, value, channel=0):
+        return self.write(CONTROL_CHANGE_STATUS[channel & 0x0F], controller, value)
+
+    def program_change(self, program, channel=0):
+        return self.write(PROGRAM_CHANGE_STATUS[channel & 0x0F], program)
+
+    def pitch_bend(self, value, channel=0):
+        return self.write(PITCH_BEND_STATUS[channel & 0x0F], value & 0x7F, (value >> 7) & 0x7F)
+
+    def take(self):
+        """Return (offset, length) of the pending region and start a new one"""
+        offset = self.start
+        length = self.pos - offset
+        self._restart(self.pos)
+        return offset, length
+
+    def send_to(self, port, timestamp=None):
+        """Hand the pending region to port.send() in place and start a new one.
+
+        Passes the ring with an offset instead of a slice, so nothing is
+        copied or allocated on the Python side.  Returns the bytes sent.
+        """
+        offset = self.start
+        pos = self.pos
+        length = pos - offset
+        self.start = pos
+        self.limit = self._limit_from(pos)
+        self._last_status = 0
+        if length:
+            if timestamp is None:
+                port.send(self.buffer, offset, length)
+            else:
+                port.send(self.buffer, offset, length, timestamp)
+        return length
+
+    def _restart(self, start):
+        self.start = start
+        self.limit = self._limit_from(start)
+        self._last_status = 0
+
+    def _limit_from(self, start):
+        # Written so no intermediate value exceeds the ring size (small ints only)
+        if start < self.size - self.max_region:
+            return start + self.max_region - 3
+        return self.size - 3
+
+    def _wrap(self):
+        """Restart at the head of the ring, carrying any pending bytes along"""
+        pending = self.pos - self.start
+        if pending:
+            self.view[0:pending] = self.view[self.start:self.pos]
+        last_status = self._last_status
+        self._restart(0)
+        self._last_status = last_status
+        self.pos = pending
+        return pending
+
+
+UNSENT = 0xFF  # Marks a controller whose value is unknown to the receiver
+
+
+class ControllerCache:
+    """Last transmitted value per (channel, controller), for skipping redundant CCs.
+
+    With a refresh interval the whole cache is forgotten periodically, so
+    every controller is re-sent once in a while (e.g. after the synth was
+    power-cycled or a value was changed on its front panel).
+    """
+
+    def __init__(self, refresh_interval_ms=None):
+        self._blank = bytes([UNSENT]) * (16 * 128)
+        self.values = bytearray(self._blank)
+        self.refresh_interval_ns = int(refresh_interval_ms * 1_000_000) if refresh_interval_ms else 0
+        self.suppressed = 0
+        self._refresh_due = 0
+
+    def should_send(self, controller, value, channel=0):
+        """Record the value and return True if it differs from the last one sent"""
+        if self.refresh_interval_ns:
+            now = time.perf_counter_ns()
+            if now >= self._refresh_due:
+                self.reset()
+                self._refresh_due = now + self.refresh_interval_ns
+        slot = ((channel & 0x0F) << 7) | (controller & 0x7F)
+        if self.values[slot] == value:
+            self.suppressed += 1
+            return False
+        self.values[slot] = value
+        return True
+
+    def reset(self):
+        """Forget every value, so each controller is sent again on next use"""
+        self.values[:] = self._blank
@@ -1,17 +1,130 @@
+"""
+Android MIDI driver.
+
+Device discovery and opening run on a background worker thread, so app start
+never waits for openDevice() to call back (an open that never completes
+just times out and is logged).  A DeviceCallback keeps the pool in step with
+hot-plugging: new devices are opened as they appear, and the ports of a
+removed device are held under their names (see midi_ports.HeldPort) until it
+comes back, when routing resumes where it left off.  A port that fails on
+send without the device being reported removed gets the same treatment, and
+the worker then closes and reopens its device, backing off from
+RECONNECT_DELAY to RECONNECT_MAX_DELAY between attempts until it opens or
+is removed.  When the device sending us clock goes away the next device with
+an output port takes over.  Off Android everything runs in mock mode and
+sends are only logged.
+"""
+import queue
+import threading
+import traceback
+from contextlib import contextmanager
 from kivy.utils import platform
+from event_log import log, DEBUG
+from midi_buffer import (NOTE_ON_STATUS, NOTE_OFF_STATUS, CONTROL_CHANGE_STATUS, PROGRAM_CHANGE_STATUS,
+                         PITCH_BEND_STATUS, CLOCK)
+from midi_ports import PortPool
+
+DEVICE_OPEN_TIMEOUT = 5.0  # Seconds to wait for openDevice() to call back
+RECONNECT_DELAY = 0.5  # Seconds before the first reopen of a failed device, doubled per attempt
+RECONNECT_MAX_DELAY = 30.0
+
+
+def _clock_receiver(callback):
+    """Java ClockReceiver that calls callback(status, timestamp_ns) per clock/transport byte"""
+    from jnius import autoclass, PythonJavaClass, java_method
+
+    class ClockListener(PythonJavaClass):
+        __javainterfaces__ = ['org/isogrid/midi/ClockReceiver$Listener']
+        __javacontext__ = 'app'
+
+        @java_method('(IJ)V')
+        def onRealtime(self, status, timestamp):
+            callback(status, timestamp)
+
+    listener = ClockListener()
+    # The listener must stay referenced from Python for as long as Java uses it
+    return autoclass('org.isogrid.midi.ClockReceiver')(listener), listener
+
+
+def _device_callback(on_added, on_removed):
+    """Java DeviceCallbackBridge that calls on_added(info) / on_removed(info) on hot-plug"""
+    from jnius import autoclass, PythonJavaClass, java_method
+
+    class DeviceListener(PythonJavaClass):
+        __javainterfaces__ = ['org/isogrid/midi/DeviceCallbackBridge$Listener']
+        __javacontext__ = 'app'
+
+        @java_method('(Landroid/media/midi/MidiDeviceInfo;)V')
+        def onDeviceAdded(self, info):
+            on_added(info)
+
+        @java_method('(Landroid/media/midi/MidiDeviceInfo;)V')
+        def onDeviceRemoved(self, info):
+            on_removed(info)
+
+    listener = DeviceListener()
+    return autoclass('org.isogrid.midi.DeviceCallbackBridge')(listener), listener
+
+
+def _open_listener(callback):
+    """MidiManager.OnDeviceOpenedListener calling callback(device); device is None on failure"""
+    from jnius import PythonJavaClass, java_method
+
+    class OpenListener(PythonJavaClass):
+        __javainterfaces__ = ['android/media/midi/MidiManager$OnDeviceOpenedListener']
+        __javacontext__ = 'app'
+
+        @java_method('(Landroid/media/midi/MidiDevice;)V')
+        def onDeviceOpened(self, device):
+            callback(device)
+
+    return OpenListener()
+
 
 class MidiDriver:
-    def __init__(self):
-        self.device = None
-        self.input_port = None
+    def __init__(self, running_status=False, suppress_redundant_cc=True, cc_refresh_ms=None, reconnect_buffer=0):
+        self.devices = {}  # MidiDeviceInfo id -> (MidiDevice, names of its ports, MidiDeviceInfo)
         self.output_port = None
+        # Receives MIDI clock/transport from the device: on_realtime(status, timestamp_ns)
+        self.clock_handler = None
+        self._clock_receiver = None
+        self._clock_device_id = None
         self.is_mock_mode = platform != 'android'
+        # Every opened input port, by name.  Each encodes in place into its own
+        # preallocated ring; messages sent between begin_batch()/end_batch()
+        # share one write per port.  CCs whose value equals the last one sent
+        # to that port are skipped; with cc_refresh_ms every controller is
+        # re-sent at least that often.  While a device reconnects the latest
+        # value of up to reconnect_buffer controllers per port is kept for it.
+        self.ports = PortPool(running_status, suppress_redundant_cc, cc_refresh_ms, reconnect_buffer)
+        self.ports.on_failure = self._on_port_failed
+        self._reconnecting = {}  # MidiDeviceInfo id -> MidiDeviceInfo of failed devices being reopened
+        self._midi_service = None
+        self._device_callback = None
+        self._java_refs = []  # Python listeners Java still holds on to; open listeners leave once called back
+        self._tasks = queue.Queue()
+        self._worker = None
 
     def setup(self):
+        """Start device discovery; returns at once, devices open on a background worker"""
         if platform == 'android':
-            self._setup_android()
+            self._worker = threading.Thread(target=self._run_worker, name='MidiDeviceWorker', daemon=True)
+            self._worker.start()
+            self._tasks.put(self._setup_android)
         else:
-            print("[MOCK] MIDI Setup Complete (Simulation Mode)")
+            log.info('MOCK', "MIDI Setup Complete (Simulation Mode)")
+
+    def _run_worker(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            try:
+                task()
+            except Exception as e:
+                log.error('ERROR', "MIDI device task failed: %s", e)
+                if log.enabled_for(DEBUG):
+                    log.debug('ERROR', "Traceback: %s", traceback.format_exc())
 
     def _setup_android(self):
         try:
@@ -19,116 +132,299 @@ class MidiDriver:
             # Get Android Context & MIDI Service
             Context = autoclass('android.content.Context')
             PythonActivity = autoclass('org.kivy.android.PythonActivity')
-            midi_service = PythonActivity.mActivity.getSystemService(Context.MIDI_SERVICE)
-
-            # Get available MIDI devices
-            devices = midi_service.getDevices()
-            if devices.length > 0:
-                # Attempt to open the first device
-                device_info = midi_service.getInfo(devices[0])
-                print(f"[ANDROID] Found MIDI device: {device_info.getName()}")
-
-                def on_device_opened(device):
-                    if device is not None:
-                        self.device = device
-                        # Open input and output ports
-                        # For sending MIDI data, we need input ports
-                        for port_num in range(device.getNumInputPorts()):
-                            self.input_port = device.openInputPort(port_num)
-                            if self.input_port:
-                                break
-
-                        if self.input_port:
-                            print("[ANDROID] MIDI Input Port opened successfully")
-                        else:
-                            print("[ANDROID] Failed to open MIDI Input Port")
-                            self.is_mock_mode = True
-                    else:
-                        print("[ANDROID] Failed to open MIDI device")
-                        self.is_mock_mode = True
-
-                # Open the device asynchronously
-                midi_service.openDevice(devices[0], on_device_opened, None)
-            else:
-                print("[ANDROID] No MIDI devices found, falling back to mock mode")
-                self.is_mock_mode = True
+            self._midi_service = PythonActivity.mActivity.getSystemService(Context.MIDI_SERVICE)
+
+            # Hot-plug events are handed to the worker, like the initial scan
+            tasks = self._tasks
+            self._device_callback, listener = _device_callback(
+                lambda info: tasks.put(lambda: self._open_device(info)),
+                lambda info: tasks.put(lambda: self._close_device(info)))
+            self._java_refs.append(listener)
+            self._midi_service.registerDeviceCallback(self._device_callback, None)
         except Exception as e:
-            print(f"[ERROR] Failed to setup Android MIDI: {str(e)}")
-            print("[ERROR] Traceback:", __import__('traceback').format_exc())
+            log.error('ERROR', "Failed to setup Android MIDI: %s", e)
+            if log.enabled_for(DEBUG):
+                log.debug('ERROR', "Traceback: %s", traceback.format_exc())
             self.is_mock_mode = True
+            return
+
+        # Open every available MIDI device (USB and Bluetooth LE alike)
+        devices = self._midi_service.getDevices()
+        if not devices:
+            log.warning('ANDROID', "No MIDI devices found yet, waiting for one to be connected")
+        for device_info in devices:
+            self._open_device(device_info)
+
+    def _device_name(self, device_info):
+        from jnius import autoclass
+        MidiDeviceInfo = autoclass('android.media.midi.MidiDeviceInfo')
+        return device_info.getProperties().getString(MidiDeviceInfo.PROPERTY_NAME) or 'MIDI'
+
+    def _open_device(self, device_info):
+        """Open a device and add its input ports to the pool (worker thread); False if it failed"""
+        from jnius import autoclass
+        MidiDeviceInfo = autoclass('android.media.midi.MidiDeviceInfo')
+        device_id = device_info.getId()
+        if device_id in self.devices:
+            return True
+        name = self._device_name(device_info)
+        queued = device_info.getType() == MidiDeviceInfo.TYPE_BLUETOOTH
+        log.info('ANDROID', "Found MIDI device: %s", name)
+
+        opened = threading.Event()
+        result = []
+
+        def on_device_opened(device):
+            # Java is done with the listener once it has called back, even late
+            self._java_refs.remove(listener)
+            if opened.is_set() and device is not None:
+                device.close()  # Called back after we gave up on it
+                return
+            result.append(device)
+            opened.set()
+
+        listener = _open_listener(on_device_opened)
+        self._java_refs.append(listener)
+        self._midi_service.openDevice(device_info, listener, None)
+        if not opened.wait(DEVICE_OPEN_TIMEOUT):
+            opened.set()
+            log.error('ANDROID', "MIDI device %s did not open within %s s", name, DEVICE_OPEN_TIMEOUT)
+            return False
+        device = result[0]
+        if device is None:
+            log.error('ANDROID', "Failed to open MIDI device %s", name)
+            return False
+
+        # For sending MIDI data we need the device's input ports
+        names = []
+        count = device.getNumInputPorts()
+        for port_num in range(count):
+            port = device.openInputPort(port_num)
+            if port:
+                port_name = name if count == 1 else f'{name} {port_num + 1}'
+                self.ports.add(port_name, port, queued=queued)
+                names.append(port_name)
+                log.info('ANDROID', "MIDI port %s opened%s", port_name, " (queued)" if queued else "")
+            else:
+                log.error('ANDROID', "Failed to open input port %s of %s", port_num, name)
+        self.devices[device_id] = (device, names, device_info)
+        self._reconnecting.pop(device_id, None)
+
+        if self.output_port is None:
+            self._listen_for_clock(device_id, device, name)
+        return True
 
-    def send_note_on(self, note, velocity=127, channel=0):
-        """Send a MIDI Note ON message"""
-        if not self.is_mock_mode and self.input_port:
+    def _listen_for_clock(self, device_id, device, name):
+        """Take the device's first output port (what it sends us: clock, transport) as the clock source"""
+        for port_num in range(device.getNumOutputPorts()):
+            self.output_port = device.openOutputPort(port_num)
+            if self.output_port:
+                self._clock_receiver = _clock_receiver(self._on_realtime)
+                self.output_port.connect(self._clock_receiver[0])
+                self._clock_device_id = device_id
+                log.info('ANDROID', "Listening for MIDI clock from %s", name)
+                return True
+        self.output_port = None
+        return False
+
+    def _close_device(self, device_info):
+        """Hold the ports of a removed device until it reconnects (worker thread)"""
+        device_id = device_info.getId()
+        self._reconnecting.pop(device_id, None)  # Removed for good: stop reopening it
+        self._release_device(device_id)
+
+    def _release_device(self, device_id):
+        """Close a device, holding its ports and handing the clock source to another device"""
+        entry = self.devices.pop(device_id, None)
+        if entry is None:
+            return
+        device, names, _ = entry
+        for name in names:
+            self.ports.disconnect(name)
+        if self._clock_device_id == device_id:
+            self._close_output_port()
+            for other_id, (other, _, other_info) in self.devices.items():
+                if self._listen_for_clock(other_id, other, self._device_name(other_info)):
+                    break
+        try:
+            device.close()
+        except Exception as e:
+            log.warning('WARNING', "Failed to close MIDI device: %s", e)
+        log.info('ANDROID', "MIDI device closed, holding %s until it reconnects", ', '.join(names) or 'nothing')
+
+    def _on_port_failed(self, name):
+        """A port failed on send (clock or sender thread): reopen its device on the worker"""
+        self._tasks.put(lambda: self._restart_device(name))
+
+    def _restart_device(self, port_name):
+        for device_id, (_, names, device_info) in self.devices.items():
+            if port_name in names:
+                break
+        else:
+            return  # Already closed, e.g. removed meanwhile
+        log.warning('ANDROID', "Reopening MIDI device of %s after a failed send", port_name)
+        self._release_device(device_id)
+        self._reconnecting[device_id] = device_info
+        self._schedule_reopen(device_id, 0)
+
+    def _reopen_device(self, device_id, attempt):
+        device_info = self._reconnecting.get(device_id)
+        if device_info is None or self._worker is None:
+            return  # Removed, reopened by a hot-plug callback, or shutting down
+        if self._open_device(device_info):
+            log.info('ANDROID', "MIDI device reopened after %s attempt(s)", attempt + 1)
+        else:
+            self._schedule_reopen(device_id, attempt + 1)
+
+    def _schedule_reopen(self, device_id, attempt):
+        """Queue reopen attempt number `attempt` on the worker after its backoff delay"""
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_DELAY * 2 ** attempt)
+        log.info('ANDROID', "Reopening MIDI device in %.1f s", delay)
+        retry = threading.Timer(delay, self._tasks.put, args=(lambda: self._reopen_device(device_id, attempt),))
+        retry.daemon = True
+        retry.start()
+
+    def _close_output_port(self):
+        if self.output_port is not None:
+            try:
+                self.output_port.close()
+            except Exception as e:
+                log.warning('WARNING', "Failed to close MIDI output port: %s", e)
+        self.output_port = None
+        self._clock_receiver = None
+        self._clock_device_id = None
+
+    def _on_realtime(self, status, timestamp):
+        """Clock/transport byte from the device (MIDI receive thread)"""
+        handler = self.clock_handler
+        if handler is not None:
+            try:
+                handler.on_realtime(status, timestamp)
+            except Exception as e:
+                log.error('ERROR', "Failed to handle MIDI clock message 0x%X: %s", status, e)
+
+    def begin_batch(self, timestamp=None):
+        """Queue the following messages into one buffer per port until end_batch().
+
+        All messages in a batch are written with a single send() per port and
+        share the batch timestamp, which replaces any per-message timestamp.
+        """
+        self.ports.begin_batch(timestamp)
+
+    def end_batch(self):
+        """Close the batch opened by begin_batch() and flush it"""
+        self.ports.end_batch()
+
+    @contextmanager
+    def batch(self, timestamp=None):
+        """Context manager form of begin_batch()/end_batch()"""
+        self.begin_batch(timestamp)
+        try:
+            yield self
+        finally:
+            self.end_batch()
+
+    def flush(self):
+        """Write any queued batch messages, one send per port"""
+        try:
+            self.ports.flush()
+        except Exception as e:
+            log.error('ERROR', "Failed to flush MIDI batch: %s", e)
+
+    def send_note_on(self, note, velocity=127, channel=0, timestamp=None, destination=None):
+        """Send a MIDI Note ON message (to the default port unless a destination is named)"""
+        port = self.ports.get(destination)
+        if not self.is_mock_mode and port is not None:
             try:
                 # 0x90 + channel = Note On for specified channel
-                status_byte = 0x90 | (channel & 0x0F)
-                data = [status_byte, note, velocity]
-                self.input_port.send(bytearray(data), 0, len(data))
+                port.write(NOTE_ON_STATUS[channel & 0x0F], note, velocity, timestamp)
             except Exception as e:
-                print(f"[ERROR] Failed to send MIDI note ON: {str(e)}")
                 # Don't switch to mock mode here to prevent constant toggling
-                # Just print the error and continue
-                print(f"[MOCK] Note ON: {note} (velocity: {velocity}, channel: {channel}) - sent as mock due to error")
+                # Just log the error and continue
+                log.error('ERROR', "Failed to send MIDI note ON %s: %s", note, e)
         else:
-            print(f"[MOCK] Note ON: {note} (velocity: {velocity}, channel: {channel})")
+            log.debug('MOCK', "Note ON: %s (velocity: %s, channel: %s)", note, velocity, channel)
 
-    def send_note_off(self, note, channel=0):
+    def send_note_off(self, note, channel=0, timestamp=None, destination=None):
         """Send a MIDI Note OFF message"""
-        if not self.is_mock_mode and self.input_port:
+        port = self.ports.get(destination)
+        if not self.is_mock_mode and port is not None:
             try:
                 # 0x80 + channel = Note Off for specified channel
-                status_byte = 0x80 | (channel & 0x0F)
-                data = [status_byte, note, 0]
-                self.input_port.send(bytearray(data), 0, len(data))
+                port.write(NOTE_OFF_STATUS[channel & 0x0F], note, 0, timestamp)
             except Exception as e:
-                print(f"[ERROR] Failed to send MIDI note OFF: {str(e)}")
-                print(f"[MOCK] Note OFF: {note}, channel: {channel} - sent as mock due to error")
+                log.error('ERROR', "Failed to send MIDI note OFF %s: %s", note, e)
         else:
-            print(f"[MOCK] Note OFF: {note}, channel: {channel}")
+            log.debug('MOCK', "Note OFF: %s, channel: %s", note, channel)
 
-    def send_cc(self, controller, value, channel=0):
-        """Send a MIDI Control Change message"""
-        if not self.is_mock_mode and self.input_port:
+    def send_cc(self, controller, value, channel=0, timestamp=None, destination=None):
+        """Send a MIDI Control Change message (skipped if the port already has the value)"""
+        port = self.ports.get(destination)
+        if not self.is_mock_mode and port is not None:
+            if port.cc_cache is not None and not port.cc_cache.should_send(controller, value, channel):
+                return
             try:
                 # 0xB0 + channel = Control Change for specified channel
-                status_byte = 0xB0 | (channel & 0x0F)
-                data = [status_byte, controller, value]
-                self.input_port.send(bytearray(data), 0, len(data))
+                port.write(CONTROL_CHANGE_STATUS[channel & 0x0F], controller, value, timestamp)
             except Exception as e:
-                print(f"[ERROR] Failed to send MIDI CC: {str(e)}")
-                print(f"[MOCK] CC {controller} on ch.{channel}: {value} - sent as mock due to error")
+                log.error('ERROR', "Failed to send MIDI CC %s: %s", controller, e)
         else:
-            print(f"[MOCK] CC {controller} on ch.{channel}: {value}")
+            log.debug('MOCK', "CC %s on ch.%s: %s", controller, channel, value)
 
-    def send_program_change(self, program, channel=0):
+    def send_program_change(self, program, channel=0, timestamp=None, destination=None):
         """Send a MIDI Program Change message"""
-        if not self.is_mock_mode and self.input_port:
+        port = self.ports.get(destination)
+        if not self.is_mock_mode and port is not None:
             try:
                 # 0xC0 + channel = Program Change for specified channel
-                status_byte = 0xC0 | (channel & 0x0F)
-                data = [status_byte, min(127, max(0, program))]
-                self.input_port.send(bytearray(data), 0, len(data))
+                port.write(PROGRAM_CHANGE_STATUS[channel & 0x0F], min(127, max(0, program)), None, timestamp)
             except Exception as e:
-                print(f"[ERROR] Failed to send MIDI PC: {str(e)}")
-                print(f"[MOCK] PC {program} on ch.{channel} - sent as mock due to error")
+                log.error('ERROR', "Failed to send MIDI PC %s: %s", program, e)
         else:
-            print(f"[MOCK] PC {program} on ch.{channel}")
+            log.debug('MOCK', "PC %s on ch.%s", program, channel)
 
-    def send_pitch_bend(self, value, channel=0):
+    def send_pitch_bend(self, value, channel=0, timestamp=None, destination=None):
         """Send a MIDI Pitch Bend message (0-16383, centered at 8192)"""
-        if not self.is_mock_mode and self.input_port:
+        port = self.ports.get(destination)
+        if not self.is_mock_mode and port is not None:
             try:
                 # 0xE0 + channel = Pitch Bend for specified channel
-                status_byte = 0xE0 | (channel & 0x0F)
                 # Convert 0-16383 value to LSB and MSB
                 value = min(16383, max(0, value))
-                lsb = value & 0x7F
-                msb = (value >> 7) & 0x7F
-                data = [status_byte, lsb, msb]
-                self.input_port.send(bytearray(data), 0, len(data))
+                port.write(PITCH_BEND_STATUS[channel & 0x0F], value & 0x7F, (value >> 7) & 0x7F, timestamp)
             except Exception as e:
-                print(f"[ERROR] Failed to send MIDI Pitch Bend: {str(e)}")
-                print(f"[MOCK] PB {value} on ch.{channel} - sent as mock due to error")
+                log.error('ERROR', "Failed to send MIDI Pitch Bend %s: %s", value, e)
         else:
-            print(f"[MOCK] PB {value} on ch.{channel}")
\ No newline at end of file
+            log.debug('MOCK', "PB %s on ch.%s", value, channel)
+
+    def send_realtime(self, status, timestamp=None):
+        """Send a one-byte system real-time message (0xF8 clock, 0xFA start, 0xFC stop) to every port"""
+        if not self.is_mock_mode and len(self.ports):
+            for port in self.ports:
+                try:
+                    port.realtime(status, timestamp)
+                except Exception as e:
+                    log.error('ERROR', "Failed to send MIDI real-time 0x%X to %s: %s", status, port.name, e)
+        elif status != CLOCK:  # 24 per beat would flood the debug log
+            log.debug('MOCK', "Real-time 0x%X", status)
+
+    def close(self):
+        """Stop the device worker and close every port and device"""
+        if self._worker is not None:
+            self._tasks.put(None)
+            self._worker.join(DEVICE_OPEN_TIMEOUT)
+            self._worker = None
+        if self._device_callback is not None:
+            try:
+                self._midi_service.unregisterDeviceCallback(self._device_callback)
+            except Exception as e:
+                log.warning('WARNING', "Failed to unregister MIDI device callback: %s", e)
+            self._device_callback = None
+        self.ports.close()
+        self._close_output_port()
+        for device, _, _ in self.devices.values():
+            try:
+                device.close()
+            except Exception as e:
+                log.warning('WARNING', "Failed to close MIDI device: %s", e)
+        self.devices = {}
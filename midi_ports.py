@@ -0,0 +1,356 @@
+"""
+Output port pool and routing.
+
+Every opened device input port (the direction we send on) becomes a named
+MidiPort with its own encoder ring and controller cache, so batches for
+different synths never share a buffer and a CC suppressed on one synth is
+still sent to another.  Ports on slow links (Bluetooth LE) get a PortSender:
+their batches are copied into a small queue and written by a thread of their
+own, so a stalled link delays only itself.  When that queue is full, new
+batches are dropped rather than old ones, except batches that end notes or
+stop the clock: losing those would leave notes hanging on the synth.  USB
+ports are written inline.
+
+RoutingTable says which named port each kind of event goes to: the X and Y
+position CCs, and the events of individual steps.  Anything unrouted goes to
+the table's default, and failing that to the pool's default port (the first
+one opened).
+
+When a device goes away (unplugged, or its port fails on send) its ports are
+swapped for HeldPorts under the same names, so sends neither raise nor
+reach a dead port while it reconnects; a failed send is also reported
+through PortPool.on_failure, so the owner can reopen the device.  With a reconnect buffer the latest
+controller, program and pitch-bend messages are kept and replayed when the
+port comes back, so the synth returns in the right state.  Only the latest
+message per controller (and per program, pressure or pitch-bend status) is
+kept, so a stream of position CCs cannot push out a parameter lock set
+bars earlier.  Notes and clock are always dropped, since they would only
+sound late.
+
+Ports are added and removed from the device worker thread while the clock
+thread sends, so the pool replaces its dict and list instead of mutating
+them; a sender iterating the old list is unaffected.
+"""
+import collections
+import threading
+
+from event_log import log
+from midi_buffer import MidiEncoder, ControllerCache, STOP
+
+DEFAULT_QUEUE_SIZE = 64
+
+
+def _holds_release(data):
+    """True if an encoded batch holds a note-off (or note-on at velocity 0) or a Stop"""
+    status = 0
+    position = 0
+    end = len(data)
+    while position < end:
+        byte = data[position]
+        if byte >= 0xF8:  # Real-time bytes sit outside running status
+            if byte == STOP:
+                return True
+            position += 1
+            continue
+        if byte & 0x80:
+            status = byte
+            position += 1
+        kind = status & 0xF0
+        if kind == 0x80 or (kind == 0x90 and position + 1 < end and data[position + 1] == 0):
+            return True
+        position += 1 if kind in (0xC0, 0xD0) else 2
+    return False
+
+
+class PortSender:
+    """Background writer for one port; batches queue up instead of blocking the caller"""
+
+    def __init__(self, port, name, capacity=DEFAULT_QUEUE_SIZE, on_failure=None):
+        self.port = port
+        self.name = name
+        self.on_failure = on_failure  # Called with the exception when a send fails
+        self.capacity = capacity
+        self.dropped = 0  # Batches dropped because the link fell behind
+        self._queue = collections.deque()
+        self._ready = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f'MidiPortSender-{name}', daemon=True)
+        self._thread.start()
+
+    def put(self, data, timestamp=None):
+        queue = self._queue
+        if len(queue) >= self.capacity and not _holds_release(data):
+            self.dropped += 1
+            return
+        queue.append((data, timestamp))
+        self._ready.set()
+
+    def stop(self):
+        self._running = False
+        self._ready.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        queue = self._queue
+        while self._running:
+            self._ready.wait()
+            self._ready.clear()
+            while queue:
+                try:
+                    data, timestamp = queue.popleft()
+                except IndexError:
+                    break
+                try:
+                    if timestamp is None:
+                        self.port.send(data, 0, len(data))
+                    else:
+                        self.port.send(data, 0, len(data), timestamp)
+                except Exception as e:
+                    if self.on_failure is None:
+                        log.error('ERROR', "Failed to send to MIDI port %s: %s", self.name, e)
+                    else:
+                        self.on_failure(e)
+
+
+class MidiPort:
+    """One open destination: a device input port with its own encoder and CC cache"""
+
+    def __init__(self, name, port, running_status=False, cc_cache=None, queued=False, on_failure=None):
+        self.name = name
+        self.port = port
+        self.encoder = MidiEncoder(running_status=running_status)
+        self.cc_cache = cc_cache
+        self.on_failure = on_failure  # Called with the name once a send fails
+        self.failed = False
+        self.sender = PortSender(port, name, on_failure=self._fail) if queued else None
+
+    def begin_batch(self, timestamp=None):
+        self.encoder.begin(timestamp)
+
+    def end_batch(self):
+        if self.encoder.end():
+            self.flush()
+
+    def flush(self):
+        """Send the pending region, if any"""
+        if self.encoder.pending:
+            self._send_pending(self.encoder.timestamp)
+
+    def write(self, status, data1, data2, timestamp=None):
+        """Encode a message into the open batch, or send it straight away"""
+        encoder = self.encoder
+        if not encoder.write(status, data1, data2):
+            # Batch region is full: send what we have and start a new one
+            self._send_pending(encoder.timestamp)
+            encoder.write(status, data1, data2)
+        if not encoder.active:
+            self._send_pending(timestamp)
+
+    def realtime(self, status, timestamp=None):
+        """Encode a one-byte system real-time message, batched like write()"""
+        encoder = self.encoder
+        if not encoder.realtime(status):
+            self._send_pending(encoder.timestamp)
+            encoder.realtime(status)
+        if not encoder.active:
+            self._send_pending(timestamp)
+
+    def close(self):
+        if self.sender is not None:
+            self.sender.stop()
+        try:
+            self.port.close()
+        except Exception as e:
+            log.warning('WARNING', "Failed to close MIDI port %s: %s", self.name, e)
+
+    def _send_pending(self, timestamp=None):
+        encoder = self.encoder
+        if self.sender is None:
+            # Ring and offset are handed over in place (see MidiEncoder.send_to)
+            try:
+                encoder.send_to(self.port, timestamp)
+            except Exception as e:
+                self._fail(e)
+        else:
+            offset, length = encoder.take()
+            if length:
+                self.sender.put(bytes(encoder.buffer[offset:offset + length]), timestamp)
+
+    def _fail(self, error):
+        """Report a dead port once, instead of raising on every send"""
+        if self.failed:
+            return
+        self.failed = True
+        log.error('ERROR', "MIDI port %s failed, holding its output until it reconnects: %s", self.name, error)
+        if self.on_failure is not None:
+            self.on_failure(self.name)
+
+
+class HeldPort:
+    """Stands in for a port while its device reconnects; nothing reaches a device"""
+
+    sender = None
+    cc_cache = None
+
+    def __init__(self, name, buffer_size=0):
+        self.name = name
+        self.dropped = 0
+        self.buffer_size = buffer_size  # Most distinct controllers/statuses kept
+        # (status, controller) or status -> latest (status, data1, data2), oldest change first
+        self.buffer = {} if buffer_size else None
+
+    def begin_batch(self, timestamp=None):
+        pass
+
+    def end_batch(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def write(self, status, data1, data2, timestamp=None):
+        # Notes would only sound late; state-carrying messages are kept if buffering
+        buffer = self.buffer
+        if buffer is None or status < 0xB0:
+            self.dropped += 1
+            return
+        # CCs per controller number; program change, pressure and pitch bend per channel
+        key = (status, data1) if status < 0xC0 else status
+        if key in buffer:
+            del buffer[key]  # Re-added last, so the replay keeps the order of the latest changes
+        elif len(buffer) == self.buffer_size:
+            del buffer[next(iter(buffer))]
+            self.dropped += 1
+        buffer[key] = (status, data1, data2)
+
+    def realtime(self, status, timestamp=None):
+        self.dropped += 1
+
+    def close(self):
+        pass
+
+
+class PortPool:
+    """Named open output ports; the first one added is the default destination"""
+
+    def __init__(self, running_status=False, suppress_redundant_cc=True, cc_refresh_ms=None, reconnect_buffer=0):
+        self.running_status = running_status
+        self.suppress_redundant_cc = suppress_redundant_cc
+        self.cc_refresh_ms = cc_refresh_ms
+        self.reconnect_buffer = reconnect_buffer  # Messages kept per held port (0 drops them all)
+        self.on_failure = None  # Called with a port's name once it failed on send and is held
+        self.default = None
+        self._ports = {}
+        self._list = []
+
+    def __len__(self):
+        return len(self._list)
+
+    def __iter__(self):
+        return iter(self._list)
+
+    def names(self):
+        return [port.name for port in self._list]
+
+    def get(self, name=None):
+        """The named port, or the default one for None (None if there is no such port)"""
+        if name is None:
+            return self.default
+        return self._ports.get(name)
+
+    def add(self, name, port, queued=False):
+        """Open a destination for port under name; a port already using the name is replaced
+
+        A held port of that name hands over the messages it buffered.
+        """
+        cc_cache = ControllerCache(self.cc_refresh_ms) if self.suppress_redundant_cc else None
+        midi_port = MidiPort(name, port, self.running_status, cc_cache, queued, on_failure=self._port_failed)
+        old = self._replace(name, midi_port)
+        if old is not None:
+            old.close()
+            if isinstance(old, HeldPort) and old.buffer:
+                log.info('MIDI', "Replaying %s held messages to %s", len(old.buffer), name)
+                midi_port.begin_batch()
+                for status, data1, data2 in list(old.buffer.values()):
+                    midi_port.write(status, data1, data2)
+                midi_port.end_batch()
+        return midi_port
+
+    def disconnect(self, name):
+        """Close a port whose device went away, holding its name (and default role) for a reconnect"""
+        old = self._ports.get(name)
+        if old is None or isinstance(old, HeldPort):
+            return False
+        self._replace(name, HeldPort(name, self.reconnect_buffer))
+        old.close()
+        return True
+
+    def _port_failed(self, name):
+        if self.disconnect(name) and self.on_failure is not None:
+            self.on_failure(name)
+
+    def _replace(self, name, new):
+        old = self._ports.get(name)
+        ports = dict(self._ports)
+        ports[name] = new
+        self._ports = ports
+        self._list = list(ports.values())
+        if self.default is None or self.default is old:
+            self.default = new
+        return old
+
+    def remove(self, name):
+        """Close and forget a destination; returns False if there was none by that name"""
+        old = self._ports.get(name)
+        if old is None:
+            return False
+        ports = dict(self._ports)
+        del ports[name]
+        self._ports = ports
+        self._list = list(ports.values())
+        if self.default is old:
+            self.default = self._list[0] if self._list else None
+        old.close()
+        return True
+
+    def begin_batch(self, timestamp=None):
+        for port in self._list:
+            port.begin_batch(timestamp)
+
+    def end_batch(self):
+        for port in self._list:
+            port.end_batch()
+
+    def flush(self):
+        for port in self._list:
+            port.flush()
+
+    def close(self):
+        for port in self._list:
+            port.close()
+        self._ports = {}
+        self._list = []
+        self.default = None
+
+
+class RoutingTable:
+    """Destination port name per event source; None falls back to the default"""
+
+    def __init__(self, default=None):
+        self.default = default
+        self.x_axis = None  # X position CC
+        self.y_axis = None  # Y position CC
+        self.steps = {}  # Step index -> port name
+
+    def set_step(self, index, destination):
+        if destination is None:
+            self.steps.pop(index, None)
+        else:
+            self.steps[index] = destination
+
+    def resolve(self, step_index):
+        """(X CC, Y CC, step) destinations for a tick that played step_index"""
+        default = self.default
+        return (self.x_axis or default, self.y_axis or default,
+                self.steps.get(step_index, default) if self.steps else default)
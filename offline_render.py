@@ -0,0 +1,103 @@
+"""
+Offline render of the sequencer to a Standard MIDI File.
+
+The engine is ticked as fast as the CPU allows instead of by the clock, and
+every step's events (position CCs, parameter locks and notes, with the same
+gate length as live playback) are streamed straight into a .mid file.  With
+a seed the render is reproducible, probabilities and Random drivers
+included.  Steps land on the master clock pulse the engine reports, so
+per-axis speeds render exactly as they play.
+
+    python offline_render.py take.mid --bars 1000 --x-mode Random --y-mode Euclidean --seed 7
+"""
+import heapq
+import time
+
+from event_scheduler import DEFAULT_GATE_MS
+from sequencer_engine import (SequencerEngine, NOTE_ON, NOTE_OFF, CONTROL_CHANGE,
+                              X_DRIVER_MODES, Y_DRIVER_MODES, CC_LABELS, GRID_SIZES,
+                              AXIS_SPEEDS, DEFAULT_SPEED, MASTER_PPQN)
+from smf_writer import SmfWriter, DEFAULT_PPQN
+
+
+def render_to_smf(engine, path, bars=16, tempo=120, beats_per_bar=4,
+                  gate_ms=DEFAULT_GATE_MS, ppqn=DEFAULT_PPQN, channel=0):
+    """Tick the engine for a number of bars and write what it plays; returns a summary"""
+    gate_ticks = max(1, int(round(gate_ms / 1000 * tempo / 60 * ppqn)))
+    total_pulses = bars * beats_per_bar * MASTER_PPQN
+    pulse = 0
+    step_count = 0
+    note_offs = []  # Heap of (tick, note) for notes still sounding
+    notes = 0
+    start = time.perf_counter()
+
+    with SmfWriter(path, ppqn=ppqn, tempo=tempo) as writer:
+        while pulse < total_pulses:
+            tick = pulse * ppqn // MASTER_PPQN
+            while note_offs and note_offs[0][0] <= tick:
+                off_tick, note = heapq.heappop(note_offs)
+                writer.note_off(off_tick, note, channel)
+            for event_type, data1, data2 in engine.tick():
+                if event_type == NOTE_ON:
+                    writer.note_on(tick, data1, data2, channel)
+                    heapq.heappush(note_offs, (tick + gate_ticks, data1))
+                    notes += 1
+                elif event_type == CONTROL_CHANGE:
+                    writer.control_change(tick, data1, data2, channel)
+                elif event_type == NOTE_OFF:
+                    writer.note_off(tick, data1, channel)
+            pulse += engine.pulses_to_next_tick
+            step_count += 1
+        while note_offs:
+            off_tick, note = heapq.heappop(note_offs)
+            writer.note_off(off_tick, note, channel)
+
+    elapsed = time.perf_counter() - start
+    duration = bars * beats_per_bar * 60 / tempo
+    return {
+        'steps': step_count,
+        'notes': notes,
+        'events': writer.events,
+        'seconds': elapsed,
+        'realtime_factor': duration / elapsed if elapsed else float('inf'),
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Render the Isogrid sequencer to a MIDI file')
+    parser.add_argument('output')
+    parser.add_argument('--bars', type=int, default=64)
+    parser.add_argument('--tempo', type=int, default=120)
+    parser.add_argument('--grid', choices=list(GRID_SIZES), default='4x4')
+    parser.add_argument('--x-mode', choices=X_DRIVER_MODES, default='Forward')
+    parser.add_argument('--y-mode', choices=Y_DRIVER_MODES, default='Forward')
+    parser.add_argument('--x-speed', choices=list(AXIS_SPEEDS), default=DEFAULT_SPEED)
+    parser.add_argument('--y-speed', choices=list(AXIS_SPEEDS), default=DEFAULT_SPEED)
+    parser.add_argument('--x-euclid', default='4,2,0', help="Euclidean steps,pulses,rotation of the X axis")
+    parser.add_argument('--y-euclid', default='4,3,0', help="Euclidean steps,pulses,rotation of the Y axis")
+    parser.add_argument('--x-cc', choices=list(CC_LABELS), default='None')
+    parser.add_argument('--y-cc', choices=list(CC_LABELS), default='None')
+    parser.add_argument('--steps', default='all', help="enabled steps, e.g. 0,5,10,15 (default: all)")
+    parser.add_argument('--probability', type=float, default=1.0, help="probability of every enabled step")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    engine = SequencerEngine(*GRID_SIZES[args.grid], seed=args.seed)
+    engine.set_x_mode(args.x_mode)
+    engine.set_y_mode(args.y_mode)
+    engine.set_x_speed(args.x_speed)
+    engine.set_y_speed(args.y_speed)
+    engine.set_x_euclidean(*(int(value) for value in args.x_euclid.split(',')))
+    engine.set_y_euclidean(*(int(value) for value in args.y_euclid.split(',')))
+    engine.set_x_cc(args.x_cc)
+    engine.set_y_cc(args.y_cc)
+    enabled = range(engine.step_count) if args.steps == 'all' else [int(step) for step in args.steps.split(',')]
+    for step in enabled:
+        engine.step_states[step] = True
+        engine.step_probabilities[step] = args.probability
+
+    summary = render_to_smf(engine, args.output, bars=args.bars, tempo=args.tempo)
+    print(f"Rendered {args.bars} bars ({summary['steps']} steps, {summary['notes']} notes) "
+          f"to {args.output} in {summary['seconds']:.2f} s, {summary['realtime_factor']:.0f}x real time")
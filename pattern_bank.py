@@ -0,0 +1,376 @@
+"""
+Pattern bank: many grids stored in one compact binary file.
+
+A bank is a short header followed by a fixed number of fixed-size records,
+one per slot, so slot n always starts at the same offset and reading or
+writing one pattern never touches the others.  Each record holds a grid's
+size and driver settings followed by the per-step arrays laid out for the
+largest grid (MAX_STEPS), little-endian, exactly as the engine keeps them:
+
+    header   used, columns, rows, X/Y mode, X/Y speed, X/Y CC, X/Y Euclidean
+    states   MAX_STEPS x uint8        notes       MAX_STEPS x uint8
+    velocities MAX_STEPS x uint8      probabilities MAX_STEPS x float32
+    teleport targets MAX_STEPS x int16
+    CC locks MAX_STEPS x LOCKS_PER_STEP x (CC number, value); 0xFF = unused
+
+The file is memory-mapped, so loading a slot is a few slice copies out of
+the page cache instead of a read and a parse: switching between hundreds of
+patterns is instant.  Loading never takes the scheduler's lock; only
+Pattern.apply() has to run while the clock thread is kept out.
+
+Modes, speeds and CC labels are stored as indexes into the engine's lists,
+so any change to those lists or to the layout bumps FORMAT_VERSION.  Banks
+of another version are refused rather than misread; export_json() and
+import_json() carry patterns across versions and give a text form for
+diffing.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from event_log import log
+from sequencer_engine import (SequencerEngine, PreparedPattern, X_DRIVER_MODES, Y_DRIVER_MODES, AXIS_SPEEDS,
+                              DEFAULT_SPEED, CC_LABELS, MAX_GRID_SIZE)
+
+MAGIC = b'ISOB'
+FORMAT_VERSION = 1
+BANK_SLOTS = 128
+
+MAX_STEPS = MAX_GRID_SIZE * MAX_GRID_SIZE
+LOCKS_PER_STEP = 2
+NO_LOCK = 0xFF
+
+SPEED_LABELS = list(AXIS_SPEEDS)
+CC_LABEL_LIST = list(CC_LABELS)
+
+# Magic, version, slot count, record size
+BANK_HEADER = struct.Struct('<4sHHI')
+# Used, columns, rows, X/Y mode, X/Y speed, X/Y CC, X/Y Euclidean steps/pulses/rotation
+RECORD_HEADER = struct.Struct('<15Bx')
+
+# (array typecode, field) for each per-step section, in file order
+STEP_SECTIONS = (('B', 'states'), ('B', 'notes'), ('B', 'velocities'),
+                 ('f', 'probabilities'), ('h', 'teleport_targets'))
+LOCKS_SIZE = MAX_STEPS * LOCKS_PER_STEP * 2
+RECORD_SIZE = (RECORD_HEADER.size + LOCKS_SIZE
+               + sum(MAX_STEPS * array(typecode).itemsize for typecode, _ in STEP_SECTIONS))
+
+_SWAP_BYTES = sys.byteorder != 'little'
+
+
+class Pattern:
+    """One grid's steps and driver settings, detached from any engine"""
+
+    def __init__(self, columns, rows):
+        count = columns * rows
+        self.columns = columns
+        self.rows = rows
+        self.states = array('B', bytes(count))
+        self.notes = array('B', [i % 12 + 36 for i in range(count)])
+        self.velocities = array('B', [100]) * count
+        self.probabilities = array('f', [1.0]) * count
+        self.teleport_targets = array('h', [-1]) * count
+        self.cc_values = [{} for _ in range(count)]
+        self.x_mode = self.y_mode = 'Forward'
+        self.x_speed = self.y_speed = DEFAULT_SPEED
+        self.x_cc = self.y_cc = 'None'
+        self.euclidean_x = (4, 2, 0)
+        self.euclidean_y = (4, 3, 0)
+
+    @classmethod
+    def capture(cls, engine):
+        """Copy the engine's current grid and settings"""
+        pattern = cls(engine.columns, engine.rows)
+        pattern.states = array('B', engine.step_states)
+        pattern.notes = array('B', engine.step_notes)
+        pattern.velocities = array('B', engine.step_velocities)
+        pattern.probabilities = array('f', engine.step_probabilities)
+        pattern.teleport_targets = array('h', engine.step_teleport_targets)
+        pattern.cc_values = [dict(locks) for locks in engine.step_cc_values]
+        pattern.x_mode, pattern.y_mode = engine.x_mode, engine.y_mode
+        pattern.x_speed, pattern.y_speed = engine.x_speed, engine.y_speed
+        pattern.x_cc, pattern.y_cc = engine.x_cc, engine.y_cc
+        pattern.euclidean_x, pattern.euclidean_y = engine.euclidean_x, engine.euclidean_y
+        return pattern
+
+    def apply(self, engine):
+        """Make this the engine's grid (hold the scheduler's lock while the clock runs)"""
+        if (engine.columns, engine.rows) != (self.columns, self.rows):
+            engine.resize(self.columns, self.rows)
+        # Copies, so editing the grid leaves the pattern as loaded
+        engine.step_states = array('B', self.states)
+        engine.step_notes = array('B', self.notes)
+        engine.step_velocities = array('B', self.velocities)
+        engine.step_probabilities = array('f', self.probabilities)
+        engine.step_teleport_targets = array('h', self.teleport_targets)
+        engine.step_cc_values = [dict(locks) for locks in self.cc_values]
+        engine.set_x_mode(self.x_mode)
+        engine.set_y_mode(self.y_mode)
+        engine.set_x_speed(self.x_speed)
+        engine.set_y_speed(self.y_speed)
+        engine.set_x_cc(self.x_cc)
+        engine.set_y_cc(self.y_cc)
+        engine.set_x_euclidean(*self.euclidean_x)
+        engine.set_y_euclidean(*self.euclidean_y)
+        engine.invalidate_path()
+
+    def prepare(self, bars=1, tag=None):
+        """A PreparedPattern for SequencerEngine.queue_pattern(), path table included"""
+        staging = SequencerEngine(self.columns, self.rows)
+        self.apply(staging)
+        return PreparedPattern(staging, bars, tag)
+
+    def to_dict(self):
+        return {
+            'columns': self.columns,
+            'rows': self.rows,
+            'x_mode': self.x_mode,
+            'y_mode': self.y_mode,
+            'x_speed': self.x_speed,
+            'y_speed': self.y_speed,
+            'x_cc': self.x_cc,
+            'y_cc': self.y_cc,
+            'euclidean_x': list(self.euclidean_x),
+            'euclidean_y': list(self.euclidean_y),
+            'states': list(self.states),
+            'notes': list(self.notes),
+            'velocities': list(self.velocities),
+            # float32 values, rounded so the text diffs cleanly
+            'probabilities': [round(value, 4) for value in self.probabilities],
+            'teleport_targets': list(self.teleport_targets),
+            'cc_locks': {str(step): {str(cc): value for cc, value in locks.items()}
+                         for step, locks in enumerate(self.cc_values) if locks},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        pattern = cls(data['columns'], data['rows'])
+        for typecode, field in STEP_SECTIONS:
+            values = array(typecode, data[field])
+            if len(values) != pattern.columns * pattern.rows:
+                raise ValueError(f"{field} has {len(values)} steps, expected {pattern.columns * pattern.rows}")
+            setattr(pattern, field, values)
+        for step, locks in data.get('cc_locks', {}).items():
+            pattern.cc_values[int(step)] = {int(cc): value for cc, value in locks.items()}
+        pattern.x_mode, pattern.y_mode = data['x_mode'], data['y_mode']
+        pattern.x_speed, pattern.y_speed = data['x_speed'], data['y_speed']
+        pattern.x_cc, pattern.y_cc = data['x_cc'], data['y_cc']
+        pattern.euclidean_x, pattern.euclidean_y = tuple(data['euclidean_x']), tuple(data['euclidean_y'])
+        return pattern
+
+
+class PatternBank:
+    """A memory-mapped bank file of fixed-size pattern slots; created empty if missing"""
+
+    def __init__(self, path, slots=BANK_SLOTS):
+        self.path = path
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(BANK_HEADER.pack(MAGIC, FORMAT_VERSION, slots, RECORD_SIZE))
+                f.truncate(BANK_HEADER.size + slots * RECORD_SIZE)
+        self._file = open(path, 'r+b')
+        try:
+            magic, version, self.slots, record_size = BANK_HEADER.unpack(self._file.read(BANK_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a pattern bank")
+            if version != FORMAT_VERSION or record_size != RECORD_SIZE:
+                raise ValueError(f"{path} is pattern bank version {version}, this build reads version {FORMAT_VERSION}")
+            self._map = mmap.mmap(self._file.fileno(), BANK_HEADER.size + self.slots * RECORD_SIZE)
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _offset(self, slot):
+        if not 0 <= slot < self.slots:
+            raise IndexError(f"Pattern slot {slot} out of range (0-{self.slots - 1})")
+        return BANK_HEADER.size + slot * RECORD_SIZE
+
+    def used(self, slot):
+        return self._map[self._offset(slot)] != 0
+
+    def used_slots(self):
+        return [slot for slot in range(self.slots) if self.used(slot)]
+
+    def load(self, slot):
+        """The Pattern stored in slot, or None if the slot is empty; ValueError if it is corrupt"""
+        offset = self._offset(slot)
+        view = memoryview(self._map)[offset:offset + RECORD_SIZE]
+        try:
+            (used, columns, rows, x_mode, y_mode, x_speed, y_speed, x_cc, y_cc,
+             *euclidean) = RECORD_HEADER.unpack_from(view)
+            if not used:
+                return None
+            if not (1 <= columns <= MAX_GRID_SIZE and 1 <= rows <= MAX_GRID_SIZE):
+                raise ValueError(f"Slot {slot} holds a corrupt pattern: {columns}x{rows} grid")
+            pattern = Pattern(columns, rows)
+            pattern.x_mode, pattern.y_mode = X_DRIVER_MODES[x_mode], Y_DRIVER_MODES[y_mode]
+            pattern.x_speed, pattern.y_speed = SPEED_LABELS[x_speed], SPEED_LABELS[y_speed]
+            pattern.x_cc, pattern.y_cc = CC_LABEL_LIST[x_cc], CC_LABEL_LIST[y_cc]
+            pattern.euclidean_x, pattern.euclidean_y = tuple(euclidean[:3]), tuple(euclidean[3:])
+
+            count = columns * rows
+            position = RECORD_HEADER.size
+            for typecode, field in STEP_SECTIONS:
+                values = array(typecode)
+                values.frombytes(view[position:position + count * values.itemsize])
+                if _SWAP_BYTES:
+                    values.byteswap()
+                setattr(pattern, field, values)
+                position += MAX_STEPS * values.itemsize
+            locks = view[position:position + count * LOCKS_PER_STEP * 2]
+            for step in range(count):
+                start = step * LOCKS_PER_STEP * 2
+                for lock in range(start, start + LOCKS_PER_STEP * 2, 2):
+                    if locks[lock] != NO_LOCK:
+                        pattern.cc_values[step][locks[lock]] = locks[lock + 1]
+            return pattern
+        except (struct.error, IndexError) as e:
+            raise ValueError(f"Slot {slot} holds a corrupt pattern: {e}") from e
+        finally:
+            view.release()
+
+    def save(self, slot, pattern):
+        """Write pattern into slot and flush it to the file"""
+        offset = self._offset(slot)
+        record = bytearray(RECORD_SIZE)
+        RECORD_HEADER.pack_into(record, 0, 1, pattern.columns, pattern.rows,
+                                X_DRIVER_MODES.index(pattern.x_mode), Y_DRIVER_MODES.index(pattern.y_mode),
+                                SPEED_LABELS.index(pattern.x_speed), SPEED_LABELS.index(pattern.y_speed),
+                                CC_LABEL_LIST.index(pattern.x_cc), CC_LABEL_LIST.index(pattern.y_cc),
+                                *pattern.euclidean_x, *pattern.euclidean_y)
+        position = RECORD_HEADER.size
+        for typecode, field in STEP_SECTIONS:
+            values = array(typecode, getattr(pattern, field))
+            if _SWAP_BYTES:
+                values.byteswap()
+            data = values.tobytes()
+            record[position:position + len(data)] = data
+            position += MAX_STEPS * values.itemsize
+        locks = array('B', [NO_LOCK]) * LOCKS_SIZE
+        for step, step_locks in enumerate(pattern.cc_values):
+            if len(step_locks) > LOCKS_PER_STEP:
+                log.warning('WARNING', "Step %s has %s CC locks, only %s are saved",
+                            step, len(step_locks), LOCKS_PER_STEP)
+            lock = step * LOCKS_PER_STEP * 2
+            for cc, value in list(step_locks.items())[:LOCKS_PER_STEP]:
+                locks[lock] = cc
+                locks[lock + 1] = value
+                lock += 2
+        record[position:position + LOCKS_SIZE] = locks.tobytes()
+        self._map[offset:offset + RECORD_SIZE] = record
+        self._map.flush()
+
+    def clear(self, slot):
+        offset = self._offset(slot)
+        self._map[offset] = 0
+        self._map.flush()
+
+    def export_json(self, path):
+        """Write every used slot as JSON; returns the number of patterns written"""
+        patterns = {str(slot): self.load(slot).to_dict() for slot in self.used_slots()}
+        with open(path, 'w') as f:
+            json.dump({'format': 'isogrid-pattern-bank', 'version': FORMAT_VERSION, 'patterns': patterns}, f, indent=1)
+        return len(patterns)
+
+    def import_json(self, path):
+        """Store the patterns of a JSON export in their slots; returns the number stored"""
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('format') != 'isogrid-pattern-bank':
+            raise ValueError(f"{path} is not a pattern bank export")
+        for slot, pattern in data['patterns'].items():
+            self.save(int(slot), Pattern.from_dict(pattern))
+        return len(data['patterns'])
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+            self._file.close()
+
+
+class PatternSlots:
+    """Saves and switches the engine's pattern between the slots of a bank
+
+    The engine's pattern_tag is the slot of the pattern it plays, so saves go
+    there rather than to the slot a view last showed.  Patterns the clock
+    thread switched away from come back through engine.replaced_patterns and
+    are saved under their own tags.
+    """
+
+    def __init__(self, bank, engine, scheduler):
+        self.bank = bank
+        self.engine = engine
+        self.scheduler = scheduler
+
+    def save(self):
+        """Save the patterns switched away from, then the current one"""
+        self.save_replaced()
+        with self.scheduler.lock:
+            slot, pattern = self.engine.pattern_tag, Pattern.capture(self.engine)
+        self.bank.save(slot, pattern)
+
+    def save_replaced(self):
+        replaced = self.engine.replaced_patterns
+        while replaced:
+            outgoing = replaced.popleft()
+            if outgoing.tag is not None:
+                self.bank.save(outgoing.tag, Pattern.capture(outgoing))
+
+    def select(self, slot):
+        """Save the current grid and switch to slot; an empty slot starts as a copy of it
+
+        While playing, the pattern is queued and the clock thread switches to it
+        on the next bar line.  Returns True if the engine switched right away.
+        """
+        self.engine.clear_pattern_queue()
+        if slot == self.engine.pattern_tag:
+            return False
+        self.save()
+        pattern = self.bank.load(slot)
+        if pattern is not None and self.scheduler.running:
+            self.engine.queue_pattern(pattern.prepare(tag=slot))
+            return False
+        with self.scheduler.lock:
+            if pattern is not None:
+                pattern.apply(self.engine)
+            self.engine.pattern_tag = slot
+        return pattern is not None
+
+    def queue_next(self, bars):
+        """Queue the saved pattern after the current slot, wrapping around
+
+        A chain of one slot just keeps playing it: re-queueing the saved copy
+        would drop the edits made since.
+        """
+        current = self.engine.pattern_tag
+        slots = self.bank.used_slots()
+        slot = next((slot for slot in slots if slot > current), slots[0] if slots else current)
+        if slot != current:
+            self.engine.queue_pattern(self.bank.load(slot).prepare(bars=bars, tag=slot))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert an Isogrid pattern bank to or from JSON')
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('bank')
+    parser.add_argument('json')
+    args = parser.parse_args()
+
+    with PatternBank(args.bank) as bank:
+        if args.action == 'export':
+            print(f"Exported {bank.export_json(args.json)} patterns from {args.bank} to {args.json}")
+        else:
+            print(f"Imported {bank.import_json(args.json)} patterns from {args.json} into {args.bank}")
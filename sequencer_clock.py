@@ -0,0 +1,199 @@
+"""
+High-resolution sequencer clock.
+
+Ticks run on a dedicated thread against absolute deadlines taken from
+time.perf_counter_ns, so step timing no longer depends on the Kivy frame loop.
+Deadline n is always origin + n * interval, which keeps rounding and wake-up
+errors from accumulating into drift.  A callback may instead return the
+absolute time it wants to be called next (the scheduler does, since axis
+speeds make step gaps uneven); the fixed grid is only the fallback.
+
+Run this module directly for a jitter/drift report:
+
+    python sequencer_clock.py --tempo 240 --ticks 480
+"""
+import math
+import threading
+import time
+
+from event_log import log
+
+# Sleep until this close to a deadline, then yield-spin the rest of the way
+SPIN_THRESHOLD_NS = 1_000_000
+
+# If the thread wakes more than this many intervals late, skip the missed
+# ticks instead of firing them back to back
+MAX_CATCH_UP_TICKS = 4
+
+
+def step_interval_ns(tempo, steps_per_beat=4):
+    """Nanoseconds between steps (16th notes by default) at the given BPM"""
+    return int(60_000_000_000 / max(1, tempo) / steps_per_beat)
+
+
+class ClockStats:
+    """Running lateness statistics for a clock (all values in nanoseconds)"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.skipped = 0
+        self.total = 0
+        self.total_sq = 0
+        self.max_late = 0
+        self.min_late = 0
+        self.first_late = None
+        self.last_late = 0
+
+    def record(self, late_ns):
+        if self.first_late is None:
+            self.first_late = late_ns
+            self.min_late = late_ns
+            self.max_late = late_ns
+        self.ticks += 1
+        self.total += late_ns
+        self.total_sq += late_ns * late_ns
+        self.last_late = late_ns
+        if late_ns > self.max_late:
+            self.max_late = late_ns
+        if late_ns < self.min_late:
+            self.min_late = late_ns
+
+    def report(self):
+        """Summary in milliseconds: mean/max lateness, jitter (stddev) and drift"""
+        if not self.ticks:
+            return {'ticks': 0, 'skipped': self.skipped}
+        mean = self.total / self.ticks
+        variance = max(0.0, self.total_sq / self.ticks - mean * mean)
+        return {
+            'ticks': self.ticks,
+            'skipped': self.skipped,
+            'mean_late_ms': mean / 1e6,
+            'max_late_ms': self.max_late / 1e6,
+            'min_late_ms': self.min_late / 1e6,
+            'jitter_ms': math.sqrt(variance) / 1e6,
+            # Change in lateness between the first and last tick
+            'drift_ms': (self.last_late - self.first_late) / 1e6,
+        }
+
+
+class SequencerClock:
+    """Calls callback(deadline_ns) once per step on its own thread
+
+    If the callback returns a time, the next call happens then instead.
+    """
+
+    def __init__(self, callback, tempo=120, steps_per_beat=4):
+        self.callback = callback
+        self.steps_per_beat = steps_per_beat
+        self.interval_ns = step_interval_ns(tempo, steps_per_beat)
+        self.stats = ClockStats()
+        self._pending_interval_ns = None
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='SequencerClock', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._running
+
+    def set_tempo(self, tempo):
+        """Change tempo; takes effect from the next deadline without a phase jump"""
+        self._pending_interval_ns = step_interval_ns(tempo, self.steps_per_beat)
+
+    def _run(self):
+        perf_counter_ns = time.perf_counter_ns
+        sleep = time.sleep
+        origin = perf_counter_ns()
+        tick_index = 0
+        deadline = origin
+
+        while self._running:
+            remaining = deadline - perf_counter_ns()
+            if remaining > SPIN_THRESHOLD_NS:
+                sleep((remaining - SPIN_THRESHOLD_NS) / 1e9)
+                continue
+            while perf_counter_ns() < deadline:
+                sleep(0)  # Yield the GIL while spinning
+
+            self.stats.record(perf_counter_ns() - deadline)
+            try:
+                requested = self.callback(deadline)
+            except Exception as e:
+                log.error('ERROR', "Clock callback failed: %s", e)
+                requested = None
+
+            # Tempo changes rebase the grid on the deadline that just fired
+            if self._pending_interval_ns is not None:
+                self.interval_ns = self._pending_interval_ns
+                self._pending_interval_ns = None
+                origin = deadline
+                tick_index = 0
+
+            if requested is not None:
+                # Event-driven: the callback knows when it is next needed
+                origin = deadline = max(requested, deadline)
+                tick_index = 0
+                continue
+
+            tick_index += 1
+            deadline = origin + tick_index * self.interval_ns
+
+            # Fell too far behind (e.g. the process was suspended): skip ahead
+            behind = perf_counter_ns() - deadline
+            if behind > MAX_CATCH_UP_TICKS * self.interval_ns:
+                missed = behind // self.interval_ns
+                self.stats.skipped += missed
+                tick_index += missed
+                deadline = origin + tick_index * self.interval_ns
+
+
+def measure_jitter(tempo=240, ticks=480, callback=None):
+    """Run the clock for a number of ticks and return its lateness report"""
+    done = threading.Event()
+    count = [0]
+
+    def on_tick(deadline_ns):
+        if callback is not None:
+            callback(deadline_ns)
+        count[0] += 1
+        if count[0] >= ticks:
+            done.set()
+
+    clock = SequencerClock(on_tick, tempo=tempo)
+    clock.start()
+    done.wait()
+    clock.stop()
+    return clock.stats.report()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Sequencer clock jitter/drift report')
+    parser.add_argument('--tempo', type=int, default=240)
+    parser.add_argument('--ticks', type=int, default=480)
+    parser.add_argument('--limit-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    report = measure_jitter(args.tempo, args.ticks)
+    print(f"Clock report at {args.tempo} BPM ({args.ticks} ticks of 1/16):")
+    for key, value in report.items():
+        print(f"  {key}: {value:.4f}" if isinstance(value, float) else f"  {key}: {value}")
+    ok = report['max_late_ms'] < args.limit_ms and abs(report['drift_ms']) < args.limit_ms
+    print(f"{'PASS' if ok else 'FAIL'}: max lateness and drift {'under' if ok else 'over'} {args.limit_ms} ms")
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,687 @@
+"""
+Headless sequencer core for the Isogrid.
+
+The engine owns the grid state and the X/Y driver logic and turns every tick
+into a list of MIDI events.  It has no Kivy dependency, so it can be driven
+by the app's clock, by tests, or by batch jobs.
+
+The grid is columns x rows (4x4 by default, up to 16x16).  Per-step
+attributes live in flat typed arrays indexed by y * columns + x: states,
+notes and velocities as unsigned bytes, probabilities as 32-bit floats and
+teleport targets as 16-bit ints, so memory and tick cost stay flat up to
+256 steps.
+
+Each axis moves on its own subdivision of a master clock of MASTER_PPQN
+pulses per quarter note (1/32 to 1/4).  A tick happens whenever at least one
+axis is due; after each tick pulses_to_next_tick says how far away the next
+one is, so the scheduler only wakes up when something actually moves.
+
+Randomness (probability gates and Random driver moves) comes from blocks of
+32-bit numbers pre-drawn from a seedable generator, so each draw is one
+array read and a run with a given seed is exactly reproducible.
+
+Pattern switches are queued rather than applied mid-bar.  A PreparedPattern
+is a staging engine that already holds the new grid, its resolved CCs and
+its path table, built on whichever thread queues it; the queue hand-off is a
+single deque append.  At the first tick of a bar the engine takes the next
+queued pattern and adopts the staging engine's attributes, so the clock
+thread only moves references and never computes a path on a switch.
+"""
+import collections
+import random
+import time
+from array import array
+from functools import lru_cache
+from types import SimpleNamespace
+
+from event_log import log
+from tick_profiler import profiler, DRIVERS
+
+GRID_SIZE = 4
+STEP_COUNT = GRID_SIZE * GRID_SIZE
+MAX_GRID_SIZE = 16
+
+# Grid sizes offered by the UI, as (columns, rows)
+GRID_SIZES = {'4x4': (4, 4), '8x4': (8, 4), '8x8': (8, 8), '16x8': (16, 8), '16x16': (16, 16)}
+
+X_DRIVER_MODES = ['Forward', 'Backward', 'Pendulum', 'Random', 'Euclidean']
+Y_DRIVER_MODES = X_DRIVER_MODES + ['Logic Advance']
+
+# MicroFreak CC map offered by the X/Y "to CC" spinners
+CC_LABELS = {
+    'None': None,
+    'Cutoff (23)': 23,
+    'Resonance (83)': 83,
+    'Osc Type (9)': 9,
+    'Wave (10)': 10,
+    'Timbre (12)': 12,
+    'Shape (13)': 13,
+    'Glide (5)': 5
+}
+
+# Event types are the MIDI status nibbles, events are (type, data1, data2)
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+CONTROL_CHANGE = 0xB0
+
+LOGIC_ADVANCE_VELOCITY = 100
+
+# Master clock resolution and the pulses per move of each axis speed
+MASTER_PPQN = 96
+BAR_PULSES = 4 * MASTER_PPQN  # Pattern switches happen on 4/4 bar lines
+AXIS_SPEEDS = {'1/32': 12, '1/16': 24, '1/8': 48, '1/4': 96}
+DEFAULT_SPEED = '1/16'
+
+# Driver modes whose next position depends only on the current state
+DETERMINISTIC_MODES = frozenset(mode for mode in Y_DRIVER_MODES if mode != 'Random')
+
+# Euclidean patterns: longest pattern per axis and how many (steps, pulses,
+# rotation) masks stay cached
+MAX_EUCLIDEAN_STEPS = 32
+EUCLIDEAN_CACHE_SIZE = 256
+
+# Random numbers are pre-drawn in blocks of unsigned 32-bit ints
+RANDOM_BLOCK_SIZE = 1024
+RANDOM_RANGE = 1 << 32
+
+# Longest cycle worth tabulating; anything longer is evaluated live
+MAX_PATH_LENGTH = 4096
+
+
+
+def position_cc_values(size):
+    """CC value sent for each axis position (position / (size - 1) scaled to 0-127)"""
+    if size < 2:
+        return [0] * size
+    return [int((position / (size - 1)) * 127) for position in range(size)]
+
+
+POSITION_CC_VALUES = position_cc_values(GRID_SIZE)
+
+
+def euclidean_rhythm(steps, pulses):
+    """Generate an Euclidean rhythm pattern with improved algorithm"""
+    if steps <= 0:
+        return []
+    if pulses >= steps:
+        return [True] * steps
+    if pulses <= 0:
+        return [False] * steps
+
+    # Bresenham algorithm approach for Euclidean rhythms
+    pattern = []
+    error = 0
+
+    for i in range(steps):
+        error += pulses
+        if error >= steps:
+            pattern.append(True)
+            error -= steps
+        else:
+            pattern.append(False)
+
+    return pattern
+
+
+@lru_cache(maxsize=EUCLIDEAN_CACHE_SIZE)
+def euclidean_mask(steps, pulses, rotation=0):
+    """Euclidean pattern as a bitmask: bit i is set if step i is a hit.
+
+    The pattern is rotated right by rotation steps.  Results are cached, so
+    sweeping a knob back and forth builds each pattern only once.
+    """
+    if steps <= 0:
+        return 0
+    rotation %= steps
+    mask = 0
+    for index, hit in enumerate(euclidean_rhythm(steps, pulses)):
+        if hit:
+            mask |= 1 << ((index + rotation) % steps)
+    return mask
+
+
+class PathTable:
+    """Precomputed playhead path of a deterministic driver configuration.
+
+    steps[i] is the active step of tick i and gaps[i] the pulses from tick i
+    to the next one; after the last entry the path continues at loop_start
+    (any entries before it are a lead-in that is never revisited).
+    states[i] is the driver state before tick i, so the live drivers can
+    pick up exactly where the table left off.
+    """
+
+    def __init__(self, steps, gaps, states, loop_start, step_count=STEP_COUNT):
+        self.steps = steps
+        self.gaps = gaps
+        self.states = states
+        self.loop_start = loop_start
+        self.length = len(steps)
+        self.cycle_length = self.length - loop_start
+        # How often each step is visited per cycle
+        self.hit_counts = array('H', bytes(2 * step_count))
+        for step in steps[loop_start:]:
+            self.hit_counts[step] += 1
+
+
+# Engine attributes a pattern switch replaces: the grid, the resolved driver
+# and CC settings, and the path table (driver methods are rebound, not copied)
+PATTERN_ATTRIBUTES = (
+    'columns', 'rows', 'step_count', 'x_cc_values', 'y_cc_values',
+    'step_states', 'step_notes', 'step_velocities', 'step_probabilities', 'step_cc_values', 'step_teleport_targets',
+    'x_mode', 'y_mode', 'x_cc', 'y_cc', 'x_cc_number', 'y_cc_number',
+    'euclidean_x', 'euclidean_y', 'euclidean_x_mask', 'euclidean_y_mask', 'euclidean_x_length', 'euclidean_y_length',
+    'x_speed', 'y_speed', 'x_division', 'y_division',
+    '_path', '_path_pos', '_path_dirty',
+)
+
+
+class PreparedPattern:
+    """A pattern ready to be switched to: a configured staging engine with its path built
+
+    Configure the staging engine (a fresh SequencerEngine) first, then wrap it;
+    the path table is tabulated here, off the clock thread.  The pattern plays
+    for `bars` bars before the next queued one takes over.
+    """
+
+    def __init__(self, staging, bars=1, tag=None):
+        if staging._path_dirty:
+            staging._refresh_path()
+        self.engine = staging
+        self.bars = max(1, bars)
+        self.tag = tag  # Caller's name for the pattern, e.g. its bank slot
+
+
+class SequencerEngine:
+    """Grid state plus the tick logic, independent of any UI"""
+
+    def __init__(self, columns=GRID_SIZE, rows=GRID_SIZE, seed=None):
+        self._allocate(columns, rows)
+        self.reseed(seed)
+
+        # Playhead
+        self.current_x = 0
+        self.current_y = 0
+        self.x_direction = 1
+        self.y_direction = 1
+        self.active_step = 0
+
+        # Driver configuration
+        self.x_mode = 'Forward'
+        self.y_mode = 'Forward'
+        self.x_cc = 'None'
+        self.y_cc = 'None'
+        self.x_cc_number = None  # Resolved from the label when it is selected
+        self.y_cc_number = None
+        # Euclidean pattern per axis as (steps, pulses, rotation) plus its cached bitmask
+        self.euclidean_x = (4, 2, 0)  # Default 4 steps, 2 pulses
+        self.euclidean_y = (4, 3, 0)  # Default 4 steps, 3 pulses
+        self.euclidean_x_mask = euclidean_mask(4, 2, 0)
+        self.euclidean_y_mask = euclidean_mask(4, 3, 0)
+        self.euclidean_x_length = 4
+        self.euclidean_y_length = 4
+        self.euclidean_x_index = 0
+        self.euclidean_y_index = 0
+
+        # Axis clocks: pulses per move, and pulses until each axis moves next
+        self.x_speed = DEFAULT_SPEED
+        self.y_speed = DEFAULT_SPEED
+        self.x_division = AXIS_SPEEDS[DEFAULT_SPEED]
+        self.y_division = AXIS_SPEEDS[DEFAULT_SPEED]
+        self.x_wait = 0
+        self.y_wait = 0
+        self.pulses_to_next_tick = self.x_division
+
+        # Driver modes are compiled to bound methods once, when they are selected
+        self._x_drivers = {
+            'Forward': self._x_forward,
+            'Backward': self._x_backward,
+            'Pendulum': self._x_pendulum,
+            'Random': self._x_random,
+            'Euclidean': self._x_euclidean,
+        }
+        self._y_drivers = {
+            'Forward': self._y_forward,
+            'Backward': self._y_backward,
+            'Pendulum': self._y_pendulum,
+            'Random': self._y_random,
+            'Euclidean': self._y_euclidean,
+            'Logic Advance': self._y_logic_advance,
+        }
+        self._update_x = self._x_drivers[self.x_mode]
+        self._update_y = self._y_drivers[self.y_mode]
+
+        # Path table, rebuilt on the next tick after the configuration changes
+        self._path = None
+        self._path_pos = 0
+        self._path_dirty = True
+        self._pending_position = None
+
+        # Pattern queue, switched on bar lines; pattern_changes counts the switches
+        # and replaced_patterns hands the outgoing patterns back to be saved
+        self.bar_position = 0  # Master pulses from the start of the bar to the next tick
+        self.pattern_tag = None
+        self.pattern_changes = 0
+        self.replaced_patterns = collections.deque()
+        self._new_bar = True
+        self._bars_left = 0
+        self._pattern_queue = collections.deque()
+
+    def _allocate(self, columns, rows, keep=False):
+        """Create the step arrays, optionally carrying over the steps that still exist"""
+        if not (1 <= columns <= MAX_GRID_SIZE and 1 <= rows <= MAX_GRID_SIZE):
+            raise ValueError(f"Grid size must be between 1x1 and {MAX_GRID_SIZE}x{MAX_GRID_SIZE}: {columns}x{rows}")
+        count = columns * rows
+        step_states = array('B', bytes(count))  # Track which steps are enabled
+        step_notes = array('B', [i % 12 + 36 for i in range(count)])  # Default note values (C2 to B3)
+        step_velocities = array('B', [100]) * count  # Default velocities
+        step_probabilities = array('f', [1.0]) * count  # Default probabilities (100%)
+        step_cc_values = [{} for _ in range(count)]  # CC values for each step
+        step_teleport_targets = array('h', [-1]) * count  # Wormhole mode targets (-1 = no teleport)
+
+        if keep:
+            previous = self
+            old_columns, old_rows = self.columns, self.rows
+            for y in range(min(rows, old_rows)):
+                for x in range(min(columns, old_columns)):
+                    new, old = y * columns + x, y * old_columns + x
+                    step_states[new] = previous.step_states[old]
+                    step_notes[new] = previous.step_notes[old]
+                    step_velocities[new] = previous.step_velocities[old]
+                    step_probabilities[new] = previous.step_probabilities[old]
+                    step_cc_values[new] = previous.step_cc_values[old]
+                    target = previous.step_teleport_targets[old]
+                    if target != -1:
+                        # Keep a wormhole only if its target is still on the grid
+                        target_x, target_y = target % old_columns, target // old_columns
+                        if target_x < columns and target_y < rows:
+                            step_teleport_targets[new] = target_y * columns + target_x
+
+        self.columns = columns
+        self.rows = rows
+        self.step_count = count
+        self.x_cc_values = position_cc_values(columns)
+        self.y_cc_values = position_cc_values(rows)
+        self.step_states = step_states
+        self.step_notes = step_notes
+        self.step_velocities = step_velocities
+        self.step_probabilities = step_probabilities
+        self.step_cc_values = step_cc_values
+        self.step_teleport_targets = step_teleport_targets
+
+    def resize(self, columns, rows):
+        """Change the grid size, keeping the steps that fit and clamping the playhead.
+
+        Must not run concurrently with tick() (the app holds the scheduler lock).
+        """
+        if self._path is not None:
+            self._restore_driver_state(self._path.states[self._path_pos])
+            self._path = None
+        self._allocate(columns, rows, keep=True)
+        self.current_x = min(self.current_x, columns - 1)
+        self.current_y = min(self.current_y, rows - 1)
+        self.active_step = self.current_y * columns + self.current_x
+        self._path_dirty = True
+
+    def reseed(self, seed=None):
+        """Restart the random stream; the same seed replays the same run"""
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._random_block = array('I')
+        self._random_index = RANDOM_BLOCK_SIZE  # Draw a fresh block on first use
+
+    def _draw(self):
+        """Next pre-drawn random number in [0, RANDOM_RANGE)"""
+        index = self._random_index
+        if index >= RANDOM_BLOCK_SIZE:
+            self._random_block = array('I', self._rng.randbytes(4 * RANDOM_BLOCK_SIZE))
+            index = 0
+        self._random_index = index + 1
+        return self._random_block[index]
+
+    @property
+    def path(self):
+        """The current PathTable, or None while the path is evaluated live"""
+        return self._path
+
+    def invalidate_path(self):
+        """Rebuild the path table on the next tick.
+
+        Call after editing teleport targets or velocities (Logic Advance
+        reads them) directly; the mode setters do it themselves.
+        """
+        self._path_dirty = True
+
+    def queue_pattern(self, prepared):
+        """Play a PreparedPattern once the current one has finished its bars"""
+        self._pattern_queue.append(prepared)
+
+    def clear_pattern_queue(self):
+        self._pattern_queue.clear()
+
+    @property
+    def queued_patterns(self):
+        return len(self._pattern_queue)
+
+    def align_bar(self):
+        """Make the next tick the first of a bar (e.g. on transport start)"""
+        self.bar_position = 0
+        self._new_bar = True
+
+    def _switch_pattern(self, prepared):
+        """Adopt a prepared pattern's state, playing it from its start; no computation here
+
+        The outgoing state, edits included, goes to replaced_patterns under its
+        pattern_tag; its arrays are handed over, not copied, as nothing else holds them.
+        """
+        staging = prepared.engine
+        self.replaced_patterns.append(
+            SimpleNamespace(tag=self.pattern_tag, **{name: getattr(self, name) for name in PATTERN_ATTRIBUTES}))
+        for name in PATTERN_ATTRIBUTES:
+            setattr(self, name, getattr(staging, name))
+        self._update_x = self._x_drivers[self.x_mode]
+        self._update_y = self._y_drivers[self.y_mode]
+        self._restore_driver_state(staging._driver_state())
+        self._pending_position = None
+        self._bars_left = prepared.bars
+        self.pattern_tag = prepared.tag
+        self.pattern_changes += 1
+
+    def set_position(self, x, y):
+        """Move the playhead to (x, y); takes effect on the next tick"""
+        self._pending_position = (x, y)
+        self._path_dirty = True
+
+    def set_x_mode(self, mode):
+        """Select the X driver mode"""
+        if mode in self._x_drivers:
+            self.x_mode = mode
+            self._update_x = self._x_drivers[mode]
+            self._path_dirty = True
+        else:
+            log.warning('WARNING', "Unknown X driver mode: %s", mode)
+
+    def set_y_mode(self, mode):
+        """Select the Y driver mode"""
+        if mode in self._y_drivers:
+            self.y_mode = mode
+            self._update_y = self._y_drivers[mode]
+            self._path_dirty = True
+        else:
+            log.warning('WARNING', "Unknown Y driver mode: %s", mode)
+
+    def set_x_speed(self, label):
+        """Select how often X moves ('1/32', '1/16', '1/8' or '1/4')"""
+        if label in AXIS_SPEEDS:
+            self.x_speed = label
+            self.x_division = AXIS_SPEEDS[label]
+            self._path_dirty = True
+        else:
+            log.warning('WARNING', "Unknown X speed: %s", label)
+
+    def set_y_speed(self, label):
+        """Select how often Y moves ('1/32', '1/16', '1/8' or '1/4')"""
+        if label in AXIS_SPEEDS:
+            self.y_speed = label
+            self.y_division = AXIS_SPEEDS[label]
+            self._path_dirty = True
+        else:
+            log.warning('WARNING', "Unknown Y speed: %s", label)
+
+    def set_x_euclidean(self, steps, pulses, rotation=0):
+        """Set the X axis Euclidean pattern (used in Euclidean mode)"""
+        steps, pulses, rotation = self._euclidean_settings(steps, pulses, rotation)
+        self.euclidean_x = (steps, pulses, rotation)
+        self.euclidean_x_mask = euclidean_mask(steps, pulses, rotation)
+        self.euclidean_x_length = steps
+        self._path_dirty = True
+
+    def set_y_euclidean(self, steps, pulses, rotation=0):
+        """Set the Y axis Euclidean pattern (used in Euclidean mode)"""
+        steps, pulses, rotation = self._euclidean_settings(steps, pulses, rotation)
+        self.euclidean_y = (steps, pulses, rotation)
+        self.euclidean_y_mask = euclidean_mask(steps, pulses, rotation)
+        self.euclidean_y_length = steps
+        self._path_dirty = True
+
+    def _euclidean_settings(self, steps, pulses, rotation):
+        # Clamp to a valid pattern; the index of a running axis wraps on its own
+        steps = max(1, min(int(steps), MAX_EUCLIDEAN_STEPS))
+        return steps, max(0, min(int(pulses), steps)), int(rotation) % steps
+
+    def set_x_cc(self, label):
+        """Select which CC the X position is mapped to (by spinner label)"""
+        self.x_cc = label
+        self.x_cc_number = CC_LABELS.get(label)
+
+    def set_y_cc(self, label):
+        """Select which CC the Y position is mapped to (by spinner label)"""
+        self.y_cc = label
+        self.y_cc_number = CC_LABELS.get(label)
+
+    def toggle_step(self, step_idx):
+        """Enable/disable a step and return its new state"""
+        self.step_states[step_idx] = not self.step_states[step_idx]
+        return bool(self.step_states[step_idx])
+
+    def tick(self):
+        """Advance the playhead one step and return the resulting MIDI events
+
+        Moves every axis that is due; pulses_to_next_tick is updated for the
+        following tick.
+        """
+        events = []
+
+        if self._new_bar:
+            self._new_bar = False
+            if self._bars_left:
+                self._bars_left -= 1
+            if not self._bars_left and self._pattern_queue:
+                self._switch_pattern(self._pattern_queue.popleft())
+
+        if self._path_dirty:
+            self._refresh_path()
+
+        profiling = profiler.enabled
+        if profiling:
+            start = time.perf_counter_ns()
+
+        path = self._path
+        if path is not None:
+            # Deterministic configuration: a single lookup in the path table
+            pos = self._path_pos
+            active_step_index = path.steps[pos]
+            self.pulses_to_next_tick = path.gaps[pos]
+            pos += 1
+            self._path_pos = path.loop_start if pos == path.length else pos
+            self.current_x = active_step_index % self.columns
+            self.current_y = active_step_index // self.columns
+        else:
+            active_step_index = self._advance_position()
+
+        if profiling:
+            profiler.record(DRIVERS, time.perf_counter_ns() - start)
+
+        self.active_step = active_step_index
+        bar_position = self.bar_position + self.pulses_to_next_tick
+        if bar_position >= BAR_PULSES:
+            bar_position -= BAR_PULSES
+            self._new_bar = True
+        self.bar_position = bar_position
+
+        # CC messages based on X/Y positions
+        self.append_position_ccs(events)
+
+        # Check probability - if random value is higher than step probability, skip
+        if self.step_states[active_step_index] and \
+                self._draw() < self.step_probabilities[active_step_index] * RANDOM_RANGE:
+            self.append_step_events(active_step_index, events)
+
+        return events
+
+    def _advance_position(self):
+        """Run the drivers and wormholes live and return the active step index"""
+        # Update X and Y positions with the compiled driver of each axis that is due
+        x_wait = self.x_wait
+        y_wait = self.y_wait
+        if x_wait == 0:
+            self._update_x()
+            x_wait = self.x_division
+        if y_wait == 0:
+            self._update_y()
+            y_wait = self.y_division
+        gap = x_wait if x_wait < y_wait else y_wait
+        self.x_wait = x_wait - gap
+        self.y_wait = y_wait - gap
+        self.pulses_to_next_tick = gap
+
+        # Calculate the active step index
+        active_step_index = (self.current_y * self.columns) + self.current_x
+
+        # Check for wormhole teleportation
+        teleport_target = self.step_teleport_targets[active_step_index]
+        if teleport_target != -1:
+            if 0 <= teleport_target < self.step_count:  # Validate teleport target
+                active_step_index = teleport_target
+                # Update current X and Y based on new step index
+                self.current_x = active_step_index % self.columns
+                self.current_y = active_step_index // self.columns
+            else:
+                log.warning('WARNING', "Invalid teleport target: %s", teleport_target)
+
+        return active_step_index
+
+    def _driver_state(self):
+        return (self.current_x, self.current_y, self.x_direction, self.y_direction,
+                self.euclidean_x_index, self.euclidean_y_index, self.x_wait, self.y_wait)
+
+    def _restore_driver_state(self, state):
+        (self.current_x, self.current_y, self.x_direction, self.y_direction,
+         self.euclidean_x_index, self.euclidean_y_index, self.x_wait, self.y_wait) = state
+
+    def _refresh_path(self):
+        """Hand the playhead back from the old table and tabulate the new configuration"""
+        self._path_dirty = False
+        if self._path is not None:
+            self._restore_driver_state(self._path.states[self._path_pos])
+            self._path = None
+        if self._pending_position is not None:
+            self.current_x, self.current_y = self._pending_position
+            self._pending_position = None
+        # A faster speed takes effect without waiting out the old, longer wait
+        self.x_wait = min(self.x_wait, self.x_division)
+        self.y_wait = min(self.y_wait, self.y_division)
+        self._path = self.build_path()
+        self._path_pos = 0
+
+    def build_path(self):
+        """Simulate the drivers from the current state until the state repeats.
+
+        Returns a PathTable, or None when a Random driver is selected or the
+        cycle is longer than MAX_PATH_LENGTH.  The live state is left as it was.
+        """
+        if self.x_mode not in DETERMINISTIC_MODES or self.y_mode not in DETERMINISTIC_MODES:
+            return None
+        start = self._driver_state()
+        seen = {}
+        states = []
+        steps = array('h')
+        gaps = array('H')
+        state = start
+        while state not in seen:
+            if len(states) >= MAX_PATH_LENGTH:
+                self._restore_driver_state(start)
+                return None
+            seen[state] = len(states)
+            states.append(state)
+            steps.append(self._advance_position())
+            gaps.append(self.pulses_to_next_tick)
+            state = self._driver_state()
+        self._restore_driver_state(start)
+        return PathTable(steps, gaps, states, seen[state], self.step_count)
+
+    def update_x_position(self):
+        """Move X with the driver compiled by set_x_mode()"""
+        self._update_x()
+
+    def update_y_position(self):
+        """Move Y with the driver compiled by set_y_mode()"""
+        self._update_y()
+
+    # X drivers
+
+    def _x_forward(self):
+        self.current_x = (self.current_x + 1) % self.columns
+
+    def _x_backward(self):
+        self.current_x = (self.current_x - 1) % self.columns
+
+    def _x_pendulum(self):
+        self.current_x += self.x_direction
+        if self.current_x >= self.columns - 1:
+            self.x_direction = -1
+        elif self.current_x <= 0:
+            self.x_direction = 1
+        if self.current_x < 0:
+            self.current_x = 0
+        elif self.current_x > self.columns - 1:
+            self.current_x = self.columns - 1
+
+    def _x_random(self):
+        self.current_x = (self._draw() * self.columns) >> 32
+
+    def _x_euclidean(self):
+        index = self.euclidean_x_index
+        if (self.euclidean_x_mask >> index) & 1:
+            # Only move if this step is active in the Euclidean pattern
+            self.current_x = (self.current_x + 1) % self.columns
+        self.euclidean_x_index = (index + 1) % self.euclidean_x_length
+
+    # Y drivers
+
+    def _y_forward(self):
+        self.current_y = (self.current_y + 1) % self.rows
+
+    def _y_backward(self):
+        self.current_y = (self.current_y - 1) % self.rows
+
+    def _y_pendulum(self):
+        self.current_y += self.y_direction
+        if self.current_y >= self.rows - 1:
+            self.y_direction = -1
+        elif self.current_y <= 0:
+            self.y_direction = 1
+        if self.current_y < 0:
+            self.current_y = 0
+        elif self.current_y > self.rows - 1:
+            self.current_y = self.rows - 1
+
+    def _y_random(self):
+        self.current_y = (self._draw() * self.rows) >> 32
+
+    def _y_euclidean(self):
+        index = self.euclidean_y_index
+        if (self.euclidean_y_mask >> index) & 1:
+            # Only move if this step is active in the Euclidean pattern
+            self.current_y = (self.current_y + 1) % self.rows
+        self.euclidean_y_index = (index + 1) % self.euclidean_y_length
+
+    def _y_logic_advance(self):
+        # Only advance Y if X position is at a high-velocity step (velocity > 100)
+        x_step_index = (self.current_y * self.columns) + self.current_x
+        if self.step_velocities[x_step_index] > LOGIC_ADVANCE_VELOCITY:
+            self.current_y = (self.current_y + 1) % self.rows
+
+    def append_position_ccs(self, events):
+        """Map the X/Y positions to their selected CCs (scaled to 0-127)"""
+        if self.x_cc_number is not None:
+            events.append((CONTROL_CHANGE, self.x_cc_number, self.x_cc_values[self.current_x]))
+        if self.y_cc_number is not None:
+            events.append((CONTROL_CHANGE, self.y_cc_number, self.y_cc_values[self.current_y]))
+
+    def append_step_events(self, step_index, events):
+        """Parameter locks followed by the note of a step that fires"""
+        # Apply parameter lock if any CC values are set for this step
+        for cc_num, cc_val in self.step_cc_values[step_index].items():
+            events.append((CONTROL_CHANGE, cc_num, cc_val))
+
+        events.append((NOTE_ON, self.step_notes[step_index], self.step_velocities[step_index]))
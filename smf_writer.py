@@ -0,0 +1,93 @@
+"""
+Streaming Standard MIDI File writer.
+
+Events are encoded with delta times and written to the file as they come, so
+a render of any length needs only the writer's small output buffer in memory.
+The track length in the chunk header is patched in when the file is closed,
+which is why the output must be seekable (a regular file).  Files are
+format 0: one track holding every channel.
+"""
+import struct
+
+DEFAULT_PPQN = 96
+
+END_OF_TRACK = b'\xff\x2f\x00'
+
+
+def encode_vlq(value):
+    """MIDI variable-length quantity: 7 bits per byte, high bit set on all but the last"""
+    if value < 0x80:
+        return bytes((value,))
+    out = bytearray((value & 0x7F,))
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    out.reverse()
+    return bytes(out)
+
+
+class SmfWriter:
+    """Writes one format-0 track of (absolute tick, message) events in time order"""
+
+    def __init__(self, path, ppqn=DEFAULT_PPQN, tempo=120):
+        self.ppqn = ppqn
+        self.file = open(path, 'wb')
+        self.last_tick = 0
+        self.events = 0
+        self._running_status = 0
+        self.file.write(b'MThd' + struct.pack('>IHHH', 6, 0, 1, ppqn))
+        self.file.write(b'MTrk')
+        self._length_offset = self.file.tell()
+        self.file.write(b'\x00\x00\x00\x00')  # Patched in by close()
+        self._track_start = self.file.tell()
+        self.set_tempo(0, tempo)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def set_tempo(self, tick, tempo):
+        """Tempo meta event (microseconds per quarter note)"""
+        microseconds = int(round(60_000_000 / max(1, tempo)))
+        self._delta(tick)
+        self.file.write(b'\xff\x51\x03' + microseconds.to_bytes(3, 'big'))
+        self._running_status = 0  # Meta events cancel running status
+
+    def write(self, tick, status, data1, data2=None):
+        """Channel message at an absolute tick (ticks must not go backwards)"""
+        self._delta(tick)
+        if status != self._running_status:
+            self.file.write(bytes((status, data1)) if data2 is None else bytes((status, data1, data2)))
+            self._running_status = status
+        else:
+            self.file.write(bytes((data1,)) if data2 is None else bytes((data1, data2)))
+        self.events += 1
+
+    def note_on(self, tick, note, velocity, channel=0):
+        self.write(tick, 0x90 | (channel & 0x0F), note, velocity)
+
+    def note_off(self, tick, note, channel=0):
+        self.write(tick, 0x80 | (channel & 0x0F), note, 0)
+
+    def control_change(self, tick, controller, value, channel=0):
+        self.write(tick, 0xB0 | (channel & 0x0F), controller, value)
+
+    def close(self):
+        """Terminate the track, patch its length and close the file"""
+        if self.file.closed:
+            return
+        self._delta(self.last_tick)
+        self.file.write(END_OF_TRACK)
+        end = self.file.tell()
+        self.file.seek(self._length_offset)
+        self.file.write(struct.pack('>I', end - self._track_start))
+        self.file.close()
+
+    def _delta(self, tick):
+        if tick < self.last_tick:
+            raise ValueError(f"Events must be written in time order: tick {tick} after {self.last_tick}")
+        self.file.write(encode_vlq(tick - self.last_tick))
+        self.last_tick = tick
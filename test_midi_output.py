@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Test script to validate the MIDI output buffers and event log of Isogrid without a device
+"""
+import io
+import os
+import struct
+import tempfile
+import time
+from midi_buffer import MidiEncoder, ControllerCache, CLOCK
+from midi_ports import PortPool, PortSender
+from event_log import EventLog, DEBUG, INFO, OFF
+from smf_writer import SmfWriter, encode_vlq
+from offline_render import render_to_smf
+from sequencer_engine import SequencerEngine
+
+class TestMidiOutput:
+    def pending_bytes(self, encoder):
+        offset, length = encoder.take()
+        return bytes(encoder.buffer[offset:offset + length])
+
+    def test_encoder(self):
+        """Test typed messages are encoded with per-channel status bytes"""
+        print("\n--- Testing MIDI Encoder ---")
+        encoder = MidiEncoder()
+        encoder.note_on(36, 100)
+        encoder.note_off(36, channel=1)
+        encoder.control_change(23, 64, channel=15)
+        encoder.program_change(5, channel=2)
+        encoder.pitch_bend(8192, channel=3)
+        data = self.pending_bytes(encoder)
+        print(f"  Encoded: {data.hex(' ')}")
+        assert data == bytes([0x90, 36, 100, 0x81, 36, 0, 0xBF, 23, 64, 0xC2, 5, 0xE3, 0x00, 0x40])
+
+    def test_batch(self):
+        """Test messages queue into one region"""
+        print("\n--- Testing MIDI Batch ---")
+        encoder = MidiEncoder()
+        encoder.begin(timestamp=1000)
+        encoder.write(0xB0, 23, 64)
+        encoder.write(0xB0, 9, 127)
+        encoder.write(0xC0, 5)
+        encoder.write(0x90, 36, 100)
+        assert encoder.timestamp == 1000
+        assert encoder.end()
+        data = self.pending_bytes(encoder)
+        print(f"  Buffer: {data.hex(' ')}")
+        assert data == bytes([0xB0, 23, 64, 0xB0, 9, 127, 0xC0, 5, 0x90, 36, 100])
+        assert encoder.pending == 0
+
+    def test_nested_batch(self):
+        """Test only the outermost batch end reports completion"""
+        print("\n--- Testing Nested Batch ---")
+        encoder = MidiEncoder()
+        encoder.begin(timestamp=1)
+        encoder.begin(timestamp=2)
+        assert not encoder.end()
+        assert encoder.active
+        assert encoder.end()
+        assert encoder.timestamp == 1
+        print("  SUCCESS: Outer batch owns the timestamp")
+
+    def test_running_status(self):
+        """Test repeated status bytes are dropped within a region"""
+        print("\n--- Testing Running Status ---")
+        encoder = MidiEncoder(running_status=True)
+        encoder.write(0xB0, 23, 64)
+        encoder.write(0xB0, 9, 127)
+        encoder.write(0x90, 36, 100)
+        encoder.write(0x90, 40, 100)
+        data = self.pending_bytes(encoder)
+        print(f"  Buffer: {data.hex(' ')}")
+        assert data == bytes([0xB0, 23, 64, 9, 127, 0x90, 36, 100, 40, 100])
+        # A new region starts over with a full status byte
+        encoder.write(0x90, 41, 100)
+        assert self.pending_bytes(encoder) == bytes([0x90, 41, 100])
+        # Real-time bytes interleave without cancelling running status
+        encoder.write(0x90, 36, 100)
+        encoder.realtime(CLOCK)
+        encoder.write(0x90, 40, 100)
+        assert self.pending_bytes(encoder) == bytes([0x90, 36, 100, 0xF8, 40, 100])
+
+    def test_region_full(self):
+        """Test a full region refuses messages instead of overflowing"""
+        print("\n--- Testing Full Region ---")
+        encoder = MidiEncoder(max_region=6)
+        assert encoder.write(0x90, 36, 100)
+        assert encoder.write(0x90, 37, 100)
+        assert not encoder.write(0x90, 38, 100)
+        assert encoder.pending == 6
+
+    def test_ring_wrap(self):
+        """Test the ring wraps without splitting a pending region"""
+        print("\n--- Testing Ring Wrap ---")
+        encoder = MidiEncoder(size=16)
+        for note in range(4):
+            encoder.note_on(note, 100)
+            encoder.take()
+        assert encoder.pos == 12
+        encoder.note_on(60, 100)  # Fits exactly at the end
+        encoder.note_on(61, 100)  # Needs a wrap: the pending note 60 moves along
+        offset, length = encoder.take()
+        print(f"  Region after wrap: offset={offset}, length={length}")
+        assert offset == 0
+        assert bytes(encoder.buffer[offset:offset + length]) == bytes([0x90, 60, 100, 0x90, 61, 100])
+
+    def test_send_to(self):
+        """Test the pending region is handed to the port in place"""
+        print("\n--- Testing Send To Port ---")
+        calls = []
+
+        class Port:
+            def send(self, data, offset, length, timestamp=None):
+                calls.append((data, offset, length, timestamp))
+
+        encoder = MidiEncoder()
+        encoder.control_change(23, 64)
+        encoder.note_on(36, 100)
+        assert encoder.send_to(Port(), 5000) == 6
+        data, offset, length, timestamp = calls[0]
+        assert data is encoder.buffer  # No copy
+        assert (offset, length, timestamp) == (0, 6, 5000)
+        assert encoder.send_to(Port()) == 0  # Nothing pending, nothing sent
+        assert len(calls) == 1
+
+    def test_port_pool(self):
+        """Test each port batches on its own and a queued port never blocks the caller"""
+        print("\n--- Testing Port Pool ---")
+        import threading
+
+        class Port:
+            def __init__(self, gate=None):
+                self.sent = []
+                self.gate = gate
+                self.closed = False
+
+            def send(self, data, offset, length, timestamp=None):
+                if self.gate is not None:
+                    self.gate.wait(5)  # A stalled Bluetooth link
+                self.sent.append((bytes(data[offset:offset + length]), timestamp))
+
+            def close(self):
+                self.closed = True
+
+        gate = threading.Event()
+        pool = PortPool()
+        usb, other, ble = Port(), Port(), Port(gate)
+        pool.add('usb', usb)
+        pool.add('other', other)
+        pool.add('ble', ble, queued=True)
+        assert pool.get() is pool.get('usb') and pool.names() == ['usb', 'other', 'ble']
+
+        pool.begin_batch(1000)
+        pool.get('usb').write(0x90, 36, 100)
+        pool.get('usb').write(0xB0, 23, 64)
+        pool.get('ble').write(0x90, 48, 90)
+        start = time.perf_counter()
+        pool.end_batch()
+        assert time.perf_counter() - start < 1  # The stalled port did not hold up the others
+        assert usb.sent == [(bytes([0x90, 36, 100, 0xB0, 23, 64]), 1000)]
+        assert other.sent == [] and ble.sent == []
+        gate.set()
+        for _ in range(100):
+            if ble.sent:
+                break
+            time.sleep(0.01)
+        print(f"  usb: {usb.sent}, ble: {ble.sent}")
+        assert ble.sent == [(bytes([0x90, 48, 90]), 1000)]
+
+        # Controller values are tracked per port
+        assert pool.get('usb').cc_cache.should_send(23, 64) is True
+        assert pool.get('usb').cc_cache.should_send(23, 64) is False
+        assert pool.get('other').cc_cache.should_send(23, 64) is True
+
+        # Replacing or removing the default port moves the default on
+        pool.add('usb', Port())
+        assert usb.closed and pool.get().port is not usb
+        assert pool.remove('usb') and pool.get().name == 'other'
+        pool.close()
+        assert ble.closed and len(pool) == 0 and pool.get() is None
+
+    def test_port_sender_overflow(self):
+        """Test a stalled link drops new batches first and never a note-off or Stop"""
+        print("\n--- Testing Port Sender Overflow ---")
+        import threading
+
+        class Port:
+            def __init__(self, gate):
+                self.sent = []
+                self.gate = gate
+
+            def send(self, data, offset, length, timestamp=None):
+                self.gate.wait(5)
+                self.sent.append(bytes(data[offset:offset + length]))
+
+        gate = threading.Event()
+        port = Port(gate)
+        sender = PortSender(port, 'ble', capacity=4)
+        for note in range(36, 46):
+            sender.put(bytes([0x90, note, 100]))
+            sender.put(bytes([0x80, note, 0]))
+            sender.put(bytes([0x90, note + 20, 100, note + 20, 0]))  # Note-on at velocity 0 ends the note too
+        sender.put(bytes([0xB0, 23, 64]))
+        sender.put(bytes([0xFC]))
+        gate.set()
+        for _ in range(100):
+            if port.sent and port.sent[-1] == bytes([0xFC]):
+                break
+            time.sleep(0.01)
+        sender.stop()
+        print(f"  Sent {len(port.sent)} batches, dropped {sender.dropped}")
+        assert sender.dropped > 0
+        for note in range(36, 46):
+            assert bytes([0x80, note, 0]) in port.sent
+            assert bytes([0x90, note + 20, 100, note + 20, 0]) in port.sent
+        assert port.sent[-1] == bytes([0xFC]) and bytes([0xB0, 23, 64]) not in port.sent
+
+    def test_port_reconnect(self):
+        """Test a failing port is held once, and its state messages replayed when it returns"""
+        print("\n--- Testing Port Reconnect ---")
+
+        class DeadPort:
+            def __init__(self):
+                self.attempts = 0
+
+            def send(self, data, offset, length, timestamp=None):
+                self.attempts += 1
+                raise OSError("device detached")
+
+            def close(self):
+                pass
+
+        class Port:
+            def __init__(self):
+                self.sent = []
+
+            def send(self, data, offset, length, timestamp=None):
+                self.sent.append(bytes(data[offset:offset + length]))
+
+            def close(self):
+                pass
+
+        pool = PortPool(reconnect_buffer=4)
+        failed = []
+        pool.on_failure = failed.append  # The driver reopens the device from here
+        dead = DeadPort()
+        pool.add('synth', dead)
+        for note in range(10):
+            pool.get().write(0x90, 36 + note, 100)  # No exception reaches the caller
+        assert dead.attempts == 1 and failed == ['synth']  # Held and reported after the first failure
+        assert pool.get().name == 'synth' and pool.get().cc_cache is None
+        pool.get().write(0xB0, 9, 40)  # A parameter lock, then many position CCs
+        for value in range(6):
+            pool.get().write(0xB0, 23, value)
+        pool.get().write(0xC0, 5, None)
+        print(f"  Held port dropped {pool.get().dropped} messages, kept {list(pool.get().buffer.values())}")
+
+        port = Port()
+        pool.add('synth', port)
+        assert pool.get().port is port
+        # Notes are dropped; the latest controller/program messages come back in one write
+        assert port.sent == [bytes([0xB0, 9, 40, 0xB0, 23, 5, 0xC0, 5])]
+        assert pool.disconnect('synth') and not pool.disconnect('synth')
+        assert pool.get().buffer is not None and len(pool) == 1
+
+    def test_event_log(self):
+        """Test the log gates by level, buffers records and formats them on drain"""
+        print("\n--- Testing Event Log ---")
+        stream = io.StringIO()
+        event_log = EventLog(level=INFO, stream=stream, autostart=False)
+        event_log.debug('MOCK', "Note ON: %s", 36)  # Below the level: dropped
+        event_log.info('MOCK', "CC %s on ch.%s: %s", 23, 0, 64)
+        event_log.error('ERROR', "Failed: %s", ValueError("bad"))
+        assert stream.getvalue() == ""  # Nothing written until drained
+        assert event_log.drain() == 2
+        print(f"  Output: {stream.getvalue()!r}")
+        assert stream.getvalue() == "[MOCK] CC 23 on ch.0: 64\n[ERROR] Failed: bad\n"
+        assert event_log.recent(1) == ["[ERROR] Failed: bad"]
+
+        event_log.level = OFF
+        event_log.error('ERROR', "dropped")
+        assert event_log.drain() == 0
+
+    def test_event_log_ring(self):
+        """Test a full ring overwrites the oldest records and counts them"""
+        print("\n--- Testing Event Log Ring ---")
+        stream = io.StringIO()
+        event_log = EventLog(level=DEBUG, capacity=4, stream=stream, autostart=False)
+        for note in range(6):
+            event_log.debug('MOCK', "Note ON: %s", note)
+        assert event_log.dropped == 2
+        event_log.drain()
+        assert stream.getvalue().split()[-1] == "5"
+        assert stream.getvalue().count("Note ON") == 4
+
+    def test_controller_cache(self):
+        """Test unchanged CC values are suppressed per channel and controller"""
+        print("\n--- Testing Redundant CC Suppression ---")
+        cache = ControllerCache()
+        sent = [cache.should_send(cc, value, channel) for cc, value, channel in [
+            (23, 64, 0), (23, 64, 0), (23, 65, 0), (23, 65, 1), (9, 65, 0), (23, 65, 0), (23, 64, 0)]]
+        print(f"  Sent: {sent}")
+        assert sent == [True, False, True, True, True, False, True]
+        assert cache.suppressed == 2
+        cache.reset()
+        assert cache.should_send(23, 64, 0)
+
+    def test_controller_cache_refresh(self):
+        """Test the periodic refresh re-sends unchanged values"""
+        print("\n--- Testing CC Refresh ---")
+        cache = ControllerCache(refresh_interval_ms=20)
+        assert cache.should_send(23, 64)
+        assert not cache.should_send(23, 64)
+        time.sleep(0.03)
+        assert cache.should_send(23, 64)
+        assert not cache.should_send(23, 64)
+
+    def parse_track(self, track):
+        """Decode a track into (tick, status, data1, data2) channel events"""
+        events = []
+        tick = pos = status = 0
+        while pos < len(track):
+            delta = 0
+            while True:
+                byte = track[pos]
+                pos += 1
+                delta = (delta << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            tick += delta
+            if track[pos] == 0xFF:  # Meta event
+                pos += 3 + track[pos + 2]
+                status = 0
+                continue
+            if track[pos] & 0x80:
+                status = track[pos]
+                pos += 1
+            events.append((tick, status & 0xF0, track[pos], track[pos + 1]))
+            pos += 2
+        return events
+
+    def test_smf_writer(self):
+        """Test the streaming writer produces a valid format-0 file"""
+        print("\n--- Testing SMF Writer ---")
+        assert encode_vlq(0) == b'\x00'
+        assert encode_vlq(127) == b'\x7f'
+        assert encode_vlq(128) == b'\x81\x00'
+        assert encode_vlq(0x3FFF) == b'\xff\x7f'
+        assert encode_vlq(0x200000) == b'\x81\x80\x80\x00'
+
+        path = os.path.join(tempfile.mkdtemp(), 'test.mid')
+        with SmfWriter(path, ppqn=96, tempo=120) as writer:
+            writer.note_on(0, 36, 100)
+            writer.note_on(0, 40, 100)  # Running status: no status byte
+            writer.note_off(200, 36)
+            try:
+                writer.note_off(100, 40)
+                assert False, "Out-of-order events should be rejected"
+            except ValueError:
+                pass
+        with open(path, 'rb') as f:
+            data = f.read()
+        print(f"  File: {data.hex(' ')}")
+        assert data[:14] == b'MThd' + struct.pack('>IHHH', 6, 0, 1, 96)
+        assert data[14:18] == b'MTrk'
+        track = data[22:]
+        assert struct.unpack('>I', data[18:22])[0] == len(track)
+        assert track == bytes([0x00, 0xFF, 0x51, 0x03, 0x07, 0xA1, 0x20,  # 500000 us per quarter
+                               0x00, 0x90, 36, 100, 0x00, 40, 100,
+                               0x81, 0x48, 0x80, 36, 0,
+                               0x00, 0xFF, 0x2F, 0x00])
+
+    def test_offline_render(self):
+        """Test a seeded offline render is reproducible and gates every note"""
+        print("\n--- Testing Offline Render ---")
+        directory = tempfile.mkdtemp()
+        outputs = []
+        for name in ('a.mid', 'b.mid'):
+            engine = SequencerEngine(seed=11)
+            engine.set_x_mode('Random')
+            engine.set_x_cc('Cutoff (23)')
+            for step in range(engine.step_count):
+                engine.step_states[step] = True
+                engine.step_probabilities[step] = 0.5
+            engine.step_cc_values[3] = {9: 100}
+            summary = render_to_smf(engine, os.path.join(directory, name), bars=8)
+            with open(os.path.join(directory, name), 'rb') as f:
+                outputs.append(f.read())
+        print(f"  {summary['steps']} steps, {summary['notes']} notes, {summary['realtime_factor']:.0f}x real time")
+        assert outputs[0] == outputs[1]
+        assert summary['steps'] == 128 and 0 < summary['notes'] < 128
+        events = self.parse_track(outputs[0][22:])
+        note_ons = [event for event in events if event[1] == 0x90]
+        note_offs = [event for event in events if event[1] == 0x80]
+        assert len(note_ons) == len(note_offs) == summary['notes']
+        assert any(status == 0xB0 and data1 == 9 and data2 == 100 for _, status, data1, data2 in events)
+        assert [event[0] for event in events] == sorted(event[0] for event in events)
+
+
+def main():
+    print("Testing Isogrid MIDI Output")
+    print("=" * 40)
+
+    test = TestMidiOutput()
+    test.test_encoder()
+    test.test_batch()
+    test.test_nested_batch()
+    test.test_running_status()
+    test.test_region_full()
+    test.test_ring_wrap()
+    test.test_send_to()
+    test.test_port_pool()
+    test.test_port_sender_overflow()
+    test.test_port_reconnect()
+    test.test_controller_cache()
+    test.test_controller_cache_refresh()
+    test.test_event_log()
+    test.test_event_log_ring()
+    test.test_smf_writer()
+    test.test_offline_render()
+
+    print("\n--- Test Complete ---")
+    print("All MIDI output and logging components are working correctly!")
+
+if __name__ == "__main__":
+    main()
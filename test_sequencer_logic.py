@@ -2,288 +2,943 @@
 """
 Test script to validate the core sequencer logic of Isogrid without UI
 """
+import os
 import random
+import struct
+import tempfile
+import threading
+from sequencer_engine import (SequencerEngine, PreparedPattern, euclidean_rhythm, euclidean_mask, NOTE_ON,
+                              CONTROL_CHANGE, X_DRIVER_MODES, Y_DRIVER_MODES, BAR_PULSES)
+from sequencer_clock import SequencerClock, step_interval_ns
+from event_scheduler import LookaheadScheduler
+from clock_sync import ExternalClockSync, CLOCK, START, STOP
+from tick_profiler import profiler, TickProfiler, LatencyHistogram, STARTUP_IMPORTS, STARTUP_FIRST_FRAME
+from pattern_bank import PatternBank, PatternSlots, Pattern, FORMAT_VERSION
+from matrix_highlight import MatrixHighlighter, CELL_OFF, CELL_ON, LINE_OFF, LINE_ON, CELL_ACTIVE
 
-def euclidean_rhythm(steps, pulses):
-    """Generate an Euclidean rhythm pattern"""
-    if pulses > steps or pulses < 0:
-        return [True] * steps  # Return all active if invalid
-    
-    pattern = [0] * steps
-    if pulses == 0:
-        return pattern
-    
-    counts = [1] * pulses
-    remainders = [steps % pulses] * (steps % pulses) + [0] * (pulses - steps % pulses)
-    
-    divisor = steps // pulses
-    j = 0
-    while True:
-        if sum(remainders) == 0:
-            break
-        counts = remainders + counts[:-len(remainders)]
-        remainders = counts[:divisor] * (len(remainders) // divisor) + counts[:len(remainders) % divisor]
-    
-    pattern = []
-    for count in counts:
-        pattern.extend([1] + [0] * (count - 1))
-    
-    # Trim to correct length
-    pattern = pattern[:steps]
-    pattern = [bool(x) for x in pattern]
-    
-    # Pad with False if needed
-    while len(pattern) < steps:
-        pattern.append(False)
-        
-    return pattern
+
+class RecordingMidi:
+    """Stand-in for MidiDriver that records (kind, data, timestamp) instead of sending"""
+
+    def __init__(self):
+        self.sent = []
+        self.batches = []
+        self.destinations = []
+
+    def begin_batch(self, timestamp=None):
+        self.batches.append(timestamp)
+
+    def end_batch(self):
+        pass
+
+    def send_note_on(self, note, velocity=127, channel=0, timestamp=None, destination=None):
+        self.sent.append(('on', note, velocity, timestamp))
+        self.destinations.append(destination)
+
+    def send_note_off(self, note, channel=0, timestamp=None, destination=None):
+        self.sent.append(('off', note, 0, timestamp))
+        self.destinations.append(destination)
+
+    def send_cc(self, controller, value, channel=0, timestamp=None, destination=None):
+        self.sent.append(('cc', controller, value, timestamp))
+        self.destinations.append(destination)
+
+    def send_realtime(self, status, timestamp=None):
+        self.sent.append(('rt', status, 0, timestamp))
 
 class TestSequencer:
     def __init__(self):
-        # Initialize sequencer variables
-        self.current_x = 0
-        self.current_y = 0
-        self.x_direction = 1
-        self.y_direction = 1
-        self.step_states = [False] * 16  # Track which steps are enabled
-        self.step_notes = [i % 12 + 36 for i in range(16)]  # Default note values (C2 to B3)
-        self.step_velocities = [100] * 16  # Default velocities
-        self.step_probabilities = [1.0] * 16  # Default probabilities (100%)
-        self.step_cc_values = [{} for _ in range(16)]  # CC values for each step
-        self.step_teleport_targets = [-1] * 16  # Wormhole mode targets (-1 = no teleport)
-        
+        self.engine = SequencerEngine()
+
         # Set some steps as active for testing
-        self.step_states[0] = True
-        self.step_states[5] = True
-        self.step_states[10] = True
-        self.step_states[15] = True
-        
+        self.engine.step_states[0] = True
+        self.engine.step_states[5] = True
+        self.engine.step_states[10] = True
+        self.engine.step_states[15] = True
+
         # Set some step-specific CC values for testing
-        self.step_cc_values[5] = {23: 64}  # Cutoff on step 5
-        self.step_cc_values[10] = {9: 100}  # Osc Type on step 10
-    
-    def update_x_position(self, mode='Forward', speed='1/16'):
-        # Handle Euclidean rhythm for X axis
-        if mode == 'Euclidean':
-            euclidean_x_steps = euclidean_rhythm(4, 2)  # 4 steps, 2 pulses
-            euclidean_x_index = getattr(self, 'euclidean_x_index', 0)
-            
-            if euclidean_x_steps[euclidean_x_index]:
-                # Only move if this step is active in the Euclidean pattern
-                self.current_x = (self.current_x + 1) % 4
-            self.euclidean_x_index = (euclidean_x_index + 1) % len(euclidean_x_steps)
-        elif mode == 'Random':
-            self.current_x = random.randint(0, 3)
-        elif mode == 'Forward':
-            self.current_x = (self.current_x + 1) % 4
-        elif mode == 'Backward':
-            self.current_x = (self.current_x - 1) % 4
-        elif mode == 'Pendulum':
-            self.current_x += self.x_direction
-            if self.current_x >= 3:
-                self.x_direction = -1
-            elif self.current_x <= 0:
-                self.x_direction = 1
-            if self.current_x < 0:
-                self.current_x = 0
-            elif self.current_x > 3:
-                self.current_x = 3
-    
-    def update_y_position(self, mode='Forward', speed='1/16'):
-        # Handle Euclidean rhythm for Y axis
-        if mode == 'Euclidean':
-            euclidean_y_steps = euclidean_rhythm(4, 3)  # 4 steps, 3 pulses
-            euclidean_y_index = getattr(self, 'euclidean_y_index', 0)
-            
-            if euclidean_y_steps[euclidean_y_index]:
-                # Only move if this step is active in the Euclidean pattern
-                self.current_y = (self.current_y + 1) % 4
-            self.euclidean_y_index = (euclidean_y_index + 1) % len(euclidean_y_steps)
-        elif mode == 'Random':
-            self.current_y = random.randint(0, 3)
-        elif mode == 'Forward':
-            self.current_y = (self.current_y + 1) % 4
-        elif mode == 'Backward':
-            self.current_y = (self.current_y - 1) % 4
-        elif mode == 'Pendulum':
-            self.current_y += self.y_direction
-            if self.current_y >= 3:
-                self.y_direction = -1
-            elif self.current_y <= 0:
-                self.y_direction = 1
-            if self.current_y < 0:
-                self.current_y = 0
-            elif self.current_y > 3:
-                self.current_y = 3
-        elif mode == 'Logic Advance':
-            # Only advance Y if X position is at a high-velocity step (velocity > 100)
-            # Get the current X position step index for the current Y row
-            x_step_index = (self.current_y * 4) + self.current_x
-            if self.step_velocities[x_step_index] > 100:
-                self.current_y = (self.current_y + 1) % 4
-    
+        self.engine.step_cc_values[5] = {23: 64}  # Cutoff on step 5
+        self.engine.step_cc_values[10] = {9: 100}  # Osc Type on step 10
+
     def tick(self, x_mode='Forward', y_mode='Forward'):
-        # Update X position based on X driver logic
-        self.update_x_position(x_mode)
-        
-        # Update Y position based on Y driver logic
-        self.update_y_position(y_mode)
-        
-        # Calculate the active step index
-        active_step_index = (self.current_y * 4) + self.current_x
-        
-        # Check for wormhole teleportation
-        if self.step_teleport_targets[active_step_index] != -1:
-            # Teleport to the target step immediately
-            active_step_index = self.step_teleport_targets[active_step_index]
-            # Update current X and Y based on new step index
-            self.current_x = active_step_index % 4
-            self.current_y = active_step_index // 4
-        
-        print(f"Step: ({self.current_x}, {self.current_y}) -> Index: {active_step_index}")
-        
-        # Play the note at the intersection if step is enabled and passes probability check
-        if self.step_states[active_step_index]:
-            if random.random() <= self.step_probabilities[active_step_index]:
-                note_value = self.step_notes[active_step_index]
-                velocity = self.step_velocities[active_step_index]
-                
-                # Apply parameter lock if any CC values are set for this step
-                if self.step_cc_values[active_step_index]:
-                    for cc_num, cc_val in self.step_cc_values[active_step_index].items():
-                        print(f"  CC {cc_num}: {cc_val}")
-                
-                print(f"  Note ON: {note_value} (velocity: {velocity})")
-                return True, note_value, velocity
-            else:
+        self.engine.set_x_mode(x_mode)
+        self.engine.set_y_mode(y_mode)
+        events = self.engine.tick()
+        active_step_index = self.engine.active_step
+
+        print(f"Step: ({self.engine.current_x}, {self.engine.current_y}) -> Index: {active_step_index}")
+
+        played = False, None, None
+        for event_type, data1, data2 in events:
+            if event_type == CONTROL_CHANGE:
+                print(f"  CC {data1}: {data2}")
+            elif event_type == NOTE_ON:
+                print(f"  Note ON: {data1} (velocity: {data2})")
+                played = True, data1, data2
+
+        if not played[0]:
+            if self.engine.step_states[active_step_index]:
                 print(f"  Step {active_step_index} skipped due to probability")
-        else:
-            print(f"  Step {active_step_index} is disabled")
-        
-        return False, None, None
-    
+            else:
+                print(f"  Step {active_step_index} is disabled")
+
+        return played
+
+    def test_euclidean_rhythm(self):
+        """Test Euclidean pattern generation"""
+        print("\n--- Testing Euclidean Rhythm ---")
+        for steps, pulses in [(4, 2), (4, 3), (8, 3), (16, 5)]:
+            pattern = euclidean_rhythm(steps, pulses)
+            print(f"  E({pulses},{steps}): {''.join('x' if hit else '.' for hit in pattern)}")
+            assert len(pattern) == steps
+            assert sum(pattern) == pulses
+        assert euclidean_rhythm(0, 3) == []
+        assert euclidean_rhythm(4, 0) == [False] * 4
+        assert euclidean_rhythm(4, 9) == [True] * 4
+
+    def test_euclidean_mask(self):
+        """Test cached bitmask patterns, rotation and the per-axis settings"""
+        print("\n--- Testing Euclidean Masks ---")
+        assert euclidean_mask(4, 2) == 0b1010  # .x.x, bit 0 is the first step
+        assert euclidean_mask(4, 2, 1) == 0b0101  # Rotated right by one: x.x.
+        assert euclidean_mask(8, 3, 8) == euclidean_mask(8, 3, 0)
+        assert bin(euclidean_mask(16, 5)).count('1') == 5
+        euclidean_mask.cache_clear()
+        for _ in range(3):
+            for pulses in range(17):  # A knob sweep, three times over
+                euclidean_mask(16, pulses, 0)
+        info = euclidean_mask.cache_info()
+        print(f"  Sweep cache: {info.hits} hits, {info.misses} misses")
+        assert info.misses == 17 and info.hits == 34
+
+        engine = SequencerEngine()
+        engine.set_x_mode('Euclidean')
+        engine.set_x_euclidean(5, 2, 1)  # ..x.x rotated right by one: x..x. -> bits 0 and 3
+        assert engine.euclidean_x == (5, 2, 1)
+        assert engine.euclidean_x_mask == 0b01001
+        moves = []
+        for _ in range(10):
+            before = engine.current_x
+            engine.tick()
+            moves.append(engine.current_x != before)
+        assert moves == [True, False, False, True, False] * 2
+        engine.set_y_euclidean(99, 120, -1)  # Clamped to a valid pattern
+        assert engine.euclidean_y == (32, 32, 31)
+
     def test_wormhole_mode(self):
         """Test wormhole teleportation"""
         print("\n--- Testing Wormhole Mode ---")
-        # Set up a teleportation: step 3 teleports to step 12
-        self.step_teleport_targets[3] = 12
-        self.current_x = 3
-        self.current_y = 0  # This means step index 3
-        
-        print(f"Before tick: X={self.current_x}, Y={self.current_y}, Step={self.current_x + self.current_y*4}")
+        # Set up a teleportation: step 6 teleports to step 12
+        self.engine.step_teleport_targets[6] = 12
+        self.engine.set_position(1, 0)  # Forward/Forward lands on (2, 1), i.e. step 6
+
+        print(f"Before tick: X=1, Y=0, Step=1")
         active, note, vel = self.tick()
-        print(f"After tick: X={self.current_x}, Y={self.current_y}, Step={self.current_x + self.current_y*4}")
-    
+        print(f"After tick: X={self.engine.current_x}, Y={self.engine.current_y}, Step={self.engine.current_x + self.engine.current_y*4}")
+        assert self.engine.active_step == 12
+        assert (self.engine.current_x, self.engine.current_y) == (0, 3)
+        self.engine.step_teleport_targets[6] = -1
+        self.engine.invalidate_path()
+
     def test_probability(self):
         """Test probability feature"""
         print("\n--- Testing Probability Feature ---")
-        import random
-
         # Temporarily make step 0 active and all others inactive
-        original_states = self.step_states[:]
-        self.step_states = [False] * 16
-        self.step_states[0] = True
+        original_states = self.engine.step_states[:]
+        self.engine.step_states = [False] * 16
+        self.engine.step_states[0] = True
 
         # Test 1: 0 probability should always skip
-        self.current_x = 0
-        self.current_y = 0
-        self.step_probabilities[0] = 0.0
+        self.engine.step_probabilities[0] = 0.0
         print(f"Test 1 - Step 0 with 0.0 probability:")
-        print(f"  Current position: X={self.current_x}, Y={self.current_y}, Index={(self.current_y * 4) + self.current_x}")
-
-        # We need to manually test probability since tick() updates position
-        active_step_index = (self.current_y * 4) + self.current_x
-        if self.step_states[active_step_index]:
-            if random.random() <= self.step_probabilities[active_step_index]:
-                print("  ERROR: Step was not skipped as expected (probability 0.0 should always skip)")
-            else:
-                print("  SUCCESS: Step was correctly skipped due to 0 probability")
+        skipped = 0
+        for _ in range(50):
+            self.engine.set_position(3, 3)  # Forward/Forward lands on step 0
+            events = self.engine.tick()
+            if not any(event[0] == NOTE_ON for event in events):
+                skipped += 1
+        if skipped == 50:
+            print("  SUCCESS: Step was correctly skipped due to 0 probability")
         else:
-            print("  Step is inactive")
+            print("  ERROR: Step was not skipped as expected (probability 0.0 should always skip)")
+        assert skipped == 50
 
         # Test 2: 1.0 probability should always play
-        self.step_probabilities[0] = 1.0
+        self.engine.step_probabilities[0] = 1.0
         print(f"\nTest 2 - Step 0 with 1.0 probability:")
-
-        if self.step_states[active_step_index]:
-            if random.random() <= self.step_probabilities[active_step_index]:
-                print("  SUCCESS: Step was correctly played due to 1.0 probability")
-            else:
-                print("  ERROR: Step was skipped despite 1.0 probability")
+        played = 0
+        for _ in range(50):
+            self.engine.set_position(3, 3)
+            events = self.engine.tick()
+            if any(event[0] == NOTE_ON for event in events):
+                played += 1
+        if played == 50:
+            print("  SUCCESS: Step was correctly played due to 1.0 probability")
         else:
-            print("  Step is inactive")
+            print("  ERROR: Step was skipped despite 1.0 probability")
+        assert played == 50
 
         # Restore original states
-        self.step_states = original_states
+        self.engine.step_states = original_states
 
     def test_logic_advance(self):
         """Test Logic Advance feature"""
         print("\n--- Testing Logic Advance Feature ---")
         # Set up a scenario where X at high-velocity step should advance Y
-        self.current_x = 0
-        self.current_y = 0
+        self.engine.set_y_mode('Logic Advance')
+        self.engine.current_x = 0
+        self.engine.current_y = 0
         # Set velocity of step (0,0) to be >100 to trigger Y advance
         step_0_idx = (0 * 4) + 0  # Step index 0
-        self.step_velocities[step_0_idx] = 110  # Higher than 100 threshold
+        self.engine.step_velocities[step_0_idx] = 110  # Higher than 100 threshold
 
-        print(f"Step (0,0) velocity: {self.step_velocities[0]} (threshold is 100)")
-        print(f"Before Logic Advance tick: X={self.current_x}, Y={self.current_y}")
-        self.update_y_position('Logic Advance')
-        print(f"After Logic Advance tick:  X={self.current_x}, Y={self.current_y}")
+        print(f"Step (0,0) velocity: {self.engine.step_velocities[0]} (threshold is 100)")
+        print(f"Before Logic Advance tick: X={self.engine.current_x}, Y={self.engine.current_y}")
+        self.engine.update_y_position()
+        print(f"After Logic Advance tick:  X={self.engine.current_x}, Y={self.engine.current_y}")
+        assert self.engine.current_y == 1
 
         # Reset for next test with low velocity
-        self.current_x = 1
-        self.current_y = 1
+        self.engine.current_x = 1
+        self.engine.current_y = 1
         step_5_idx = (1 * 4) + 1  # Step index 5
-        self.step_velocities[step_5_idx] = 80  # Below threshold
-        print(f"\nStep (1,1) velocity: {self.step_velocities[5]} (below threshold)")
-        print(f"Before Logic Advance tick: X={self.current_x}, Y={self.current_y}")
-        self.update_y_position('Logic Advance')
-        print(f"After Logic Advance tick:  X={self.current_x}, Y={self.current_y} (should not change)")
-    
+        self.engine.step_velocities[step_5_idx] = 80  # Below threshold
+        print(f"\nStep (1,1) velocity: {self.engine.step_velocities[5]} (below threshold)")
+        print(f"Before Logic Advance tick: X={self.engine.current_x}, Y={self.engine.current_y}")
+        self.engine.update_y_position()
+        print(f"After Logic Advance tick:  X={self.engine.current_x}, Y={self.engine.current_y} (should not change)")
+        assert self.engine.current_y == 1
+        self.engine.set_y_mode('Forward')
+
+    def test_position_ccs(self):
+        """Test X/Y position to CC mapping"""
+        print("\n--- Testing Position CCs ---")
+        self.engine.set_x_cc('Cutoff (23)')
+        self.engine.set_y_cc('Osc Type (9)')
+        self.engine.set_position(2, 2)
+        events = self.engine.tick()  # Forward/Forward lands on (3, 3)
+        print(f"  Events: {events}")
+        assert events[0] == (CONTROL_CHANGE, 23, 127)
+        assert events[1] == (CONTROL_CHANGE, 9, 127)
+        self.engine.set_x_cc('None')
+        self.engine.set_y_cc('None')
+
+    def test_driver_dispatch(self):
+        """Test modes and CC labels are resolved once, at selection time"""
+        print("\n--- Testing Driver Dispatch ---")
+        engine = SequencerEngine()
+        for mode in X_DRIVER_MODES:
+            engine.set_x_mode(mode)
+            assert engine.x_mode == mode
+        for mode in Y_DRIVER_MODES:
+            engine.set_y_mode(mode)
+            assert engine.y_mode == mode
+        engine.set_x_mode('Forward')
+        engine.set_x_mode('Sideways')  # Unknown modes keep the current driver
+        assert engine.x_mode == 'Forward'
+        engine.current_x = 0
+        engine.update_x_position()
+        assert engine.current_x == 1
+
+        engine.set_x_cc('Timbre (12)')
+        engine.set_y_cc('None')
+        assert (engine.x_cc_number, engine.y_cc_number) == (12, None)
+        print("  SUCCESS: Drivers and CC numbers compiled on selection")
+
     def test_all_drivers(self):
         """Test all driver modes"""
         print("\n--- Testing All Driver Modes ---")
-        
+
         modes = ['Forward', 'Backward', 'Pendulum', 'Random', 'Euclidean']
-        
+
         for mode in modes:
             print(f"\nTesting {mode} mode for X axis:")
-            self.current_x = 0
-            self.current_y = 0
+            self.engine.set_x_mode(mode)
+            self.engine.current_x = 0
+            self.engine.current_y = 0
             for i in range(8):
-                print(f"  Tick {i+1}: X={self.current_x}, Y={self.current_y}")
-                self.update_x_position(mode)
+                print(f"  Tick {i+1}: X={self.engine.current_x}, Y={self.engine.current_y}")
+                self.engine.update_x_position()
+                assert 0 <= self.engine.current_x < 4
                 if mode == 'Random':
                     break  # Random is too unpredictable for this test
+        self.engine.set_x_mode('Forward')
+
+    def test_path_table(self):
+        """Test deterministic drivers are tabulated and replay the live path"""
+        print("\n--- Testing Path Table ---")
+        configs = [('Forward', 'Forward'), ('Backward', 'Pendulum'), ('Pendulum', 'Euclidean'),
+                   ('Euclidean', 'Backward'), ('Forward', 'Logic Advance')]
+        for x_mode, y_mode in configs:
+            tabulated = SequencerEngine()
+            live = SequencerEngine()
+            for engine in (tabulated, live):
+                engine.set_x_mode(x_mode)
+                engine.set_y_mode(y_mode)
+                engine.step_teleport_targets[6] = 12
+                engine.step_velocities[3] = 120
+            expected = []
+            for _ in range(64):
+                tabulated.tick()
+                expected.append(tabulated.active_step)
+            path = tabulated.path
+            assert path is not None
+            # The live drivers, with no table involved
+            actual = [live._advance_position() for _ in range(len(expected))]
+            print(f"  {x_mode}/{y_mode}: cycle {path.cycle_length}, hits {list(path.hit_counts)}")
+            assert expected == actual
+            assert sum(path.hit_counts) == path.cycle_length
+            assert path.hit_counts[6] == 0  # Step 6 is always teleported away
+
+        # Forward/Forward with no wormholes visits the diagonal-shifted steps once each
+        engine = SequencerEngine()
+        engine.tick()
+        assert engine.path.cycle_length == 4
+        assert list(engine.path.steps) == [5, 10, 15, 0]
+
+        # Editing the configuration rebuilds the table from where the playhead is
+        engine.tick()
+        engine.step_teleport_targets[15] = 3
+        engine.invalidate_path()
+        engine.tick()
+        assert engine.active_step == 3
+        assert engine.path.hit_counts[15] == 0
+
+        # Random falls back to live evaluation
+        engine.set_x_mode('Random')
+        engine.tick()
+        assert engine.path is None
+
+    def test_grid_sizes(self):
+        """Test N x M grids, typed step arrays and resizing"""
+        print("\n--- Testing Grid Sizes ---")
+        engine = SequencerEngine(16, 16)
+        assert engine.step_count == 256
+        assert [getattr(engine, name).typecode for name in
+                ('step_states', 'step_notes', 'step_velocities', 'step_probabilities', 'step_teleport_targets')] \
+            == ['B', 'B', 'B', 'f', 'h']
+        engine.step_states[255] = True
+        events = [engine.tick() for _ in range(16)][-1]  # Forward/Forward walks the diagonal
+        print(f"  16x16 Forward/Forward: cycle {engine.path.cycle_length}, step {engine.active_step}")
+        assert engine.active_step == 0 and engine.path.cycle_length == 16
+        assert len(engine.path.hit_counts) == 256
+
+        # Axes wrap at their own size
+        engine = SequencerEngine(8, 2)
+        engine.set_x_cc('Cutoff (23)')
+        positions = []
+        for _ in range(8):
+            events = engine.tick()
+            positions.append((engine.current_x, engine.current_y))
+        assert positions[:3] == [(1, 1), (2, 0), (3, 1)] and positions[-1] == (0, 0)
+        assert events[0] == (CONTROL_CHANGE, 23, 0)
+        engine.set_x_mode('Random')
+        engine.set_y_mode('Pendulum')
+        for _ in range(50):
+            engine.tick()
+            assert 0 <= engine.current_x < 8 and 0 <= engine.current_y < 2
+
+        # Resizing keeps the steps (and wormholes) that still fit
+        engine = SequencerEngine()
+        engine.step_states[5] = True
+        engine.step_notes[5] = 60
+        engine.step_teleport_targets[1] = 6  # (1, 0) -> (2, 1)
+        engine.step_teleport_targets[2] = 15  # (2, 0) -> (3, 3): gone on a 4x2 grid
+        engine.resize(8, 8)
+        assert engine.step_states[9] and engine.step_notes[9] == 60
+        assert engine.step_teleport_targets[1] == 10
+        engine.resize(4, 2)
+        assert engine.step_count == 8
+        assert engine.step_states[5] and engine.step_teleport_targets[1] == 6
+        assert engine.step_teleport_targets[2] == -1
+        engine.set_position(3, 3)
+        engine.tick()
+        assert 0 <= engine.active_step < 8
+        try:
+            engine.resize(17, 4)
+            assert False, "17 columns should be rejected"
+        except ValueError:
+            pass
+
+    def test_matrix_highlight(self):
+        """Test only cells whose highlight changed are reported for repaint"""
+        print("\n--- Testing Matrix Highlight Diff ---")
+        highlighter = MatrixHighlighter()
+        states = [False] * 16
+        states[5] = True
+        states[6] = True
+        assert len(highlighter.update(states, 1, 1)) == 16  # First frame paints everything
+        codes = highlighter.codes
+        assert codes[5] == CELL_ACTIVE
+        assert (codes[6], codes[4], codes[9]) == (LINE_ON, LINE_OFF, LINE_OFF)
+        assert (codes[0], codes[10]) == (CELL_OFF, CELL_OFF)
+        assert highlighter.update(states, 1, 1) == []  # Nothing moved, nothing repainted
+
+        changed = highlighter.update(states, 2, 1)  # Only the column moves
+        print(f"  Moving X by one repaints {len(changed)} cells: {changed}")
+        assert changed == [1, 2, 5, 6, 9, 10, 13, 14]
+        assert codes[5] == LINE_ON and codes[6] == CELL_ACTIVE
+
+        states[0] = True
+        highlighter.forget(3)
+        assert highlighter.update(states, 2, 1) == [0, 3]
+        assert codes[0] == CELL_ON
+
+        # Non-square grids highlight the row and column of their own size
+        highlighter = MatrixHighlighter(8, 2)
+        highlighter.update([False] * 16, 6, 1)
+        assert list(highlighter.codes) == [0, 0, 0, 0, 0, 0, 2, 0] + [2] * 6 + [4, 2]
+
+    def test_seeded_randomness(self):
+        """Test pre-drawn randomness makes seeded runs reproducible"""
+        print("\n--- Testing Seeded Randomness ---")
+
+        def run(seed):
+            engine = SequencerEngine(8, 8, seed=seed)
+            engine.set_x_mode('Random')
+            engine.set_y_mode('Random')
+            for step in range(engine.step_count):
+                engine.step_states[step] = True
+                engine.step_probabilities[step] = 0.5
+            return [(engine.tick(), engine.active_step) for _ in range(2000)]
+
+        first = run(42)
+        assert first == run(42)
+        assert first != run(43)
+        steps = [step for _, step in first]
+        played = sum(1 for events, _ in first if events)
+        print(f"  2000 ticks: {len(set(steps))} distinct steps, {played} notes at p=0.5")
+        assert len(set(steps)) == 64  # Random moves reach every cell
+        assert 800 < played < 1200
+
+    def test_clock(self):
+        """Test the high-resolution clock thread keeps an absolute deadline grid"""
+        print("\n--- Testing Sequencer Clock ---")
+        deadlines = []
+        done = threading.Event()
+
+        def on_tick(deadline_ns):
+            deadlines.append(deadline_ns)
+            if len(deadlines) == 8:
+                clock.set_tempo(480)
+            if len(deadlines) == 16:
+                done.set()
+
+        clock = SequencerClock(on_tick, tempo=960)
+        clock.start()
+        assert done.wait(5)
+        clock.stop()
+
+        gaps = [b - a for a, b in zip(deadlines, deadlines[1:])]
+        print(f"  Deadline gaps (ms): {[round(gap / 1e6, 3) for gap in gaps]}")
+        print(f"  Report: {clock.stats.report()}")
+        assert all(gap == step_interval_ns(960) for gap in gaps[:7])
+        assert all(gap == step_interval_ns(480) for gap in gaps[7:15])
+
+    def test_lookahead_scheduler(self):
+        """Test steps are rendered ahead and timestamped independently of wake-up jitter"""
+        print("\n--- Testing Look-ahead Scheduler ---")
+        engine = SequencerEngine()
+        engine.step_states = [True] * 16
+        engine.step_cc_values[5] = {9: 50}  # First step lands on (1, 1)
+        midi = RecordingMidi()
+        scheduler = LookaheadScheduler(engine, midi, tempo=120, lookahead_ms=20, gate_ms=100)
+        interval = step_interval_ns(120)
+        scheduler.start()
+
+        # Wake-ups arrive late by varying amounts; timestamps must not move
+        for wake, late_ms in enumerate([0, 3, 0, 7, 1, 0]):
+            scheduler.advance(wake * interval + late_ms * 1_000_000)
+
+        note_ons = [entry for entry in midi.sent if entry[0] == 'on']
+        note_offs = [entry for entry in midi.sent if entry[0] == 'off']
+        print(f"  Note ONs: {note_ons}")
+        print(f"  Note OFFs: {note_offs}")
+        lookahead = 20_000_000
+        assert [entry[3] for entry in note_ons] == [lookahead + i * interval for i in range(len(note_ons))]
+        assert all(off[3] == on[3] + 100_000_000 for on, off in zip(note_ons, note_offs))
+        assert ('cc', 9, 50, lookahead) in midi.sent  # Parameter lock shares the step's timestamp
+        assert [entry[3] for entry in midi.sent] == sorted(entry[3] for entry in midi.sent)
+        # One batch (port write) per distinct timestamp
+        assert midi.batches == sorted(set(entry[3] for entry in midi.sent))
+
+        # Stopping flushes the held note-offs and drops the rest
+        pending_offs = scheduler.pending()
+        scheduler.stop()
+        assert scheduler.pending() == 0
+        assert len([entry for entry in midi.sent if entry[0] == 'off']) == len(note_offs) + pending_offs
+        scheduler.advance(10 * interval)
+        assert len([entry for entry in midi.sent if entry[0] == 'on']) == len(note_ons)
+
+    def test_axis_speeds(self):
+        """Test per-axis speeds: X at 1/32 moves four times per Y move at 1/8"""
+        print("\n--- Testing Axis Speeds ---")
+        engine = SequencerEngine()
+        engine.set_x_speed('1/32')
+        engine.set_y_speed('1/8')
+        live = SequencerEngine()
+        live.set_x_speed('1/32')
+        live.set_y_speed('1/8')
+        live._path_dirty = False  # Drive the live path only
+        moves = []
+        for _ in range(32):
+            engine.tick()
+            assert live._advance_position() == engine.active_step
+            assert engine.pulses_to_next_tick == live.pulses_to_next_tick == 12
+            moves.append((engine.current_x, engine.current_y))
+        print(f"  First moves: {moves[:8]}")
+        assert moves[:8] == [(1, 1), (2, 1), (3, 1), (0, 1), (1, 2), (2, 2), (3, 2), (0, 2)]
+        assert engine.path.cycle_length == 16
+
+        # Scheduler timestamps follow the master clock: 1/32 at 120 BPM is 62.5 ms
+        engine = SequencerEngine()
+        engine.step_states = [True] * 16
+        engine.set_x_speed('1/32')
+        engine.set_y_speed('1/4')
+        midi = RecordingMidi()
+        scheduler = LookaheadScheduler(engine, midi, tempo=120, lookahead_ms=20)
+        scheduler.start()
+        wake = scheduler.advance(0)
+        for _ in range(7):
+            wake = scheduler.advance(wake)
+        note_ons = [entry[3] for entry in midi.sent if entry[0] == 'on']
+        print(f"  Note ON times (ms): {[on / 1e6 for on in note_ons]}")
+        assert note_ons == [20_000_000 + i * 62_500_000 for i in range(8)]
+        assert wake == note_ons[-1] + 62_500_000 - 20_000_000  # Wakes one look-ahead before the next step
+
+        # The clock calls back when the callback asks rather than on its grid
+        deadlines = []
+        done = threading.Event()
+
+        def on_tick(deadline_ns):
+            deadlines.append(deadline_ns)
+            if len(deadlines) == 6:
+                done.set()
+            return deadline_ns + 3_000_000 * len(deadlines)
+
+        clock = SequencerClock(on_tick, tempo=30)
+        clock.start()
+        assert done.wait(5)
+        clock.stop()
+        gaps = [b - a for a, b in zip(deadlines, deadlines[1:])]
+        assert gaps == [3_000_000 * n for n in range(1, 6)]
+
+    def test_external_clock_sync(self):
+        """Test steps phase-lock to a jittery 24 PPQN clock and follow its tempo changes"""
+        print("\n--- Testing External Clock Sync ---")
+        jitter = random.Random(3)
+        engine = SequencerEngine()
+        engine.step_states = [True] * 16
+        midi = RecordingMidi()
+        scheduler = LookaheadScheduler(engine, midi, tempo=120, lookahead_ms=20)
+        sync = ExternalClockSync(scheduler)
+        start_ns = 1_000_000_000
+
+        def send_clock(origin_ns, tempo, pulses):
+            period = 60e9 / (tempo * 24)
+            for pulse in range(pulses):
+                sync.on_realtime(CLOCK, int(origin_ns + pulse * period + jitter.uniform(-1.5e6, 1.5e6)))
+            return period
+
+        send_clock(start_ns - 48 * 60e9 / (130 * 24), 130, 48)  # Master clock runs while stopped
+        assert not scheduler.running
+        sync.on_realtime(START, start_ns - 1000)
+        period = send_clock(start_ns, 130, 24 * 64)
+        note_ons = [entry[3] for entry in midi.sent if entry[0] == 'on']
+        # A 16th is 6 clock pulses; output trails the master by the look-ahead
+        errors = [on - (start_ns + step * 6 * period + 20_000_000) for step, on in enumerate(note_ons)]
+        print(f"  130 BPM: tracked {sync.tracker.tempo:.2f} BPM, {len(note_ons)} steps, "
+              f"max phase error {max(map(abs, errors)) / 1e6:.2f} ms")
+        assert len(note_ons) == 256
+        assert abs(sync.tracker.tempo - 130) < 0.5 and sync.tracker.locked
+        assert max(map(abs, errors)) < 1_500_000  # Under the clock's own jitter
+        assert abs(sum(errors[-64:]) / 64) < 500_000  # No drift
+
+        # The master speeds up: within a few beats steps are back on its grid
+        change_ns = start_ns + 24 * 64 * period
+        played = len(note_ons)
+        period = send_clock(change_ns, 140, 24 * 32)
+        note_ons = [entry[3] for entry in midi.sent if entry[0] == 'on'][played:]
+        errors = [on - (change_ns + step * 6 * period + 20_000_000) for step, on in enumerate(note_ons)]
+        print(f"  140 BPM: tracked {sync.tracker.tempo:.2f} BPM, last phase error {errors[-1] / 1e6:.2f} ms")
+        assert abs(sync.tracker.tempo - 140) < 0.5
+        assert max(map(abs, errors[-64:])) < 1_500_000
+
+        sync.on_realtime(STOP, change_ns + 24 * 32 * period)
+        assert not scheduler.running
+
+        # Local PAUSE/PLAY while slaved: playback resumes on the next clock at the master's rate
+        start_ns = change_ns + 24 * 40 * period
+        sync.on_realtime(START, start_ns - 1000)
+        send_clock(start_ns, 140, 24 * 8)
+        sync.pause()
+        send_clock(start_ns + 24 * 8 * period, 140, 24)
+        played = len([entry for entry in midi.sent if entry[0] == 'on'])
+        sync.play()
+        resume_ns = start_ns + 24 * 9 * period
+        send_clock(resume_ns, 140, 48)
+        note_ons = [entry[3] for entry in midi.sent if entry[0] == 'on'][played:]
+        print(f"  Resumed after pause: {len(note_ons)} steps in 2 beats")
+        assert len(note_ons) == 8
+        assert max(abs(on - (resume_ns + step * 6 * period + 20_000_000)) for step, on in enumerate(note_ons)) < 1_500_000
+
+    def test_clock_output(self):
+        """Test MIDI clock out: 24 PPQN on the step grid, Start first, Stop on stop"""
+        print("\n--- Testing Clock Output ---")
+        jitter = random.Random(5)
+        engine = SequencerEngine()
+        engine.step_states = [True] * 16
+        engine.set_x_speed('1/4')
+        engine.set_y_speed('1/4')
+        midi = RecordingMidi()
+        scheduler = LookaheadScheduler(engine, midi, tempo=240, lookahead_ms=20, send_clock=True)
+        scheduler.start()
+        # Wake-ups up to 5 ms late must not show in the clock timestamps
+        wake = scheduler.advance(0)
+        for _ in range(24 * 16):
+            wake = scheduler.advance(wake + jitter.randrange(5_000_000))
+        clocks = [entry[3] for entry in midi.sent if entry[:2] == ('rt', CLOCK)]
+        gaps = set(b - a for a, b in zip(clocks, clocks[1:]))
+        print(f"  {len(clocks)} clocks at 240 BPM, gaps {sorted(gaps)} ns")
+        assert midi.sent[0] == ('rt', START, 0, 20_000_000) and clocks[0] == 20_000_000
+        assert gaps <= {10_416_666, 10_416_667}  # 60 s / 240 / 24, integer ns
+        assert clocks[-1] == 20_000_000 + (len(clocks) - 1) * 60_000_000_000 // (240 * 24)
+        # Every quarter-note step lands on every 24th clock
+        note_ons = [entry[3] for entry in midi.sent if entry[0] == 'on']
+        assert note_ons[:8] == clocks[:24 * 8:24]
+
+        # Stop goes out after the clocks already handed to the port
+        scheduler.stop()
+        assert midi.sent[-1] == ('rt', STOP, 0, clocks[-1] + 1)
+
+        # Switched mid-song: Stop after the last rendered clock, Start again on the next bar line
+        midi = RecordingMidi()
+        scheduler = LookaheadScheduler(engine, midi, tempo=240, lookahead_ms=20, send_clock=True)
+        scheduler.start()
+        wake = scheduler.advance(0)
+        while wake < 300_000_000:
+            wake = scheduler.advance(wake)
+        scheduler.set_send_clock(False)
+        while wake < 600_000_000:
+            wake = scheduler.advance(wake)
+        realtime = [entry[1:4:2] for entry in midi.sent if entry[0] == 'rt']
+        assert realtime[-1] == (STOP, realtime[-2][1] + 1) and realtime[-2][0] == CLOCK
+        scheduler.set_send_clock(True)
+        while wake < 2_200_000_000:
+            wake = scheduler.advance(wake)
+        resumed = [entry[1:4:2] for entry in midi.sent if entry[0] == 'rt'][len(realtime):]
+        second_bar_ns = 20_000_000 + 60_000_000_000 * 4 // 240  # A bar lasts a second at 240 BPM
+        start = resumed.index((START, second_bar_ns))
+        assert resumed[start + 1] == (CLOCK, second_bar_ns)
+        assert all(status == CLOCK for status, _ in resumed[:start]) and start > 0  # Clocks keep the tempo
+        print(f"  Stop at {realtime[-1][1]} ns, Start again at {resumed[start][1]} ns")
+
+    def test_routing(self):
+        """Test position CCs and steps are queued for the ports the routing table names"""
+        print("\n--- Testing Output Routing ---")
+        engine = SequencerEngine()
+        engine.step_states = [True] * 16
+        engine.set_x_cc('Cutoff (23)')
+        engine.set_y_cc('Resonance (83)')
+        engine.step_cc_values[5] = {9: 50}  # First step lands on (1, 1)
+        midi = RecordingMidi()
+        scheduler = LookaheadScheduler(engine, midi, tempo=120, lookahead_ms=20, gate_ms=100)
+        scheduler.routing.x_axis = 'fx'
+        scheduler.routing.set_step(5, 'bass')
+        scheduler.routing.default = 'lead'
+        scheduler.start()
+        scheduler.advance(0)
+        scheduler.advance(200_000_000)
+
+        routed = list(zip(midi.sent, midi.destinations))
+        print(f"  {routed[:6]}")
+        first = [(entry[:3], destination) for entry, destination in routed if entry[3] == 20_000_000]
+        assert first == [(('cc', 23, 42), 'fx'), (('cc', 83, 42), 'lead'),
+                         (('cc', 9, 50), 'bass'), (('on', 41, 100), 'bass')]
+        assert (('off', 41, 0, 120_000_000), 'bass') in routed  # The note-off follows its note
+        assert all(destination == 'lead' for entry, destination in routed
+                   if entry[0] == 'on' and entry[3] > 20_000_000)
+
+    def test_tick_profiler(self):
+        """Test stage histograms are filled only while profiling is enabled"""
+        print("\n--- Testing Tick Profiler ---")
+        histogram = LatencyHistogram()
+        for duration_us in [3] * 90 + [40] * 9 + [7000]:
+            histogram.record(duration_us * 1000)
+        assert histogram.count == 100 and histogram.max == 7_000_000
+        assert histogram.percentile(0.5) == 5000  # 3 us falls in the 2-5 us bucket
+        assert histogram.percentile(0.99) == 50000
+        assert histogram.percentile(1.0) == 7_000_000  # Capped at the slowest sample
+        histogram.record(10 ** 12)  # Beyond the last edge
+        assert histogram.counts[-1] == 1 and histogram.percentile(1.0) == 10 ** 12
+
+        engine = SequencerEngine()
+        engine.step_states[5] = True
+        scheduler = LookaheadScheduler(engine, RecordingMidi(), tempo=120)
+        scheduler.start()
+        interval = step_interval_ns(120)
+        scheduler.advance(0)
+        assert all(histogram.count == 0 for histogram in profiler.histograms)
+
+        profiler.reset()
+        profiler.enabled = True
+        try:
+            for wake in range(1, 9):
+                scheduler.advance(wake * interval)
+        finally:
+            profiler.enabled = False
+        report = profiler.report()
+        print(profiler.summary())
+        assert report['drivers']['count'] == report['render']['count'] == 8
+        assert report['midi_flush']['count'] == 8
+        assert report['render']['p99_us'] >= report['drivers']['p50_us'] > 0
+        profiler.reset()
+
+        # The clock thread and the MIDI receive thread both record; no sample is lost
+        shared = TickProfiler(enabled=True)
+        threads = [threading.Thread(target=lambda: [shared.record(1, 3000) for _ in range(20000)])
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert shared.report()['drivers']['count'] == 40000
+        assert sum(shared.histograms[1].counts) == 40000
+
+        # Startup phases are plain durations, kept when the histograms are reset
+        startup = TickProfiler()
+        startup.mark_startup(STARTUP_IMPORTS, 850_000_000)
+        startup.mark_startup(STARTUP_FIRST_FRAME, 1_420_000_000)
+        startup.reset()
+        print(startup.startup_summary())
+        assert startup.startup_summary() == 'startup    imports 850  first_frame 1420 ms'
+        assert startup.summary().endswith(startup.startup_summary())
+
+    def test_pattern_bank(self):
+        """Test patterns survive the binary bank and the JSON export unchanged"""
+        print("\n--- Testing Pattern Bank ---")
+        engine = SequencerEngine(8, 4, seed=1)
+        engine.step_states[3] = True
+        engine.step_notes[3] = 60
+        engine.step_probabilities[3] = 0.35
+        engine.step_cc_values[3] = {9: 64, 23: 10}
+        engine.step_teleport_targets[6] = 30
+        engine.set_x_mode('Euclidean')
+        engine.set_y_mode('Logic Advance')
+        engine.set_y_speed('1/8')
+        engine.set_x_cc('Cutoff (23)')
+        engine.set_x_euclidean(7, 3, 1)
+        saved = Pattern.capture(engine).to_dict()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'patterns.isb')
+            with PatternBank(path, slots=16) as bank:
+                assert bank.load(0) is None and bank.used_slots() == []
+                bank.save(5, Pattern.capture(engine))
+            with PatternBank(path) as bank:
+                assert bank.slots == 16 and bank.used_slots() == [5]
+                loaded = SequencerEngine(seed=1)
+                bank.load(5).apply(loaded)
+                assert Pattern.capture(loaded).to_dict() == saved
+                assert (loaded.columns, loaded.rows, loaded.x_cc_number) == (8, 4, 23)
+                print(f"Slot 5: {loaded.columns}x{loaded.rows}, {loaded.x_mode}/{loaded.y_mode}, "
+                      f"locks {loaded.step_cc_values[3]}")
+
+                # JSON round trip, into another slot
+                export = os.path.join(directory, 'patterns.json')
+                assert bank.export_json(export) == 1
+                bank.clear(5)
+                with open(export) as f:
+                    text = f.read().replace('"5":', '"9":')
+                with open(export, 'w') as f:
+                    f.write(text)
+                assert bank.import_json(export) == 1
+                assert bank.used_slots() == [9] and bank.load(9).to_dict() == saved
+
+                # A damaged record is reported, not half-loaded
+                for offset, value in ((3, 200), (1, 0)):  # Unknown X mode, then a 0-column grid
+                    bank.save(2, Pattern.capture(engine))
+                    bank._map[bank._offset(2) + offset] = value
+                    try:
+                        bank.load(2)
+                        assert False, "Loaded a corrupt slot"
+                    except ValueError as e:
+                        print(f"Corrupt slot: {e}")
+
+            # A bank written by another format version is refused
+            with open(path, 'r+b') as f:
+                f.seek(4)
+                f.write(struct.pack('<H', FORMAT_VERSION + 1))
+            try:
+                PatternBank(path)
+                assert False, "Opened a bank of another version"
+            except ValueError as e:
+                print(f"Refused: {e}")
+
+    def test_pattern_chaining(self):
+        """Test queued patterns take over on bar lines, path prebuilt and without a missed step"""
+        print("\n--- Testing Pattern Chaining ---")
+        engine = SequencerEngine()
+        for step in range(engine.step_count):
+            engine.step_states[step] = True
+
+        def prepared(note, columns=4, rows=4, bars=1):
+            staging = SequencerEngine(columns, rows)
+            staging.set_x_mode('Pendulum')
+            for step in range(staging.step_count):
+                staging.step_states[step] = True
+                staging.step_notes[step] = note
+            return PreparedPattern(staging, bars=bars, tag=note)
+
+        # Queued mid-bar: the current pattern finishes its bar first
+        midi = RecordingMidi()
+        scheduler = LookaheadScheduler(engine, midi, tempo=120, lookahead_ms=20)
+        scheduler.start()
+        interval = step_interval_ns(120)
+        scheduler.advance(0)
+        scheduler.advance(5 * interval)
+        second, third = prepared(70, columns=8), prepared(80, bars=2)
+        engine.pattern_tag = 1
+        engine.queue_pattern(second)
+        engine.queue_pattern(third)
+        engine.step_notes[3] = 66  # Edited while queued, before the bar line
+        path = second.engine.path
+        assert path is not None and engine.queued_patterns == 2
+        for wake in range(6, 16 * 4):
+            scheduler.advance(wake * interval)
+            if engine.pattern_tag == 70:
+                assert engine.path is path  # Adopted, not rebuilt on the clock thread
+        print(f"Patterns per step: {[entry[1] for entry in midi.sent if entry[0] == 'on'][::4]}")
+
+        note_ons = [entry for entry in midi.sent if entry[0] == 'on']
+        steps_per_bar = BAR_PULSES // engine.x_division
+        notes = [entry[1] for entry in note_ons]
+        assert all(note < 70 for note in notes[:steps_per_bar])
+        assert notes[steps_per_bar:3 * steps_per_bar] == [70] * steps_per_bar + [80] * steps_per_bar
+        assert notes[3 * steps_per_bar:] == [80] * (len(notes) - 3 * steps_per_bar)  # Plays its 2 bars
+        # Every step kept its slot on the 16th-note grid across the switches
+        assert [entry[3] for entry in note_ons] == [20_000_000 + i * interval for i in range(len(note_ons))]
+        assert engine.pattern_changes == 2 and engine.queued_patterns == 0
+        assert (engine.columns, engine.rows) == (4, 4) and engine.x_mode == 'Pendulum'
+
+        # The outgoing patterns come back under their own tags, edits included
+        replaced = list(engine.replaced_patterns)
+        assert [outgoing.tag for outgoing in replaced] == [1, 70]
+        saved = Pattern.capture(replaced[0])
+        assert (saved.columns, saved.rows) == (4, 4) and saved.notes[3] == 66
+        assert (replaced[1].columns, replaced[1].rows) == (8, 4)
+
+    def test_pattern_slots(self):
+        """Test switching slots saves the live grid to the slot it came from"""
+        print("\n--- Testing Pattern Slots ---")
+        engine = SequencerEngine()
+        engine.pattern_tag = 0
+        scheduler = LookaheadScheduler(engine, RecordingMidi(), tempo=120)
+        with tempfile.TemporaryDirectory() as directory:
+            with PatternBank(os.path.join(directory, 'patterns.isb'), slots=8) as bank:
+                patterns = PatternSlots(bank, engine, scheduler)
+                patterns.save()
+
+                # An empty slot starts as a copy; the edit stays with the slot it was made in
+                engine.step_notes[2] = 61
+                assert not patterns.select(3)
+                assert engine.pattern_tag == 3 and bank.load(0).notes[2] == 61
+                engine.step_notes[2] = 62
+                assert patterns.select(0) and engine.step_notes[2] == 61
+                assert bank.load(3).notes[2] == 62
+
+                # While playing the switch waits for the bar line; edits until then are saved too
+                scheduler.start()
+                scheduler.advance(0)
+                engine.step_notes[2] = 63
+                assert not patterns.select(3) and engine.queued_patterns == 1
+                assert bank.load(0).notes[2] == 63
+                engine.step_notes[2] = 64
+                interval = step_interval_ns(120)
+                for wake in range(1, 17):
+                    scheduler.advance(wake * interval)
+                patterns.save_replaced()
+                assert engine.pattern_tag == 3 and engine.step_notes[2] == 62
+                assert bank.load(0).notes[2] == 64
+                print(f"Slots {bank.used_slots()}, slot 0 note {bank.load(0).notes[2]}")
 
 
 def main():
     print("Testing Isogrid Sequencer Logic")
     print("=" * 40)
-    
+
     seq = TestSequencer()
-    
+
     # Test basic functionality
     print("\n--- Testing Basic Functionality ---")
     for i in range(8):
         print(f"\nTick {i+1}:")
         active, note, vel = seq.tick()
-    
+
+    # Test Euclidean patterns
+    seq.test_euclidean_rhythm()
+    seq.test_euclidean_mask()
+
     # Test wormhole mode
     seq.test_wormhole_mode()
-    
+
     # Test probability
     seq.test_probability()
-    
+
+    # Test position CCs
+    seq.test_position_ccs()
+
     # Test driver modes
+    seq.test_driver_dispatch()
     seq.test_all_drivers()
 
     # Test Logic Advance
     seq.test_logic_advance()
 
+    # Test seeded randomness
+    seq.test_seeded_randomness()
+
+    # Test precomputed paths
+    seq.test_path_table()
+
+    # Test grid sizes
+    seq.test_grid_sizes()
+
+    # Test the diffed matrix display
+    seq.test_matrix_highlight()
+
+    # Test clock thread
+    seq.test_clock()
+
+    # Test look-ahead scheduling
+    seq.test_lookahead_scheduler()
+
+    # Test per-axis speeds
+    seq.test_axis_speeds()
+
+    # Test external MIDI clock sync
+    seq.test_external_clock_sync()
+
+    # Test MIDI clock output
+    seq.test_clock_output()
+
+    # Test per-port routing
+    seq.test_routing()
+
+    # Test pattern persistence
+    seq.test_pattern_bank()
+
+    # Test queued pattern switches
+    seq.test_pattern_chaining()
+
+    # Test pattern slots
+    seq.test_pattern_slots()
+
+    # Test tick instrumentation
+    seq.test_tick_profiler()
+
     print("\n--- Test Complete ---")
     print("All core sequencer logic components are working correctly!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,158 @@
+"""
+Tick-latency instrumentation.
+
+The sequencing path stamps time.perf_counter_ns around each stage of a tick
+and adds the duration to a fixed-bucket histogram held in preallocated
+arrays, so recording is a bisect and a few counter updates.
+Stages are:
+
+    scheduling  how late the clock thread woke up for its deadline
+    drivers     the engine's X/Y driver update (path lookup or live drivers)
+    render      rendering one step: the whole engine tick plus queueing its events
+    midi_flush  dispatching due events to the MIDI driver (port writes)
+    tick        the whole clock callback
+
+Recording is skipped entirely while the profiler is disabled.  With an
+external clock the MIDI receive thread drives the scheduler as well as the
+clock thread, so histograms are updated, reset and read under a lock.
+report() gives p50/p99/max per stage and dump() writes the histograms to a
+JSON file.
+
+Cold start is timed once per run whether or not the profiler is enabled, as
+plain durations: module imports, build() (of which MIDI setup is a part),
+and the time from the first import to the first frame on screen.
+"""
+import json
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+SCHEDULING = 0
+DRIVERS = 1
+RENDER = 2
+MIDI_FLUSH = 3
+TICK = 4
+STAGE_NAMES = ('scheduling', 'drivers', 'render', 'midi_flush', 'tick')
+
+STARTUP_IMPORTS = 'imports'
+STARTUP_BUILD = 'build'
+STARTUP_MIDI_SETUP = 'midi_setup'
+STARTUP_FIRST_FRAME = 'first_frame'
+
+# Bucket upper edges in nanoseconds, 1-2-5 steps from 1 us to 100 ms; the
+# last bucket collects everything slower
+BUCKET_EDGES_NS = array('q', [int(base * 10 ** exponent * 1000)
+                              for exponent in range(6) for base in (1, 2, 5)][:-2])
+
+
+class LatencyHistogram:
+    """Counts of durations per bucket, plus exact count, total and max"""
+
+    def __init__(self, edges=BUCKET_EDGES_NS):
+        self.edges = edges
+        self.counts = array('I', bytes(4 * (len(edges) + 1)))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, duration_ns):
+        self.counts[bisect_right(self.edges, duration_ns)] += 1
+        self.count += 1
+        self.total += duration_ns
+        if duration_ns > self.max:
+            self.max = duration_ns
+
+    def percentile(self, fraction):
+        """Upper edge (ns) of the bucket holding the given fraction of samples, capped at the max"""
+        if not self.count:
+            return 0
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(self.edges[index], self.max) if index < len(self.edges) else self.max
+        return self.max
+
+    def reset(self):
+        self.counts[:] = array('I', bytes(4 * len(self.counts)))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+
+class TickProfiler:
+    """One LatencyHistogram per stage; disabled (and free) by default"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = [LatencyHistogram() for _ in STAGE_NAMES]
+        self.startup = {}  # Startup phase -> duration in ns; kept across reset()
+        self._lock = threading.Lock()
+
+    def mark_startup(self, phase, duration_ns):
+        self.startup[phase] = duration_ns
+
+    def record(self, stage, duration_ns):
+        if self.enabled:
+            with self._lock:
+                self.histograms[stage].record(duration_ns)
+
+    def reset(self):
+        with self._lock:
+            for histogram in self.histograms:
+                histogram.reset()
+
+    def report(self):
+        """{stage: {'count', 'mean_us', 'p50_us', 'p99_us', 'max_us'}}"""
+        with self._lock:
+            return self._report()
+
+    def _report(self):
+        report = {}
+        for name, histogram in zip(STAGE_NAMES, self.histograms):
+            count = histogram.count
+            report[name] = {
+                'count': count,
+                'mean_us': histogram.total / count / 1000 if count else 0.0,
+                'p50_us': histogram.percentile(0.5) / 1000,
+                'p99_us': histogram.percentile(0.99) / 1000,
+                'max_us': histogram.max / 1000,
+            }
+        return report
+
+    def summary(self):
+        """Short multi-line text for the on-screen overlay"""
+        lines = []
+        for name, stats in self.report().items():
+            lines.append(f"{name:<10} p50 {stats['p50_us']:>7.0f}  p99 {stats['p99_us']:>7.0f}  "
+                         f"max {stats['max_us']:>7.0f} us")
+        if self.startup:
+            lines.append(self.startup_summary())
+        return '\n'.join(lines)
+
+    def startup_summary(self):
+        """One line of startup phase durations in milliseconds"""
+        return 'startup    ' + '  '.join(f"{phase} {duration_ns / 1e6:.0f}"
+                                         for phase, duration_ns in self.startup.items()) + ' ms'
+
+    def dump(self, path):
+        """Write the report and the raw bucket counts to a JSON file"""
+        with self._lock:
+            data = {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'startup_ms': {phase: duration_ns / 1e6 for phase, duration_ns in self.startup.items()},
+                'bucket_edges_ns': list(BUCKET_EDGES_NS),
+                'stages': {
+                    name: dict(stats, buckets=list(histogram.counts))
+                    for (name, stats), histogram in zip(self._report().items(), self.histograms)
+                },
+            }
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return path
+
+
+# Shared profiler for the clock callback, the scheduler and the engine
+profiler = TickProfiler()